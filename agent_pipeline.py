@@ -0,0 +1,182 @@
+# agent_pipeline.py - Pipeline multi-agents avec budget de latence par étape
+from typing import Dict, Optional
+import threading
+import time
+
+from llm_scheduler import LLMQueueRejected
+from memory_system import ContextualTranscriptProcessorWithMemory
+
+
+class Deadline:
+    """Échéance absolue calculée depuis un budget de latence"""
+
+    def __init__(self, budget_seconds: float):
+        self.budget = budget_seconds
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + budget_seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+
+class LatencyEstimator:
+    """Moyenne mobile exponentielle de la latence d'une étape (en secondes)"""
+
+    def __init__(self, initial: float, alpha: float = 0.2):
+        self.value = initial
+        self.alpha = alpha
+        self.lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self.lock:
+            self.value = (1 - self.alpha) * self.value + self.alpha * seconds
+
+
+class DeadlineAwareAgentPipeline:
+    """
+    Transcript -> contexte -> analyse -> génération, sous un budget de latence
+
+    L'échéance est propagée à chaque étape. Avant chaque appel LLM, la latence
+    estimée de l'étape est comparée au temps restant:
+    - assez de temps pour analyse + génération: pipeline multi-agents complet
+    - assez pour la génération seulement: analyse sautée (stratégie par défaut)
+    - sinon, ou si la génération échoue: repli sur ask_question_with_memory (un seul appel)
+    - citation ("qu'est-ce qu'il vient de dire ?") ou LLM délesté: réponse locale immédiate
+    """
+
+    def __init__(self, processor: ContextualTranscriptProcessorWithMemory, assistant):
+        self.processor = processor
+        self.assistant = assistant
+        self.estimates = {
+            'analysis': LatencyEstimator(2.5),
+            'generation': LatencyEstimator(6.0),
+            'single_shot': LatencyEstimator(4.0),
+        }
+
+    def run(self, video_id: str, current_time: float, question: str,
+            user_id: str = "default", budget_seconds: float = 20.0) -> Dict:
+        from multi_agents import DEFAULT_ANALYSIS
+
+        deadline = Deadline(budget_seconds)
+        stages = {}
+
+        def timed(stage, function, *args, **kwargs):
+            begin = time.monotonic()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stages[stage] = round((time.monotonic() - begin) * 1000, 1)
+
+        # 1. Transcript
+        transcript = timed('transcript', self.processor.transcript_processor.get_transcript, video_id)
+        if not transcript:
+            return self.result(deadline, stages, error="Impossible de récupérer le transcript de cette vidéo.")
+        if deadline.expired():
+            return self.result(deadline, stages, deadline_exceeded=True,
+                               error="Budget de latence épuisé pendant le chargement du transcript")
+
+        # Citation demandée ou LLM délesté: réponse locale, sans analyse ni génération
+        local = self.processor.transcript_processor.local_answer(video_id, transcript, current_time, question)
+        if local is not None:
+            if not local['degraded']:
+                self.processor.memory.add_message(video_id, question, local['response'], current_time, user_id)
+            return self.result(deadline, stages, path='degraded' if local['degraded'] else 'verbatim',
+                               response=local['response'])
+
+        # 2. Fenêtres de contexte (réutilisées depuis la question précédente de la session)
+        contextual_data = timed('context', self.processor.get_session_context,
+                                video_id, user_id, transcript, current_time)
+        contextual_data = self.processor.transcript_processor.apply_time_references(
+            contextual_data, transcript, question)
+
+        # 3. Analyse, si le budget permet analyse + génération
+        analysis = None
+        path = 'agents'
+        remaining = deadline.remaining()
+        generation_estimate = self.estimates['generation'].value
+        if contextual_data.get('time_references'):
+            # Moment cité explicitement: la stratégie est connue, pas d'appel à l'analyseur
+            analysis = self.assistant.invoke_analyzer(question, contextual_data)
+            path = 'agents_time_reference'
+        elif remaining >= self.estimates['analysis'].value + generation_estimate:
+            analysis_timeout = max(0.5, remaining - generation_estimate)
+            try:
+                analysis = timed('analysis', self.assistant.invoke_analyzer, question, contextual_data,
+                                 timeout=analysis_timeout)
+                self.estimates['analysis'].observe(stages['analysis'] / 1000)
+            except LLMQueueRejected:
+                raise  # Capacité saturée: inutile d'essayer les étapes suivantes
+            except Exception as e:
+                print(f"⏱️ Analyse abandonnée ({e}), stratégie par défaut")
+                self.observe_timeout('analysis', stages['analysis'] / 1000, analysis_timeout)
+                path = 'agents_default_analysis'
+        elif remaining >= generation_estimate:
+            print(f"⏱️ Budget serré ({remaining:.1f}s), analyse sautée")
+            path = 'agents_skipped_analysis'
+        else:
+            path = 'single_shot'
+
+        # 4. Génération multi-agents
+        if path != 'single_shot':
+            generation_timeout = max(0.5, deadline.remaining())
+            try:
+                response = timed('generation', self.assistant.invoke_responder, question,
+                                 analysis or DEFAULT_ANALYSIS, contextual_data,
+                                 timeout=generation_timeout)
+                self.estimates['generation'].observe(stages['generation'] / 1000)
+                self.processor.memory.add_message(video_id, question, response, current_time, user_id)
+                return self.result(deadline, stages, path=path, response=response, analysis=analysis)
+            except LLMQueueRejected:
+                raise
+            except Exception as e:
+                print(f"⏱️ Génération multi-agents échouée ({e}), repli sur l'appel unique")
+                self.observe_timeout('generation', stages['generation'] / 1000, generation_timeout)
+                path = 'single_shot_fallback'
+
+        # 5. Repli: appel unique avec mémoire, limité au temps restant
+        if deadline.remaining() <= 0.5:
+            return self.result(deadline, stages, path=path, deadline_exceeded=True,
+                               error="Budget de latence épuisé")
+        result = timed('single_shot', self.processor.ask_question_with_memory, video_id, current_time,
+                       question, user_id, timeout=deadline.remaining())
+        if "error" in result:
+            return self.result(deadline, stages, path=path, error=result["error"])
+        if result.get("degraded"):
+            return self.result(deadline, stages, path='degraded', response=result["response"])
+        self.estimates['single_shot'].observe(stages['single_shot'] / 1000)
+        return self.result(deadline, stages, path=path, response=result["response"])
+
+    def observe_timeout(self, stage: str, elapsed: float, timeout: float) -> None:
+        """
+        Étape interrompue par son timeout: la durée écoulée (borne basse de la
+        vraie latence) entre dans l'estimation, sinon le pipeline continue de
+        prévoir une étape qu'il n'a jamais le temps de terminer. Les échecs
+        rapides (erreur API) ne disent rien de la latence et sont ignorés.
+        """
+        if elapsed >= timeout * 0.9:
+            self.estimates[stage].observe(elapsed)
+
+    def result(self, deadline: Deadline, stages: Dict, path: Optional[str] = None,
+               response: Optional[str] = None, analysis: Optional[Dict] = None,
+               error: Optional[str] = None, deadline_exceeded: bool = False) -> Dict:
+        elapsed_ms = round(deadline.elapsed() * 1000, 1)
+        result = {
+            'path': path,
+            'stages_ms': stages,
+            'budget_ms': round(deadline.budget * 1000),
+            'elapsed_ms': elapsed_ms,
+            'deadline_met': elapsed_ms <= deadline.budget * 1000,
+            'deadline_exceeded': deadline_exceeded,  # Abandon faute de budget (HTTP 504)
+        }
+        if error:
+            result['error'] = error
+        else:
+            result['response'] = response
+            result['analysis'] = analysis
+        return result
@@ -1,17 +1,161 @@
 # app.py - Backend Flask avec système de mémoire
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
 from memory_system import ContextualTranscriptProcessorWithMemory
+from cost_ledger import get_ledger, reset_attribution, set_attribution
+from llm_scheduler import (LLMQueueRejected, get_scheduler, request_timing, reset_request_timing,
+                           start_request_timing)
+from degraded_mode import ExtractiveAnswerer
+from search_index import TranscriptSearchIndex
+from transcript_store import VIDEO_ID_PATTERN
+from transcript_uploads import (MAX_COMPRESSED_BYTES, TranscriptUploadError, decode_upload_body,
+                                parse_upload, upload_origin)
+from warmup import StartupWarmup
 import os
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 app = Flask(__name__)
 CORS(app)  # Permettre les requêtes depuis l'extension
 
-# Initialiser le processeur avec mémoire
 API_KEY = os.getenv('OPENAI_API_KEY', 'api_key')
-processor = ContextualTranscriptProcessorWithMemory(API_KEY)
+
+# Services créés par create_app() (ou à la première requête, voir get_services), pas à
+# l'import: un worker démarre vite et les imports lourds (SDK OpenAI, LangChain) sont différés
+processor = None
+search_index = None
+warmup = None
+init_lock = threading.Lock()
+
+
+def create_app() -> Flask:
+    """
+    Fabrique de l'application (idempotente)
+    
+    Serveur WSGI: gunicorn -w 4 'app:create_app()' (ou 'app:app', services créés à la première requête)
+    Le préchauffage des caches démarre en arrière-plan; /health/ready passe à 200 quand il est terminé.
+    """
+    global processor, search_index, warmup
+    with init_lock:
+        if processor is not None:
+            return app
+        
+        # Initialiser le processeur avec mémoire
+        memory_processor = ContextualTranscriptProcessorWithMemory(API_KEY)
+        # Sessions expirées nettoyées en arrière-plan (un seul timer, celui du serveur)
+        memory_processor.memory.start_cleanup_timer()
+        
+        # Index de recherche sur tous les transcripts chargés, alimenté au fil des arrivées
+        index = TranscriptSearchIndex(loader=memory_processor.transcript_processor.get_transcript)
+        memory_processor.transcript_processor.transcript_listeners.append(index.submit)
+        # Les réponses de secours cherchent dans le même index
+        memory_processor.transcript_processor.fallback = ExtractiveAnswerer(index)
+        
+        # Vidéos chaudes du snapshot, client OpenAI, puis reste du store dans l'index
+        startup = StartupWarmup.from_env(memory_processor, index)
+        # processor en dernier: get_services() ne prend pas le verrou une fois qu'il est défini
+        search_index, warmup = index, startup
+        processor = memory_processor
+        startup.start()
+    return app
+
+
+
+def get_services():
+    """(processor, search_index, warmup), créés au premier appel si create_app() n'a pas tourné"""
+    if processor is None:
+        create_app()
+    return processor, search_index, warmup
+
+
+@app.before_request
+def ensure_services():
+    """gunicorn app:app, flask run ou un test client sur `app`: les routes trouvent les services prêts"""
+    get_services()
+
+
+# Pipeline multi-agents créé au premier appel de /ask/agents (import LangChain coûteux)
+agent_pipeline = None
+agent_pipeline_lock = threading.Lock()
+
+
+def get_agent_pipeline():
+    global agent_pipeline
+    with agent_pipeline_lock:
+        if agent_pipeline is None:
+            from multi_agents import MultiAgentYouTubeAssistant
+            from agent_pipeline import DeadlineAwareAgentPipeline
+            agent_pipeline = DeadlineAwareAgentPipeline(processor, MultiAgentYouTubeAssistant(API_KEY))
+        return agent_pipeline
+
+
+@app.before_request
+def attribute_llm_calls():
+    """Attribution des appels LLM de la requête (endpoint, utilisateur, vidéo) dans le journal des coûts"""
+    is_json = request.method == 'POST' and not request.content_encoding
+    data = request.get_json(force=True, silent=True) if is_json else None
+    data = data if isinstance(data, dict) else {}
+    view_args = request.view_args or {}
+    g.ledger_token = set_attribution(
+        endpoint=request.path if request.url_rule is None else request.url_rule.rule,
+        user_id=data.get("user_id") or request.args.get("user_id"),
+        video_id=data.get("video_id") or view_args.get("video_id")
+    )
+    # Temps d'attente dans la file LLM et temps LLM, cumulés sur la requête
+    g.timing_token = start_request_timing()
+
+
+@app.teardown_request
+def reset_llm_attribution(exception=None):
+    token = g.pop('ledger_token', None)
+    if token is not None:
+        reset_attribution(token)
+    token = g.pop('timing_token', None)
+    if token is not None:
+        reset_request_timing(token)
+
+
+def queue_rejected_response(error: LLMQueueRejected):
+    """429 + Retry-After quand l'ordonnanceur LLM refuse l'appel"""
+    print(f"🚦 Appel LLM refusé ({error.reason}), réessayer dans {error.retry_after}s")
+    response = jsonify({
+        "error": "Trop de demandes en cours, réessayez dans quelques secondes",
+        "reason": error.reason,
+        "retry_after": error.retry_after,
+        "timing": dict(request_timing(), queue_wait_ms=round(error.queue_wait_ms, 1))
+    })
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 429
+
+
+def resolve_transcript_hash(video_id, transcript_hash, user_id):
+    """
+    video_id, transcript à utiliser (None: chargement habituel) et statut du transcript client pour /ask
+
+    "client" n'est annoncé que si le transcript utilisé est bien celui du hash:
+    vérifié contre le store partagé, ou encore en quarantaine et envoyé par
+    cet utilisateur. Un hash inconnu (autre nœud, store vidé) n'est pas
+    bloquant: le transcript est récupéré côté serveur et le client est invité à le renvoyer.
+    """
+    if not transcript_hash:
+        return video_id, None, {}
+    transcript_hash = str(transcript_hash).lower()
+    uploads = processor.transcript_processor.uploads
+    record = uploads.hashes.lookup(transcript_hash) if uploads is not None else None
+    if record is None or (video_id and record['video_id'] != video_id):
+        return video_id, None, {"transcript_source": "server", "transcript_upload_required": True}
+    
+    video_id = record['video_id']
+    if record['verified']:
+        return video_id, None, {"transcript_source": "client"}
+    if processor.transcript_processor.store.exists(video_id):
+        return video_id, None, {"transcript_source": "server"}
+    transcript = processor.transcript_processor.client_transcript(video_id, transcript_hash, str(user_id))
+    if transcript is not None:
+        return video_id, transcript, {"transcript_source": "client", "transcript_verified": False}
+    return video_id, None, {"transcript_source": "server", "transcript_upload_required": True}
+
 
 @app.route('/ask', methods=['POST'])
 def ask_question():
@@ -30,6 +174,9 @@ def ask_question():
         current_time = data.get("current_time", 0)
         question = data.get("question")
         user_id = data.get("user_id", "browser_session")  # ID utilisateur pour la session
+        # Transcript déjà envoyé par l'extension: seul son hash est transmis
+        video_id, transcript, transcript_info = resolve_transcript_hash(
+            video_id, data.get("transcript_hash"), user_id)
 
         print("✅ Paramètres extraits:")
         print(f"   - video_id: '{video_id}' (type: {type(video_id)})")
@@ -47,13 +194,15 @@ def ask_question():
             }), 400
 
         # Traitement avec mémoire
-        result = processor.ask_question_with_memory(video_id, current_time, question, user_id)
+        result = processor.ask_question_with_memory(video_id, current_time, question, user_id,
+                                                    transcript=transcript)
 
         # Vérifier s'il y a une erreur
         if "error" in result:
             return jsonify({
                 "error": result["error"],
-                "video_id": video_id
+                "video_id": video_id,
+                **transcript_info
             }), 500
 
         # Log de l'analyse
@@ -74,9 +223,16 @@ def ask_question():
                 "conversation_length": result.get("conversation_length", 0),
                 "session_stats": memory_stats
             },
-            "debug_info": f"Mémoire: {result.get('conversation_length', 0)} messages en historique"
+            "debug_info": f"Mémoire: {result.get('conversation_length', 0)} messages en historique",
+            "answer_mode": result.get("answer_mode", "llm"),
+            "degraded": result.get("degraded", False),
+            **({"degraded_reason": result["degraded_reason"]} if result.get("degraded") else {}),
+            "timing": request_timing(),
+            **transcript_info
         })
 
+    except LLMQueueRejected as e:
+        return queue_rejected_response(e)
     except Exception as e:
         print(f"🚨 Erreur: {e}")
         import traceback
@@ -110,9 +266,12 @@ def ask_question_simple():
             "response": result,
             "video_id": video_id,
             "timestamp": current_time,
-            "system": "simple_sans_memoire"
+            "system": "simple_sans_memoire",
+            "timing": request_timing()
         })
 
+    except LLMQueueRejected as e:
+        return queue_rejected_response(e)
     except Exception as e:
         print(f"🚨 Erreur simple: {e}")
         return jsonify({
@@ -121,6 +280,70 @@ def ask_question_simple():
         }), 500
 
 
+@app.route('/ask/agents', methods=['POST'])
+def ask_question_agents():
+    """
+    Endpoint multi-agents (analyse + génération) avec budget de latence
+    
+    latency_budget_ms est propagé comme échéance à chaque étape: l'analyse est
+    sautée ou le pipeline se replie sur l'appel unique avec mémoire si le
+    budget restant ne suffit pas.
+    """
+    try:
+        data = request.get_json(force=True, silent=True) or {}
+        video_id = data.get("video_id")
+        current_time = data.get("current_time", 0)
+        question = data.get("question")
+        user_id = data.get("user_id", "browser_session")
+        
+        if not video_id or not question:
+            return jsonify({
+                "error": "video_id et question sont requis"
+            }), 400
+        
+        try:
+            budget_ms = float(data.get("latency_budget_ms", 20000))
+        except (TypeError, ValueError):
+            return jsonify({"error": "latency_budget_ms doit être un nombre"}), 400
+        budget_ms = min(max(budget_ms, 500), 120000)
+        
+        result = get_agent_pipeline().run(video_id, current_time, question, user_id,
+                                          budget_seconds=budget_ms / 1000)
+        print(f"🤖 /ask/agents: chemin={result['path']} étapes={result['stages_ms']}")
+        
+        if "error" in result:
+            return jsonify({
+                "error": result["error"],
+                "video_id": video_id,
+                "path": result["path"],
+                "stages_ms": result["stages_ms"]
+            }), 504 if result["deadline_exceeded"] else 500
+        
+        return jsonify({
+            "response": result["response"],
+            "video_id": video_id,
+            "timestamp": current_time,
+            "system": "multi_agents",
+            "path": result["path"],
+            "degraded": result["path"] == "degraded",
+            "analysis": result["analysis"],
+            "stages_ms": result["stages_ms"],
+            "budget_ms": result["budget_ms"],
+            "elapsed_ms": result["elapsed_ms"],
+            "deadline_met": result["deadline_met"],
+            "timing": request_timing()
+        })
+    
+    except LLMQueueRejected as e:
+        return queue_rejected_response(e)
+    except Exception as e:
+        print(f"🚨 Erreur agents: {e}")
+        return jsonify({
+            "error": "Erreur interne du serveur",
+            "details": str(e)
+        }), 500
+
+
 @app.route('/conversation/clear/<video_id>', methods=['POST'])
 def clear_conversation(video_id):
     """Efface l'historique de conversation pour une vidéo"""
@@ -208,16 +431,174 @@ def get_transcript_info(video_id):
         }), 500
 
 
+@app.route('/chapters/<video_id>', methods=['GET'])
+def get_chapters(video_id):
+    """Chapitres détectés (changements de sujet) utilisés pour aligner les fenêtres de contexte"""
+    transcript = processor.transcript_processor.get_transcript(video_id)
+    if not transcript:
+        return jsonify({'error': 'Transcript non disponible'}), 404
+    chapters = processor.transcript_processor.chapter_index(transcript)
+    if chapters is None:
+        return jsonify({'video_id': video_id, 'enabled': False, 'chapters': []})
+    return jsonify({'video_id': video_id, 'enabled': True, 'chapters': chapters.to_list()})
+
+
+@app.route('/transcript/upload/<video_id>', methods=['GET', 'POST'])
+def upload_transcript(video_id):
+    """
+    Transcript envoyé par l'extension (gzip + hash SHA-256 dans X-Transcript-Hash)
+    
+    ?user_id= identifie l'utilisateur: un envoi reste en quarantaine (utilisé
+    pour lui seul) jusqu'à ce que le serveur, ou le même contenu reçu depuis
+    une autre adresse IP, le confirme (le quorum ne compte pas les user_id). GET ?hash=... indique si ce transcript est déjà connu
+    pour cet utilisateur, pour éviter l'envoi.
+    """
+    if not VIDEO_ID_PATTERN.match(video_id):
+        return jsonify({"error": "video_id invalide"}), 400
+    uploads = processor.transcript_processor.uploads
+    if uploads is None:
+        return jsonify({"error": "Envoi de transcripts désactivé (pas de store)"}), 404
+    
+    transcript_hash = (request.headers.get("X-Transcript-Hash") or request.args.get("hash") or "").lower()
+    uploader = request.args.get("user_id") or request.remote_addr or "anonymous"
+    record = uploads.hashes.lookup(transcript_hash) if transcript_hash else None
+    known = record is not None and record['video_id'] == video_id and \
+        (record['verified'] or uploader in record['uploaders'])
+    
+    if request.method == 'GET':
+        return jsonify({"video_id": video_id, "transcript_hash": transcript_hash, "known": known}), \
+            200 if known else 404
+    
+    if known:
+        return jsonify({"status": "duplicate", "video_id": video_id, "transcript_hash": transcript_hash})
+    
+    if (request.content_length or 0) > MAX_COMPRESSED_BYTES:
+        return jsonify({"error": "Corps trop volumineux"}), 413
+    
+    try:
+        raw = decode_upload_body(request.get_data(cache=False), request.headers.get("Content-Encoding"))
+        digest, segments, metadata = parse_upload(raw, video_id, transcript_hash or None)
+        status = processor.transcript_processor.store_uploaded_transcript(
+            video_id, digest, segments, uploader, upload_origin(request.remote_addr))
+    except TranscriptUploadError as e:
+        print(f"⚠️ Transcript refusé pour {video_id}: {e}")
+        return jsonify({"error": str(e), "video_id": video_id}), e.status
+    except ValueError as e:
+        return jsonify({"error": str(e), "video_id": video_id}), 400
+    except Exception as e:
+        return jsonify({
+            "error": "Erreur lors de l'enregistrement du transcript",
+            "details": str(e)
+        }), 500
+    
+    if status == 'mismatch':
+        # Le hash n'est pas enregistré: /ask utilisera le transcript du serveur
+        return jsonify({
+            "error": "Transcript différent de celui déjà connu pour cette vidéo",
+            "status": status,
+            "video_id": video_id,
+            "transcript_hash": digest
+        }), 409
+    return jsonify({
+        "status": status,
+        "video_id": video_id,
+        "transcript_hash": digest,
+        "segments_count": len(segments),
+        "language": metadata['language']
+    }), 201 if status in ('pending', 'promoted') else 200
+
+
+@app.route('/search', methods=['GET'])
+def search_transcripts():
+    """
+    Recherche dans tous les transcripts indexés: "quelle vidéo parlait de X ?"
+    
+    Paramètres: q, limit (défaut 10, max 50), per_video (défaut 3),
+    video_id (répétable, pour restreindre la recherche)
+    """
+    query = (request.args.get("q") or "").strip()
+    if not query:
+        return jsonify({"error": "Paramètre q requis"}), 400
+    try:
+        limit = min(max(int(request.args.get("limit", 10)), 1), 50)
+        per_video = min(max(int(request.args.get("per_video", 3)), 1), 50)
+    except ValueError:
+        return jsonify({"error": "limit et per_video doivent être des entiers"}), 400
+    
+    video_ids = request.args.getlist("video_id") or None
+    result = search_index.search(query, limit=limit, per_video=per_video, video_ids=video_ids)
+    result['index'] = search_index.stats()
+    return jsonify(result)
+
+
+@app.route('/ledger/usage', methods=['GET'])
+def get_ledger_usage():
+    """
+    Agrégats du journal des coûts LLM
+    
+    Paramètres: user_id, video_id, endpoint, since, until (epoch ou ISO 8601),
+    group_by (user, video, endpoint, model, component, day, hour), limit
+    """
+    ledger = get_ledger()
+    if ledger is None:
+        return jsonify({"error": "Journal des coûts désactivé (COST_LEDGER_PATH=off)"}), 404
+    try:
+        usage = ledger.usage(
+            group_by=request.args.get("group_by"),
+            user_id=request.args.get("user_id"),
+            video_id=request.args.get("video_id"),
+            endpoint=request.args.get("endpoint"),
+            since=request.args.get("since"),
+            until=request.args.get("until"),
+            limit=min(int(request.args.get("limit", 100)), 1000)
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(dict(usage, ledger=ledger.stats()))
+
+
+@app.route('/llm/scheduler', methods=['GET'])
+def get_scheduler_stats():
+    """Ordonnanceur LLM: places occupées, files par utilisateur, rejets"""
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(scheduler.stats(), enabled=True))
+
+
+@app.route('/llm/shedding', methods=['GET'])
+def get_shedding_stats():
+    """Délestage: état du disjoncteur, p90 de latence, réponses locales servies"""
+    shedder = processor.transcript_processor.shedder
+    if shedder is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(shedder.stats(), enabled=True))
+
+
+@app.route('/llm/hedging', methods=['GET'])
+def get_hedging_stats():
+    """Requêtes de couverture: taux, gain sur le p99 et surcoût (LLM_HEDGING=1)"""
+    hedger = processor.transcript_processor.hedger
+    if hedger is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(hedger.stats(), enabled=True))
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Endpoint de santé"""
+    """Endpoint de santé (liveness: 200 dès que le processus répond, voir 'ready')"""
     try:
         memory_stats = processor.get_conversation_stats()
+        transcript_cache = processor.transcript_processor.cache
         
         return jsonify({
             'status': 'ok',
             'service': 'YouTube AI Assistant API avec Mémoire',
             'memory': memory_stats,
+            'transcript_cache': transcript_cache.stats() if transcript_cache else {'mode': 'local'},
+            'search_index': search_index.stats(),
+            'ready': warmup.ready,
+            'warmup': warmup.snapshot_status(),
             'features': {
                 'conversation_memory': 'enabled',
                 'session_timeout': '30 minutes',
@@ -231,17 +612,35 @@ def health_check():
         }), 500
 
 
+
+@app.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness: 503 tant que le préchauffage n'est pas terminé (le routeur n'envoie pas de trafic)"""
+    ready = warmup is not None and warmup.ready
+    return jsonify({
+        'ready': ready,
+        'warmup': warmup.snapshot_status() if warmup is not None else None
+    }), 200 if ready else 503
+
+
 if __name__ == '__main__':
     # Vérifier la clé API
     print("🚀 Démarrage du serveur backend avec système de MÉMOIRE...")
     print("📝 Endpoints disponibles:")
     print("   POST /ask - Poser une question (AVEC mémoire)")
     print("   POST /ask/simple - Poser une question (SANS mémoire)")
+    print("   POST /ask/agents - Multi-agents avec budget de latence")
     print("   POST /conversation/clear/<video_id> - Effacer l'historique")
     print("   GET /conversation/history/<video_id> - Voir l'historique")
     print("   GET /memory/stats - Statistiques mémoire")
     print("   GET /transcript/<video_id> - Info sur le transcript")
+    print("   POST /transcript/upload/<video_id> - Transcript envoyé par l'extension (gzip + hash)")
+    print("   GET /search?q=... - Recherche dans tous les transcripts")
+    print("   GET /ledger/usage - Tokens et coûts LLM (par utilisateur, vidéo, endpoint)")
+    print("   GET /llm/scheduler - Files d'attente LLM par utilisateur")
+    print("   GET /llm/hedging - Requêtes de couverture (gain p99 / surcoût)")
     print("   GET /health - Status du serveur")
+    print("   GET /health/ready - Disponibilité (préchauffage terminé)")
     print()
     print("🧠 Fonctionnalités mémoire:")
     print("   ✅ Se souvient des conversations précédentes par vidéo")
@@ -249,4 +648,5 @@ if __name__ == '__main__':
     print("   ✅ Maximum 10 messages par session")
     print("   ✅ Nettoyage automatique des sessions expirées")
     
-    app.run(debug=True, port=5000, use_reloader=False)
\ No newline at end of file
+    # FLASK_PORT permet de lancer plusieurs nœuds locaux derrière router.py
+    create_app().run(debug=True, port=int(os.getenv('FLASK_PORT', '5000')), use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,320 @@
+# batch_qa.py - Questions/réponses en lot, sans passer par l'API HTTP
+"""
+Passe un jeu de cas (video_id, current_time, question) dans le pipeline:
+jeux de non-régression, FAQ pré-générées par vidéo, évaluation d'un changement de prompt.
+
+Usage:
+    python batch_qa.py cases.jsonl --output results.jsonl
+    python batch_qa.py cases.jsonl --output results.jsonl --mode agents --concurrency 8 --report report.json
+
+Chaque ligne du fichier d'entrée est un objet JSON:
+    {"id": "faq-1", "video_id": "abc123", "current_time": 754, "question": "..."}
+"id" est facultatif (sinon dérivé du mode et du contenu du cas), "user_id" aussi:
+en mode memory, les cas d'un même user_id sur une même vidéo forment une
+conversation et sont exécutés dans l'ordre du fichier.
+
+Les cas sont groupés par vidéo (un chargement de transcript par vidéo, celui de
+la vidéo suivante lancé pendant que les cas de la vidéo courante tournent) et les
+réponses écrites au fil de l'eau dans --output, une ligne JSON par cas.
+Les cas déjà en "ok" dans ce fichier sont sautés: relancer la commande après
+une interruption reprend là où elle s'était arrêtée (les cas en échec ou
+dégradés sont rejoués, la dernière ligne d'un id fait foi).
+
+Les tokens sont lus dans le journal des coûts (COST_LEDGER_PATH) et attribués
+à l'endpoint "batch_qa".
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from contextual_transcript_processor import ContextualTranscriptProcessor
+from cost_ledger import attribution, get_ledger, metered
+from stats_utils import percentile
+from transcript_sources import DirectoryTranscriptSource, source_from_env
+
+MODES = ('simple', 'memory', 'agents')
+TOKEN_FIELDS = ('calls', 'prompt_tokens', 'completion_tokens', 'cached_tokens', 'cost_usd')
+
+
+def case_id(case: Dict, mode: str) -> str:
+    """Identifiant stable d'un cas (celui du fichier, sinon empreinte de son contenu)"""
+    if case.get('id') not in (None, ""):
+        return str(case['id'])
+    key = "|".join([mode, case['video_id'], f"{float(case['current_time']):.3f}",
+                    case['question'], case.get('user_id') or ""])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def read_cases(path: str, mode: str) -> List[Dict]:
+    """Lit les cas JSONL (lignes vides ignorées, ids dédupliqués: le premier l'emporte)"""
+    cases = []
+    seen = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                case = json.loads(line)
+                case = {
+                    'id': case.get('id'),
+                    'video_id': str(case['video_id']),
+                    'current_time': float(case['current_time']),
+                    'question': str(case['question']),
+                    'user_id': case.get('user_id'),
+                }
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                raise ValueError(f"{path}:{line_number}: cas invalide ({e})") from None
+            case['id'] = case_id(case, mode)
+            if case['id'] not in seen:
+                seen.add(case['id'])
+                cases.append(case)
+    return cases
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Ids dont la dernière ligne dans le fichier de résultats est en "ok" (point de reprise)"""
+    statuses = {}
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+                statuses[result['id']] = result['status']
+            except (ValueError, KeyError, TypeError):
+                continue  # Ligne tronquée par une interruption: le cas sera rejoué
+    return {case_id for case_id, status in statuses.items() if status == 'ok'}
+
+
+class BatchQARunner:
+    """Exécute les cas vidéo par vidéo, au plus `concurrency` en vol, résultats écrits au fil de l'eau"""
+
+    def __init__(self, processor: ContextualTranscriptProcessor, mode: str = 'simple',
+                 concurrency: int = 4, memory_processor=None, assistant=None):
+        self.processor = processor
+        self.mode = mode
+        self.concurrency = max(1, concurrency)
+        self.memory_processor = memory_processor
+        self.assistant = assistant
+        self.slots = threading.BoundedSemaphore(self.concurrency)
+        self.write_lock = threading.Lock()
+        self.results: List[Dict] = []
+
+    def group_by_video(self, cases: List[Dict]) -> "OrderedDict[str, List[List[Dict]]]":
+        """
+        Unités de travail par vidéo (ordre de première apparition)
+
+        Une unité est un cas isolé, ou en mode memory la conversation d'un user_id
+        explicite sur la vidéo (ses cas s'enchaînent dans l'ordre du fichier).
+        """
+        videos: "OrderedDict[str, OrderedDict]" = OrderedDict()
+        for case in cases:
+            units = videos.setdefault(case['video_id'], OrderedDict())
+            if self.mode == 'memory' and case['user_id']:
+                units.setdefault(('user', case['user_id']), []).append(case)
+            else:
+                units[('case', case['id'])] = [case]
+        return OrderedDict((video_id, list(units.values())) for video_id, units in videos.items())
+
+    def run(self, cases: List[Dict], output_path: str, resume: bool = True) -> Dict:
+        started = time.perf_counter()
+        done = completed_ids(output_path) if resume else set()
+        pending = [case for case in cases if case['id'] not in done]
+        skipped = len(cases) - len(pending)
+        groups = self.group_by_video(pending)
+        print(f"🧪 {len(pending)} cas à traiter sur {len(groups)} vidéos "
+              f"({skipped} déjà faits, mode {self.mode}, concurrence {self.concurrency})")
+
+        video_ids = list(groups)
+        with open(output_path, "a" if resume else "w", encoding="utf-8") as output, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as executor, \
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-prefetch") as prefetcher:
+            # Un seul chargement par vidéo. Le chargement de la vidéo suivante part sur son
+            # propre thread avant la soumission des cas de la vidéo courante: soumettre bloque
+            # sur self.slots jusqu'aux `concurrency` dernières unités, le transcript suivant
+            # est donc prêt (ou presque) quand on y arrive.
+            next_load = prefetcher.submit(self.load, video_ids[0]) if video_ids else None
+            for index, (video_id, units) in enumerate(groups.items()):
+                transcript, load_seconds = next_load.result()
+                if index + 1 < len(video_ids):
+                    next_load = prefetcher.submit(self.load, video_ids[index + 1])
+                if not transcript:
+                    for unit in units:
+                        for case in unit:
+                            self.write(output, self.result(case, 'failed', error='transcript indisponible'))
+                    continue
+                print(f"🎬 {video_id}: {len(transcript)} segments chargés en "
+                      f"{load_seconds:.2f}s, {sum(map(len, units))} cas")
+                for unit in units:
+                    self.slots.acquire()
+                    future = executor.submit(self.run_unit, output, transcript, unit)
+                    future.add_done_callback(lambda _: self.slots.release())
+
+        return self.summary(time.perf_counter() - started, skipped)
+
+    def load(self, video_id: str):
+        """(transcript ou None, durée du chargement en secondes), exécuté sur le thread de préchargement"""
+        started = time.perf_counter()
+        try:
+            transcript = self.processor.get_transcript(video_id)
+        except Exception as e:
+            print(f"❌ {video_id}: {e}")
+            transcript = None
+        return transcript, time.perf_counter() - started
+
+    def run_unit(self, output, transcript, unit: List[Dict]) -> None:
+        for case in unit:
+            self.write(output, self.run_case(transcript, case))
+
+    def run_case(self, transcript, case: Dict) -> Dict:
+        user_id = case['user_id'] or f"batch-{case['id']}"
+        started = time.perf_counter()
+        with attribution(endpoint='batch_qa', user_id=user_id, video_id=case['video_id']), \
+                metered() as tokens:
+            try:
+                answer = self.answer(transcript, case, user_id)
+            except Exception as e:
+                answer = {'error': f"{type(e).__name__}: {e}"}
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        if 'error' in answer:
+            return self.result(case, 'failed', latency_ms=latency_ms, tokens=tokens, error=answer['error'])
+        return self.result(case, 'degraded' if answer.get('degraded') else 'ok',
+                           latency_ms=latency_ms, tokens=tokens, **answer)
+
+    def answer(self, transcript, case: Dict, user_id: str) -> Dict:
+        video_id, current_time, question = case['video_id'], case['current_time'], case['question']
+        if self.mode == 'memory':
+            result = self.memory_processor.ask_question_with_memory(
+                video_id, current_time, question, user_id=user_id, transcript=transcript)
+            return {key: result[key] for key in ('response', 'answer_mode', 'degraded', 'degraded_reason', 'error')
+                    if key in result}
+        if self.mode == 'agents':
+            contextual_data = self.processor.create_contextual_windows(transcript, current_time, question=question)
+            result = self.assistant.process_question(question, contextual_data)
+            return {'response': result['response'], 'answer_mode': 'agents', 'degraded': False,
+                    'analysis': result['analysis']}
+        return self.processor.answer_question(video_id, transcript, current_time, question)
+
+    def result(self, case: Dict, status: str, latency_ms: Optional[float] = None,
+               tokens: Optional[Dict] = None, **fields) -> Dict:
+        result = {
+            'id': case['id'],
+            'video_id': case['video_id'],
+            'current_time': case['current_time'],
+            'question': case['question'],
+            'mode': self.mode,
+            'status': status,
+        }
+        result.update(fields)
+        result['latency_ms'] = latency_ms
+        result['tokens'] = dict(tokens, cost_usd=round(tokens['cost_usd'], 6)) if tokens else None
+        return result
+
+    def write(self, output, result: Dict) -> None:
+        with self.write_lock:
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()  # Point de reprise: une ligne écrite est un cas acquis
+            self.results.append(result)
+            if result['status'] == 'failed':
+                print(f"❌ {result['id']}: {result.get('error')}")
+            else:
+                icon = "✅" if result['status'] == 'ok' else "🪫"
+                print(f"{icon} {result['id']} ({result['video_id']} @ {result['current_time']:.0f}s): "
+                      f"{result.get('answer_mode')}, {result['latency_ms']:.0f} ms")
+
+    def summary(self, elapsed: float, skipped: int) -> Dict:
+        totals = {field: 0 for field in TOKEN_FIELDS}
+        for result in self.results:
+            for field in TOKEN_FIELDS:
+                totals[field] += (result['tokens'] or {}).get(field, 0)
+        totals['cost_usd'] = round(totals['cost_usd'], 6)
+        latencies = [r['latency_ms'] for r in self.results if r['latency_ms'] is not None]
+        processed = len(self.results)
+        total_tokens = totals['prompt_tokens'] + totals['completion_tokens']
+        return {
+            'mode': self.mode,
+            'processed': processed,
+            'ok': sum(1 for r in self.results if r['status'] == 'ok'),
+            'degraded': sum(1 for r in self.results if r['status'] == 'degraded'),
+            'failed': sum(1 for r in self.results if r['status'] == 'failed'),
+            'skipped': skipped,
+            'elapsed_seconds': round(elapsed, 3),
+            'cases_per_second': round(processed / elapsed, 3) if elapsed else 0,
+            'tokens': totals,
+            'tokens_per_second': round(total_tokens / elapsed, 1) if elapsed else 0,
+            'latency_p50_ms': round(percentile(latencies, 50) or 0.0, 1),
+            'latency_p95_ms': round(percentile(latencies, 95) or 0.0, 1),
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Questions/réponses en lot sur des transcripts (JSONL)")
+    parser.add_argument("cases_file", help="Fichier JSONL de cas (video_id, current_time, question)")
+    parser.add_argument("--output", required=True, help="Fichier JSONL des résultats (point de reprise)")
+    parser.add_argument("--mode", choices=MODES, default="simple",
+                        help="simple: ask_question, memory: avec historique, agents: multi-agents")
+    parser.add_argument("--concurrency", type=int, default=4, help="Cas traités simultanément (appels LLM en vol)")
+    parser.add_argument("--source-dir", help="Lire les transcripts depuis ce répertoire (<video_id>.json) au lieu de YouTube")
+    parser.add_argument("--model", default=os.getenv("BATCH_QA_MODEL", "gpt-4"), help="Modèle du mode agents")
+    parser.add_argument("--no-resume", action="store_true", help="Réécrire --output au lieu de reprendre")
+    parser.add_argument("--report", help="Écrire le résumé JSON dans ce fichier")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    # La concurrence est bornée ici: pas de file équitable ni de délestage (réponses dégradées) en lot
+    os.environ.setdefault("LLM_SCHEDULER", "off")
+    os.environ.setdefault("LLM_SHEDDING", "off")
+    if get_ledger() is None:
+        print("⚠️ Journal des coûts désactivé (COST_LEDGER_PATH): les totaux de tokens resteront à 0")
+
+    try:
+        cases = read_cases(args.cases_file, args.mode)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 2
+
+    api_key = os.getenv('OPENAI_API_KEY', 'api_key')
+    source = DirectoryTranscriptSource(args.source_dir) if args.source_dir else source_from_env()
+    processor = ContextualTranscriptProcessor(api_key, source=source)
+    memory_processor = assistant = None
+    if args.mode == 'memory':
+        from memory_system import ContextualTranscriptProcessorWithMemory
+        memory_processor = ContextualTranscriptProcessorWithMemory(api_key)
+        memory_processor.transcript_processor = processor
+    elif args.mode == 'agents':
+        from multi_agents import MultiAgentYouTubeAssistant
+        assistant = MultiAgentYouTubeAssistant(api_key, model_name=args.model)
+
+    runner = BatchQARunner(processor, mode=args.mode, concurrency=args.concurrency,
+                           memory_processor=memory_processor, assistant=assistant)
+    summary = runner.run(cases, args.output, resume=not args.no_resume)
+
+    ledger = get_ledger()
+    if ledger is not None:
+        ledger.flush()
+
+    tokens = summary['tokens']
+    print(f"\n📊 {summary['ok']} ok, {summary['degraded']} dégradés, {summary['failed']} en échec, "
+          f"{summary['skipped']} sautés en {summary['elapsed_seconds']}s ({summary['cases_per_second']} cas/s, "
+          f"p50 {summary['latency_p50_ms']} ms, p95 {summary['latency_p95_ms']} ms)")
+    print(f"🪙 {tokens['calls']} appels LLM, {tokens['prompt_tokens']} tokens prompt "
+          f"({tokens['cached_tokens']} en cache), {tokens['completion_tokens']} tokens réponse, "
+          f"{summary['tokens_per_second']} tokens/s, ~{tokens['cost_usd']:.4f} USD")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+
+    return 1 if summary['failed'] or summary['degraded'] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
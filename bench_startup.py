@@ -0,0 +1,159 @@
+# bench_startup.py - Benchmark du démarrage d'un worker (import, fabrique, readiness)
+"""
+Mesure, dans des processus neufs:
+- le temps d'import de app.py
+- le temps de create_app()
+- le temps jusqu'à /health/ready d'un serveur réel (--ready)
+et liste les modules les plus coûteux à importer (python -X importtime).
+
+Usage:
+    python bench_startup.py --runs 5 --output startup.json
+    python bench_startup.py --baseline startup_baseline.json --max-regression 0.2   # code de sortie 1 si régression
+    python bench_startup.py --save-baseline startup_baseline.json
+"""
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+MEASURE_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'create_app_ms': (created - imported) * 1000}))
+"""
+
+
+def bench_env(workdir: str) -> Dict[str, str]:
+    """Environnement isolé: store vide et journal des coûts temporaires"""
+    return dict(os.environ,
+                OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "sk-bench"),
+                TRANSCRIPT_STORE_DIR=os.path.join(workdir, "store"),
+                COST_LEDGER_PATH=os.path.join(workdir, "llm_ledger.sqlite3"),
+                PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.getenv("PYTHONPATH")])))
+
+
+def measure_import(env: Dict[str, str]) -> Dict[str, float]:
+    output = subprocess.run([sys.executable, "-c", MEASURE_SCRIPT], env=env, cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def heaviest_imports(env: Dict[str, str], top: int = 15) -> List[Dict]:
+    """Modules de premier niveau les plus coûteux (temps cumulé, -X importtime)"""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], env=env, cwd=ROOT,
+                            capture_output=True, text=True, check=True).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            depth = (len(name) - len(name.lstrip())) // 2
+            modules.append({'module': name.strip(), 'cumulative_ms': int(cumulative) / 1000, 'depth': depth})
+        except ValueError:
+            continue  # ligne d'en-tête
+    top_level = [m for m in modules if m['depth'] <= 2]
+    top_level.sort(key=lambda m: m['cumulative_ms'], reverse=True)
+    return [{'module': m['module'], 'cumulative_ms': round(m['cumulative_ms'], 1)} for m in top_level[:top]]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_ready(env: Dict[str, str], timeout: float = 120.0) -> Dict[str, Optional[float]]:
+    """Démarre app.py et mesure le temps jusqu'à /health (liveness) puis /health/ready"""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "app.py")], cwd=ROOT,
+                               env=dict(env, FLASK_PORT=str(port)),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result = {'live_ms': None, 'ready_ms': None}
+    try:
+        deadline = started + timeout
+        while time.perf_counter() < deadline and result['ready_ms'] is None:
+            for key, path in (('live_ms', '/health'), ('ready_ms', '/health/ready')):
+                if result[key] is not None:
+                    continue
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1):
+                        result[key] = round((time.perf_counter() - started) * 1000, 1)
+                except (urllib.error.URLError, OSError):
+                    break
+            time.sleep(0.02)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return result
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {'median': round(statistics.median(samples), 1), 'min': round(min(samples), 1),
+            'max': round(max(samples), 1)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark du démarrage des workers")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ready", action="store_true", help="Mesurer aussi le temps jusqu'à /health/ready")
+    parser.add_argument("--output", help="Écrire le rapport JSON dans ce fichier")
+    parser.add_argument("--baseline", help="Rapport de référence à comparer")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Régression relative tolérée sur la médiane d'import (0.2 = +20%%)")
+    parser.add_argument("--save-baseline", help="Enregistrer ce rapport comme référence")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="ytai_startup_")
+    env = bench_env(workdir)
+    measure_import(env)  # Premier passage: compilation des .pyc, non compté
+
+    runs = [measure_import(env) for _ in range(args.runs)]
+    report = {
+        'python': sys.version.split()[0],
+        'runs': args.runs,
+        'import_ms': summarize([r['import_ms'] for r in runs]),
+        'create_app_ms': summarize([r['create_app_ms'] for r in runs]),
+        'heaviest_imports': heaviest_imports(env),
+    }
+    if args.ready:
+        ready_runs = [measure_ready(env) for _ in range(max(1, args.runs // 2))]
+        report['ready_ms'] = summarize([r['ready_ms'] for r in ready_runs if r['ready_ms'] is not None] or [0])
+        report['live_ms'] = summarize([r['live_ms'] for r in ready_runs if r['live_ms'] is not None] or [0])
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        reference = baseline['import_ms']['median']
+        change = (report['import_ms']['median'] - reference) / reference if reference else 0.0
+        report['baseline'] = {'import_ms_median': reference, 'change': round(change, 3)}
+        if change > args.max_regression:
+            print(f"❌ Import de app.py {change:+.0%} par rapport à la référence ({reference} ms)")
+            status = 1
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(output)
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
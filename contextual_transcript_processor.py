@@ -1,119 +1,309 @@
-from youtube_transcript_api import YouTubeTranscriptApi
-from typing import List, Dict, Tuple
-from openai import OpenAI
+from typing import Callable, List, Dict, Optional, Sequence, Tuple
+from bisect import bisect_left, bisect_right
+from collections import deque
+import threading
+import time
+from transcript_store import TranscriptStore, encode_transcript
+from transcript_uploads import ClientTranscripts
+from transcript_sources import TranscriptSource, normalize_transcript, source_from_env
+from shared_transcript_cache import SharedTranscriptCache, cache_from_env
+from cost_ledger import get_ledger
+from hedging import HedgedChatCompleter, hedger_from_env
+from llm_scheduler import FairShareScheduler, LLMQueueRejected, get_scheduler
+from degraded_mode import ExtractiveAnswerer, LoadShedder, get_load_shedder, verbatim_span
+from time_references import parse_time_references
+
+SECTION_SECONDS = 300  # Tranches de 5 minutes du contexte étendu
+MAX_REFERENCED_SECONDS = 600  # Durée maximale des passages cités ajoutés au contexte prioritaire
+CHAPTER_MIN_LOOKBACK = 45  # Secondes gardées avant le moment actuel même si le chapitre vient de commencer
+CHAPTER_MAX_LOOKBACK = 300  # Recul maximal jusqu'au début du chapitre en cours
+
+
+class ExtendedContextView(Sequence):
+    """Vue paresseuse du contexte étendu: tous les segments sauf la fenêtre [lo, hi)"""
+
+    def __init__(self, processor, transcript: Sequence[Dict], lo: int, hi: int):
+        self.processor = processor
+        self.transcript = transcript
+        self.lo = lo
+        self.hi = hi
+
+    def __len__(self) -> int:
+        return len(self.transcript) - (self.hi - self.lo)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("index de segment hors limites")
+        if index >= self.lo:
+            index += self.hi - self.lo
+        return self.processor.build_context_segment(self.transcript[index])
+
+
+class ContextWindowState:
+    """
+    Fenêtres de contexte construites pour une session (vidéo, utilisateur)
+
+    Conservé entre deux questions pour ne mettre à jour que les segments qui
+    entrent ou sortent de la fenêtre quand la tête de lecture avance.
+    """
+
+    def __init__(self, transcript: Sequence[Dict], starts: Sequence[float], params: Tuple,
+                 lo: int, hi: int, priority_context: deque, priority_lines: deque,
+                 section_bounds: Dict[int, Tuple[int, int]], section_lines: Dict[int, str],
+                 contextual_data: Dict, mode: str):
+        self.transcript = transcript
+        self.starts = starts
+        self.params = params
+        self.lo = lo
+        self.hi = hi
+        self.priority_context = priority_context
+        self.priority_lines = priority_lines
+        self.section_bounds = section_bounds
+        self.section_lines = section_lines
+        self.contextual_data = contextual_data
+        self.mode = mode  # 'full', 'incremental' ou 'reused'
+
 
 class ContextualTranscriptProcessor:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, store: Optional[TranscriptStore] = None,
+                 source: Optional[TranscriptSource] = None, use_store: bool = True,
+                 cache: Optional[SharedTranscriptCache] = None,
+                 hedger: Optional[HedgedChatCompleter] = None,
+                 scheduler: Optional[FairShareScheduler] = None,
+                 shedder: Optional[LoadShedder] = None):
         self.api_key = api_key
-        self.client = OpenAI(api_key=api_key)
+        # Client OpenAI créé au premier appel (l'import du SDK ralentit le démarrage des workers)
+        self._client = None
+        self._client_lock = threading.Lock()
+        # Source des transcripts (YouTube par défaut, répertoire local pour les tests)
+        self.source = source if source is not None else source_from_env()
+        # Stockage binaire persistant (mmap) des transcripts déjà récupérés
+        if not use_store:
+            self.store = None
+        else:
+            self.store = store if store is not None else TranscriptStore.from_env()
+        # Transcripts envoyés par l'extension, en quarantaine à côté du store
+        self.uploads = ClientTranscripts.for_store(self.store) if self.store is not None else None
+        # Cache en mémoire partagée entre workers (TRANSCRIPT_CACHE_MODE=shared)
+        self.cache = cache if cache is not None else cache_from_env()
+        # Requêtes de couverture contre les complétions lentes (LLM_HEDGING=1)
+        self.hedger = hedger if hedger is not None else hedger_from_env()
+        # Partage équitable de la capacité LLM entre utilisateurs (LLM_SCHEDULER=off pour désactiver)
+        self.scheduler = scheduler if scheduler is not None else get_scheduler()
+        # Délestage: réponses locales quand le LLM est en panne ou saturé (LLM_SHEDDING=off pour désactiver)
+        self.shedder = shedder if shedder is not None else get_load_shedder()
+        # Réponses sans LLM (citations, passages BM25); l'app lui donne l'index de /search
+        self.fallback = ExtractiveAnswerer()
+        # Résumé extractif (TextRank) des sections du contexte étendu, créé au premier usage (NumPy)
+        self._summarizer = None
+        self._summarizer_loaded = False
+        # Chapitres détectés (TextTiling) pour aligner les fenêtres, créé au premier usage (NumPy)
+        self._segmenter = None
+        self._segmenter_loaded = False
+        # Appelés avec (video_id, transcript) à chaque transcript obtenu (ex: index de recherche)
+        self.transcript_listeners: List[Callable[[str, Sequence[Dict]], None]] = []
         
-    def get_transcript(self, video_id: str) -> List[Dict]:
-        """Récupère le transcript d'une vidéo YouTube"""
-        try:
-            print(f"🔄 Tentative de récupération du transcript pour: {video_id}")
-            
-            # Utiliser votre méthode fetch qui fonctionnait hier
-            api = YouTubeTranscriptApi()
-            transcript_obj = api.fetch(video_id)
-            segments_data = []
-            
-            print(f"Debug: Type d'objet transcript: {type(transcript_obj)}")
-            print(f"Debug: Attributs disponibles: {[attr for attr in dir(transcript_obj) if not attr.startswith('_')]}")
-            
-            # Essayer différentes façons d'accéder aux données
-            if hasattr(transcript_obj, 'segments'):
-                print("✅ Utilisation de transcript_obj.segments")
-                for segment in transcript_obj.segments:
-                    segments_data.append({
-                        'start': getattr(segment, 'start', 0),
-                        'duration': getattr(segment, 'duration', 0),
-                        'text': getattr(segment, 'text', '')
-                    })
-            elif hasattr(transcript_obj, 'entries'):
-                print("✅ Utilisation de transcript_obj.entries")
-                for entry in transcript_obj.entries:
-                    segments_data.append({
-                        'start': getattr(entry, 'start', 0),
-                        'duration': getattr(entry, 'duration', 0),
-                        'text': getattr(entry, 'text', '')
-                    })
-            elif hasattr(transcript_obj, 'snippets'):
-                print("✅ Utilisation de transcript_obj.snippets")
-                for snippet in transcript_obj.snippets:
-                    segments_data.append({
-                        'start': getattr(snippet, 'start', 0),
-                        'duration': getattr(snippet, 'duration', 0),
-                        'text': getattr(snippet, 'text', '')
-                    })
-            elif hasattr(transcript_obj, 'transcript'):
-                print("✅ Utilisation de transcript_obj.transcript")
-                transcript_data = transcript_obj.transcript
-                if isinstance(transcript_data, list):
-                    for item in transcript_data:
-                        if isinstance(item, dict):
-                            segments_data.append({
-                                'start': item.get('start', 0),
-                                'duration': item.get('duration', 0),
-                                'text': item.get('text', '')
-                            })
-                        else:
-                            segments_data.append({
-                                'start': getattr(item, 'start', 0),
-                                'duration': getattr(item, 'duration', 0),
-                                'text': getattr(item, 'text', '')
-                            })
-            # Peut-être que l'objet lui-même est itérable
-            elif hasattr(transcript_obj, '__iter__'):
-                print("✅ L'objet transcript est itérable")
-                try:
-                    for item in transcript_obj:
-                        if isinstance(item, dict):
-                            segments_data.append({
-                                'start': item.get('start', 0),
-                                'duration': item.get('duration', 0),
-                                'text': item.get('text', '')
-                            })
-                        else:
-                            segments_data.append({
-                                'start': getattr(item, 'start', 0),
-                                'duration': getattr(item, 'duration', 0),
-                                'text': getattr(item, 'text', '')
-                            })
-                except Exception as iter_error:
-                    print(f"❌ Erreur lors de l'itération: {iter_error}")
-            else:
-                print("❌ Structure de transcript non reconnue")
-                # Dernière tentative: essayer d'accéder directement aux propriétés
-                try:
-                    # Peut-être que les données sont directement dans l'objet
-                    if hasattr(transcript_obj, 'start') and hasattr(transcript_obj, 'text'):
-                        segments_data.append({
-                            'start': transcript_obj.start,
-                            'duration': getattr(transcript_obj, 'duration', 0),
-                            'text': transcript_obj.text
-                        })
-                    else:
-                        print(f"❌ Impossible de décoder la structure: {type(transcript_obj)}")
-                        return []
-                except Exception as direct_error:
-                    print(f"❌ Erreur accès direct: {direct_error}")
-                    return []
-            
-            print(f"✅ Transcript récupéré: {len(segments_data)} segments")
-            if segments_data:
-                print(f"📝 Premier segment: {segments_data[0]}")
-                print(f"📝 Dernier segment: {segments_data[-1]}")
-            
-            return segments_data
-            
-        except Exception as e:
-            print(f"❌ Erreur récupération transcript: {e}")
-            import traceback
-            traceback.print_exc()
-            return []
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=self.api_key)
+        return self._client
+
+    @client.setter
+    def client(self, client) -> None:
+        self._client = client
+
+    @property
+    def summarizer(self):
+        """TextRankSummarizer, ou None (SUMMARY_MODE=prefix ou NumPy absent: début de chaque section)"""
+        if not self._summarizer_loaded:
+            with self._client_lock:
+                if not self._summarizer_loaded:
+                    try:
+                        from extractive_summary import summarizer_from_env
+                        self._summarizer = summarizer_from_env()
+                    except ImportError as e:
+                        print(f"⚠️ Résumé extractif indisponible ({e}), résumé par début de section")
+                    self._summarizer_loaded = True
+        return self._summarizer
+
+    @summarizer.setter
+    def summarizer(self, summarizer) -> None:
+        self._summarizer = summarizer
+        self._summarizer_loaded = True
+
+    @property
+    def segmenter(self):
+        """TextTilingSegmenter, ou None (CONTEXT_CHAPTERS=off ou NumPy absent: bornes fixes)"""
+        if not self._segmenter_loaded:
+            with self._client_lock:
+                if not self._segmenter_loaded:
+                    try:
+                        from topic_segmentation import segmenter_from_env
+                        self._segmenter = segmenter_from_env()
+                    except ImportError as e:
+                        print(f"⚠️ Découpage en chapitres indisponible ({e}), fenêtres fixes")
+                    self._segmenter_loaded = True
+        return self._segmenter
+
+    @segmenter.setter
+    def segmenter(self, segmenter) -> None:
+        self._segmenter = segmenter
+        self._segmenter_loaded = True
+
+    def chapter_index(self, transcript: Sequence[Dict]):
+        """ChapterIndex du transcript (calculé une fois par vidéo), ou None sans découpage"""
+        segmenter = self.segmenter
+        if segmenter is None or not transcript:
+            return None
+        return segmenter.index(transcript)
+
+    def get_transcript(self, video_id: str) -> Sequence[Dict]:
+        """
+        Récupère le transcript d'une vidéo YouTube
+
+        Ordre de recherche: cache partagé entre workers, store persistant,
+        puis téléchargement depuis la source.
+        """
+        if self.cache is not None:
+            cached = self.cache.get(video_id)
+            if cached is not None:
+                self.notify_transcript(video_id, cached)
+                return cached
+
+        transcript = self.load_transcript(video_id)
+
+        if transcript and self.cache is not None:
+            try:
+                shared = self.cache.put(video_id, transcript)
+                if shared is not None:
+                    transcript = shared
+            except OSError as e:
+                print(f"⚠️ Cache partagé indisponible: {e}")
+
+        if transcript:
+            self.notify_transcript(video_id, transcript)
+        return transcript
+
+    def notify_transcript(self, video_id: str, transcript: Sequence[Dict]) -> None:
+        for listener in self.transcript_listeners:
+            try:
+                listener(video_id, transcript)
+            except Exception as e:
+                print(f"⚠️ Listener de transcript en erreur: {e}")
+
+    def load_transcript(self, video_id: str) -> Sequence[Dict]:
+        """Transcript depuis le store persistant, sinon téléchargé puis sauvegardé"""
+        if self.store is not None:
+            try:
+                stored = self.store.load(video_id)
+            except ValueError as e:
+                print(f"❌ {e}")
+                return []
+            if stored is not None:
+                if self.uploads is not None and self.uploads.refetch_due(video_id):
+                    return self.refresh_client_transcript(video_id, stored)
+                return stored
+
+        segments_data = self.fetch_transcript(video_id)
+
+        if segments_data and self.store is not None:
+            try:
+                segments_data = normalize_transcript(segments_data)
+                self.store.save(video_id, segments_data)
+                stored = self.store.load(video_id)
+                if stored is not None:
+                    return stored
+            except Exception as e:
+                print(f"⚠️ Impossible de sauvegarder le transcript: {e}")
+
+        return segments_data
+
+    def store_uploaded_transcript(self, video_id: str, transcript_hash: str,
+                                  segments: List[Dict], uploader: str, origin: str) -> str:
+        """
+        Enregistre un transcript envoyé par le client (voir ClientTranscripts)
+
+        Un envoi ne modifie jamais directement le contexte des autres
+        utilisateurs. Statuts retournés:
+            'verified': identique au transcript déjà stocké
+            'mismatch': différent du transcript stocké, ignoré
+            'pending':  en quarantaine, utilisé pour ses seuls uploaders
+            'promoted': quorum atteint et transcript introuvable côté serveur, stocké
+
+        `uploader` donne l'accès à la copie en quarantaine; seules les origines
+        distinctes (upload_origin) comptent pour le quorum. Le quorum atteint
+        déclenche une récupération serveur synchrone, une fois par vidéo.
+        """
+        if self.uploads is None:
+            raise RuntimeError("Aucun store configuré pour les transcripts envoyés")
+        segments_data = normalize_transcript(segments)
+        if not segments_data:
+            raise ValueError("Transcript vide après normalisation")
+
+        stored = self.store.load(video_id)
+        if stored is not None:
+            return self._check_upload(video_id, transcript_hash, segments_data, stored)
+
+        record = self.uploads.add(transcript_hash, video_id, segments_data, uploader, origin)
+        if len(record['origins']) < self.uploads.quorum:
+            print(f"📥 Transcript client en quarantaine pour {video_id} "
+                  f"({len(record['origins'])}/{self.uploads.quorum} origines)")
+            return 'pending'
+
+        # Quorum atteint: la récupération côté serveur reste prioritaire. Elle tourne dans
+        # la requête d'envoi, mais une seule fois par vidéo: ensuite le store a une copie
+        fetched = self.load_transcript(video_id)
+        if fetched:
+            return self._check_upload(video_id, transcript_hash, segments_data, fetched)
+
+        self.store.save(video_id, segments_data)
+        self.uploads.mark_promoted(video_id, transcript_hash)
+        print(f"📥 Transcript client promu pour {video_id} ({len(segments_data)} segments)")
+        self.notify_transcript(video_id, segments_data)
+        return 'promoted'
+
+    def _check_upload(self, video_id: str, transcript_hash: str, segments_data: List[Dict],
+                      stored: Sequence[Dict]) -> str:
+        if encode_transcript(segments_data) != encode_transcript(list(stored)):
+            print(f"⚠️ Transcript client différent de celui stocké pour {video_id}, ignoré")
+            return 'mismatch'
+        self.uploads.hashes.mark_verified(transcript_hash, video_id)
+        return 'verified'
+
+    def client_transcript(self, video_id: str, transcript_hash: str, uploader: str) -> Optional[Sequence[Dict]]:
+        """Transcript en quarantaine pour un utilisateur qui l'a envoyé (None sinon)"""
+        if self.uploads is None:
+            return None
+        return self.uploads.load(transcript_hash, video_id, uploader)
+
+    def refresh_client_transcript(self, video_id: str, stored: Sequence[Dict]) -> Sequence[Dict]:
+        """Copie promue depuis un envoi client: remplacée dès que le serveur récupère le transcript"""
+        fetched = normalize_transcript(self.fetch_transcript(video_id))
+        if not fetched:
+            self.uploads.postpone_refetch(video_id)
+            return stored
+        same_content = encode_transcript(fetched) == encode_transcript(list(stored))
+        if not same_content:
+            self.store.save(video_id, fetched)
+            print(f"🔁 Transcript client remplacé par la version serveur pour {video_id}")
+        self.uploads.replace_promoted(video_id, same_content)
+        return self.store.load(video_id) or fetched
+
+    def fetch_transcript(self, video_id: str) -> List[Dict]:
+        """Télécharge le transcript depuis la source configurée"""
+        return self.source.fetch(video_id)
     
-    def create_contextual_windows(self, transcript: List[Dict], current_time: float, 
-                                priority_window: int = 120, extended_window: int = 30) -> Dict:
+    def create_contextual_windows(self, transcript: Sequence[Dict], current_time: float, 
+                                priority_window: int = 120, extended_window: int = 30,
+                                question: Optional[str] = None) -> Dict:
         """
         Crée les fenêtres de contexte prioritaire et étendu
         
@@ -122,42 +312,304 @@ class ContextualTranscriptProcessor:
             current_time: Moment actuel dans la vidéo (en secondes)
             priority_window: Taille de la fenêtre prioritaire en secondes (avant)
             extended_window: Taille de la fenêtre prioritaire en secondes (après)
+            question: Question posée; les moments qu'elle cite rejoignent le contexte prioritaire
         """
-        priority_context = []
-        extended_context = []
+        # Recherche dichotomique des bornes (segments triés par début), alignées sur le chapitre en cours
+        starts = self.segment_starts(transcript)
+        lo, hi, chapter = self.priority_range(transcript, starts, current_time, priority_window, extended_window)
+
+        # Contexte prioritaire (fenêtre autour du moment actuel)
+        priority_context = [self.build_context_segment(s) for s in transcript[lo:hi]]
         
-        start_priority = max(0, current_time - priority_window)
-        end_priority = current_time + extended_window
+        # Contexte étendu (tout le reste)
+        extended_context = [self.build_context_segment(s) for s in transcript[:lo]]
+        extended_context += [self.build_context_segment(s) for s in transcript[hi:]]
         
-        for segment in transcript:
-            segment_start = segment['start']
-            segment_end = segment['start'] + segment['duration']
-            
-            # Contexte prioritaire (fenêtre autour du moment actuel)
-            if start_priority <= segment_start <= end_priority:
-                priority_context.append({
-                    'start': segment_start,
-                    'end': segment_end,
-                    'text': segment['text'],
-                    'timestamp_formatted': self.format_timestamp(segment_start)
-                })
-            
-            # Contexte étendu (tout le reste)
-            else:
-                extended_context.append({
-                    'start': segment_start,
-                    'end': segment_end,
-                    'text': segment['text'],
-                    'timestamp_formatted': self.format_timestamp(segment_start)
-                })
+        # Résumé par chapitre (ou tranche de 5 minutes), hors fenêtre prioritaire
+        section_bounds = self.section_bounds(transcript, starts)
+        section_lines = {}
+        for key, (begin, end) in section_bounds.items():
+            self._update_section_line(section_lines, key, transcript, begin, end, lo, hi)
         
-        return {
+        contextual_data = {
             'current_time': current_time,
             'current_time_formatted': self.format_timestamp(current_time),
             'priority_context': priority_context,
             'extended_context': extended_context,
             'priority_window_text': self.concatenate_segments(priority_context),
-            'extended_context_summary': self.summarize_extended_context(extended_context)
+            'extended_context_summary': "".join(
+                section_lines[key] for key in section_bounds if key in section_lines
+            ),
+            'chapter': chapter.to_dict() if chapter is not None else None
+        }
+        if question:
+            return self.apply_time_references(contextual_data, transcript, question,
+                                              priority_window, extended_window)
+        return contextual_data
+    
+    def apply_time_references(self, contextual_data: Dict, transcript: Sequence[Dict], question: str,
+                              priority_window: int = 120, extended_window: int = 30) -> Dict:
+        """
+        Ajoute au contexte prioritaire les passages cités par la question ("à 12:30", "il y a 5 minutes")
+        
+        Les segments sont lus par recherche dichotomique sur les débuts de segments.
+        Quand un passage est ajouté, le résumé du reste de la vidéo n'est pas envoyé:
+        la question porte sur un moment précis. Retourne un nouveau dict
+        (contextual_data peut être partagé).
+        """
+        if not transcript or not question:
+            return contextual_data
+        last = transcript[len(transcript) - 1]
+        duration = last['start'] + last.get('duration', 0)
+        current_time = contextual_data['current_time']
+        references = parse_time_references(question, current_time, duration)
+        if not references:
+            return contextual_data
+        
+        # Segments déjà présents dans la fenêtre autour du moment actuel
+        lo, hi, _ = self.priority_range(transcript, self.segment_starts(transcript), current_time,
+                                        priority_window, extended_window)
+        covered = set(range(lo, hi))
+        blocks = []
+        referenced_segments = []
+        remaining = MAX_REFERENCED_SECONDS
+        for reference in references:
+            begin, end = self.find_segment_range(transcript, reference.start, reference.end)
+            if begin > 0:
+                previous = transcript[begin - 1]
+                if previous['start'] + previous.get('duration', 0) > reference.start:
+                    begin -= 1  # Segment en cours au début du passage
+            indices = [i for i in range(begin, end) if i not in covered]
+            if not indices or remaining <= 0:
+                continue
+            segments = []
+            for i in indices:
+                segment = self.build_context_segment(transcript[i])
+                segments.append(segment)
+                covered.add(i)
+                remaining -= segment['end'] - segment['start']
+                if remaining <= 0:
+                    break
+            referenced_segments.extend(segments)
+            blocks.append(f"--- Passage cité \"{reference.text}\" "
+                          f"[{self.format_timestamp(reference.start)}-{self.format_timestamp(reference.end)}] ---\n"
+                          + self.concatenate_segments(segments))
+        
+        data = dict(contextual_data)
+        data['time_references'] = [reference.to_dict() for reference in references]
+        if blocks:
+            data['priority_context'] = referenced_segments + list(contextual_data['priority_context'])
+            data['priority_window_text'] = (
+                "\n".join(blocks)
+                + f"\n--- Autour du moment actuel [{contextual_data['current_time_formatted']}] ---\n"
+                + contextual_data['priority_window_text']
+            )
+            data['extended_context_summary'] = ("(Non inclus: la question porte sur un moment précis de la vidéo, "
+                                                "fourni dans le contexte prioritaire.)")
+        return data
+    
+    def build_window_state(self, transcript: Sequence[Dict], current_time: float,
+                           previous: Optional[ContextWindowState] = None,
+                           priority_window: int = 120, extended_window: int = 30) -> ContextWindowState:
+        """
+        Version incrémentale de create_contextual_windows
+
+        Si `previous` porte sur le même transcript et que la nouvelle fenêtre
+        chevauche l'ancienne, seuls les segments sortants/entrants sont traités
+        et seules les sections (chapitres ou tranches de 5 minutes) touchées
+        par la fenêtre sont résumées à nouveau. Un saut (seek) sans
+        chevauchement reconstruit tout.
+        """
+        params = (priority_window, extended_window)
+        reusable = (previous is not None and previous.transcript is transcript
+                    and previous.params == params)
+        starts = previous.starts if reusable else self.segment_starts(transcript)
+
+        lo, hi, chapter = self.priority_range(transcript, starts, current_time, priority_window, extended_window)
+
+        if not reusable or hi <= previous.lo or lo >= previous.hi:
+            return self._build_full_window_state(transcript, starts, params, lo, hi, current_time, chapter)
+
+        if (lo, hi) == (previous.lo, previous.hi):
+            # Mêmes segments: seul le moment actuel change
+            contextual_data = dict(previous.contextual_data)
+            contextual_data['current_time'] = current_time
+            contextual_data['current_time_formatted'] = self.format_timestamp(current_time)
+            contextual_data['chapter'] = chapter.to_dict() if chapter is not None else None
+            return ContextWindowState(transcript, starts, params, lo, hi,
+                                      previous.priority_context, previous.priority_lines,
+                                      previous.section_bounds, previous.section_lines,
+                                      contextual_data, 'reused')
+
+        # Copie des fenêtres précédentes (jamais modifiées: partagées entre requêtes)
+        priority_context = deque(previous.priority_context)
+        priority_lines = deque(previous.priority_lines)
+
+        # Segments qui sortent de la fenêtre
+        for _ in range(max(0, lo - previous.lo)):
+            priority_context.popleft()
+            priority_lines.popleft()
+        for _ in range(max(0, previous.hi - hi)):
+            priority_context.pop()
+            priority_lines.pop()
+
+        # Segments qui entrent dans la fenêtre
+        for i in range(min(previous.lo, hi) - 1, lo - 1, -1):
+            segment = self.build_context_segment(transcript[i])
+            priority_context.appendleft(segment)
+            priority_lines.appendleft(self.format_context_line(segment))
+        for i in range(max(previous.hi, lo), hi):
+            segment = self.build_context_segment(transcript[i])
+            priority_context.append(segment)
+            priority_lines.append(self.format_context_line(segment))
+
+        # Seules les sections touchées par l'ancienne ou la nouvelle fenêtre changent
+        section_lines = dict(previous.section_lines)
+        for key, (begin, end) in previous.section_bounds.items():
+            if (begin < previous.hi and end > previous.lo) or (begin < hi and end > lo):
+                self._update_section_line(section_lines, key, transcript, begin, end, lo, hi)
+
+        return ContextWindowState(
+            transcript, starts, params, lo, hi, priority_context, priority_lines,
+            previous.section_bounds, section_lines,
+            self._window_contextual_data(transcript, current_time, lo, hi, priority_context,
+                                         priority_lines, previous.section_bounds, section_lines, chapter),
+            'incremental'
+        )
+    
+    def _build_full_window_state(self, transcript: Sequence[Dict], starts: Sequence[float],
+                                 params: Tuple, lo: int, hi: int, current_time: float,
+                                 chapter=None) -> ContextWindowState:
+        priority_context = deque(self.build_context_segment(s) for s in transcript[lo:hi])
+        priority_lines = deque(self.format_context_line(s) for s in priority_context)
+
+        section_bounds = self.section_bounds(transcript, starts)
+        section_lines = {}
+        for key, (begin, end) in section_bounds.items():
+            self._update_section_line(section_lines, key, transcript, begin, end, lo, hi)
+
+        return ContextWindowState(
+            transcript, starts, params, lo, hi, priority_context, priority_lines,
+            section_bounds, section_lines,
+            self._window_contextual_data(transcript, current_time, lo, hi, priority_context,
+                                         priority_lines, section_bounds, section_lines, chapter),
+            'full'
+        )
+    
+    def _update_section_line(self, section_lines: Dict[int, str], key: int, transcript: Sequence[Dict],
+                             begin: int, end: int, lo: int, hi: int) -> None:
+        """Résume la section [begin, end) privée des segments de la fenêtre [lo, hi)"""
+        summarizer = self.summarizer
+        if summarizer is not None:
+            # Phrases classées une fois par vidéo; seule la sélection dépend de la fenêtre
+            ranked = summarizer.cached(transcript)
+            if ranked is None:
+                ranked = summarizer.rank_and_cache(
+                    transcript, self.section_bounds(transcript, self.segment_starts(transcript)))
+            text = summarizer.select(ranked[key], lo, hi) if key in ranked else ""
+            if text:
+                section_lines[key] = f"{self.section_header(transcript, key)} {text}\n\n"
+            else:
+                section_lines.pop(key, None)
+            return
+
+        if hi <= begin or lo >= end:
+            segments = transcript[begin:end]
+        else:
+            segments = transcript[begin:lo] + transcript[hi:end]
+        if not segments:
+            section_lines.pop(key, None)
+        elif self.chapter_index(transcript) is None:
+            section_lines[key] = self.summarize_section(key * SECTION_SECONDS // 60, segments)
+        else:
+            section_text = " ".join(s['text'] for s in segments)
+            section_lines[key] = f"{self.section_header(transcript, key)} {section_text[:200]}...\n\n"
+    
+    def _window_contextual_data(self, transcript: Sequence[Dict], current_time: float, lo: int, hi: int,
+                                priority_context: deque, priority_lines: deque,
+                                section_bounds: Dict[int, Tuple[int, int]],
+                                section_lines: Dict[int, str], chapter=None) -> Dict:
+        return {
+            'current_time': current_time,
+            'current_time_formatted': self.format_timestamp(current_time),
+            'priority_context': list(priority_context),
+            'extended_context': ExtendedContextView(self, transcript, lo, hi),
+            'priority_window_text': "".join(priority_lines),
+            'extended_context_summary': "".join(
+                section_lines[key] for key in section_bounds if key in section_lines
+            ),
+            'chapter': chapter.to_dict() if chapter is not None else None
+        }
+
+    def segment_starts(self, transcript: Sequence[Dict]) -> Sequence[float]:
+        """Tableau trié des débuts de segments (vue directe pour un transcript mmap)"""
+        if hasattr(transcript, 'starts'):
+            return transcript.starts
+        return [segment['start'] for segment in transcript]
+    
+    def compute_section_bounds(self, starts: Sequence[float]) -> Dict[int, Tuple[int, int]]:
+        """Indices [début, fin) de chaque tranche de 5 minutes non vide, dans l'ordre"""
+        bounds = {}
+        i = 0
+        while i < len(starts):
+            key = int(starts[i] // SECTION_SECONDS)
+            end = bisect_left(starts, (key + 1) * SECTION_SECONDS, i)
+            bounds[key] = (i, end)
+            i = end
+        return bounds
+    
+    def section_bounds(self, transcript: Sequence[Dict], starts: Sequence[float]) -> Dict[int, Tuple[int, int]]:
+        """Sections du contexte de référence: chapitres détectés, sinon tranches de 5 minutes"""
+        chapters = self.chapter_index(transcript)
+        if chapters is None:
+            return self.compute_section_bounds(starts)
+        return chapters.section_bounds()
+
+    def section_header(self, transcript: Sequence[Dict], key: int) -> str:
+        """En-tête d'une section: [05:00-10:00] (tranche) ou [03:12-07:45] Chapitre 2"""
+        chapters = self.chapter_index(transcript)
+        if chapters is None:
+            minutes = key * SECTION_SECONDS // 60
+            return f"[{minutes:02d}:00-{minutes + 5:02d}:00]"
+        chapter = chapters.chapters[key]
+        return (f"[{self.format_timestamp(chapter.start_time)}-{self.format_timestamp(chapter.end_time)}] "
+                f"Chapitre {key + 1}")
+
+    def priority_range(self, transcript: Sequence[Dict], starts: Sequence[float], current_time: float,
+                       priority_window: int = 120, extended_window: int = 30) -> Tuple:
+        """
+        Indices [lo, hi) de la fenêtre prioritaire et chapitre en cours (ou None)
+
+        Avec les chapitres, la fenêtre remonte au début du chapitre en cours
+        (au plus CHAPTER_MAX_LOOKBACK secondes, au moins CHAPTER_MIN_LOOKBACK)
+        et s'arrête à sa fin au lieu de déborder sur le chapitre suivant.
+        """
+        start_priority = max(0, current_time - priority_window)
+        end_priority = current_time + extended_window
+        chapters = self.chapter_index(transcript)
+        chapter = chapters.chapter_at(current_time) if chapters is not None else None
+        if chapter is not None:
+            lookback = current_time - chapter.start_time
+            lookback = min(max(lookback, min(priority_window, CHAPTER_MIN_LOOKBACK)),
+                           max(priority_window, CHAPTER_MAX_LOOKBACK))
+            start_priority = max(0, current_time - lookback)
+            end_priority = min(end_priority, max(chapter.end_time, current_time))
+        return bisect_left(starts, start_priority), bisect_right(starts, end_priority), chapter
+
+    def find_segment_range(self, transcript: Sequence[Dict], start: float, end: float) -> Tuple[int, int]:
+        """Indices [lo, hi) des segments dont le début est dans [start, end]"""
+        if hasattr(transcript, 'bisect_left'):
+            return transcript.bisect_left(start), transcript.bisect_right(end)
+        starts = [segment['start'] for segment in transcript]
+        return bisect_left(starts, start), bisect_right(starts, end)
+    
+    def build_context_segment(self, segment: Dict) -> Dict:
+        """Segment enrichi (fin et timestamp formaté) pour les fenêtres de contexte"""
+        return {
+            'start': segment['start'],
+            'end': segment['start'] + segment['duration'],
+            'text': segment['text'],
+            'timestamp_formatted': self.format_timestamp(segment['start'])
         }
     
     def format_timestamp(self, seconds: float) -> str:
@@ -170,9 +622,12 @@ class ContextualTranscriptProcessor:
         """Concatène les segments avec leurs timestamps"""
         result = ""
         for segment in segments:
-            result += f"[{segment['timestamp_formatted']}] {segment['text']}\n"
+            result += self.format_context_line(segment)
         return result
     
+    def format_context_line(self, segment: Dict) -> str:
+        return f"[{segment['timestamp_formatted']}] {segment['text']}\n"
+    
     def summarize_extended_context(self, extended_context: List[Dict]) -> str:
         """
         Crée un résumé structuré du contexte étendu
@@ -191,12 +646,16 @@ class ContextualTranscriptProcessor:
         
         summary = ""
         for section_start, segments in sorted(sections.items()):
-            section_end = section_start + 5
-            section_text = " ".join([s['text'] for s in segments])
-            summary += f"[{section_start:02d}:00-{section_end:02d}:00] {section_text[:200]}...\n\n"
+            summary += self.summarize_section(section_start, segments)
         
         return summary
     
+    def summarize_section(self, section_start: int, segments: Sequence[Dict]) -> str:
+        """Ligne de résumé d'une section de 5 minutes (section_start en minutes)"""
+        section_end = section_start + 5
+        section_text = " ".join([s['text'] for s in segments])
+        return f"[{section_start:02d}:00-{section_end:02d}:00] {section_text[:200]}...\n\n"
+    
     def build_ai_prompt(self, contextual_data: Dict, user_question: str) -> str:
         """Construit le prompt structuré pour l'IA"""
         
@@ -232,26 +691,127 @@ Réponse:"""
         transcript = self.get_transcript(video_id)
         if not transcript:
             return "Impossible de récupérer le transcript de cette vidéo."
-        
-        # 2. Créer les fenêtres contextuelles
-        contextual_data = self.create_contextual_windows(transcript, current_time)
-        
-        # 3. Construire le prompt
+        return self.answer_question(video_id, transcript, current_time, question)['response']
+
+    def answer_question(self, video_id: str, transcript: Sequence[Dict], current_time: float,
+                        question: str) -> Dict:
+        """
+        Réponse sur un transcript déjà chargé (ask_question, batch_qa.py)
+
+        Returns:
+            {'response', 'answer_mode': llm|verbatim|extractive, 'degraded', ['degraded_reason']}
+        """
+        # 2. Citation demandée ou LLM délesté: réponse locale immédiate
+        local = self.local_answer(video_id, transcript, current_time, question)
+        if local is not None:
+            return local
+
+        # 3. Créer les fenêtres contextuelles (avec les moments cités dans la question)
+        contextual_data = self.create_contextual_windows(transcript, current_time, question=question)
+
+        # 4. Construire le prompt
         prompt = self.build_ai_prompt(contextual_data, question)
-        
-        # 4. Interroger l'IA
+
+        # 5. Interroger l'IA
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
+            response = self.complete_chat(
+                [
                     {"role": "system", "content": "Tu es un assistant IA spécialisé dans l'explication de contenu vidéo."},
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=500,
-                temperature=0.7
+                component="ask_simple"
             )
-            
-            return response.choices[0].message.content
-            
+            return {'response': response, 'answer_mode': 'llm', 'degraded': False}
+
+        except LLMQueueRejected:
+            raise
         except Exception as e:
-            return f"Erreur lors de la génération de la réponse: {e}"
\ No newline at end of file
+            print(f"❌ Erreur LLM ({e}), réponse de secours")
+            return self.fallback_answer(video_id, transcript, current_time, question, 'upstream_error')
+
+    def local_answer(self, video_id: str, transcript: Sequence[Dict], current_time: float,
+                     question: str) -> Optional[Dict]:
+        """
+        Réponse sans LLM, ou None si la question doit aller au LLM
+
+        - "qu'est-ce qu'il vient de dire ?", "what did they say at 12:30?": texte exact du passage
+        - LLM délesté (disjoncteur ouvert, file trop longue, SLO de latence dépassé): passages extraits
+        """
+        last = transcript[len(transcript) - 1]
+        span = verbatim_span(question, current_time, last['start'] + last.get('duration', 0))
+        if span is not None:
+            text = self.fallback.verbatim(transcript, span)
+            if text:
+                return {'response': text, 'answer_mode': 'verbatim', 'degraded': False}
+        reason = self.shedder.shed_reason() if self.shedder is not None else None
+        if reason is not None:
+            return self.fallback_answer(video_id, transcript, current_time, question, reason)
+        return None
+
+    def fallback_answer(self, video_id: str, transcript: Sequence[Dict], current_time: float,
+                        question: str, reason: str) -> Dict:
+        """Réponse de secours extractive, signalée comme telle (degraded=True)"""
+        print(f"🪫 Mode dégradé ({reason}): réponse extractive pour {video_id}")
+        return {'response': self.fallback.answer(video_id, transcript, current_time, question),
+                'answer_mode': 'extractive', 'degraded': True, 'degraded_reason': reason}
+    
+    def complete_chat(self, messages: List[Dict], max_tokens: int, temperature: float = 0.7,
+                      timeout: Optional[float] = None, model: str = "gpt-4",
+                      component: str = "chat") -> str:
+        """
+        Appel chat completions unique, enregistré dans le journal des coûts
+        
+        Les erreurs sont propagées (et journalisées avec leur latence).
+        L'appel attend d'abord sa place auprès de l'ordonnanceur (LLMQueueRejected si
+        la capacité est saturée trop longtemps); le timeout couvre attente + appel.
+        """
+        if self.scheduler is None:
+            return self.monitored_completion(messages, max_tokens, temperature, timeout, model, component)
+        with self.scheduler.slot(max_wait=timeout) as timing:
+            if timeout:
+                timeout = max(0.5, timeout - timing['queue_wait_ms'] / 1000)
+            return self.monitored_completion(messages, max_tokens, temperature, timeout, model, component)
+
+    def monitored_completion(self, messages: List[Dict], max_tokens: int, temperature: float,
+                             timeout: Optional[float], model: str, component: str) -> str:
+        """send_chat_completion, avec latence et erreurs transmises au délesteur"""
+        if self.shedder is None:
+            return self.send_chat_completion(messages, max_tokens, temperature, timeout, model, component)
+        started = time.perf_counter()
+        try:
+            content = self.send_chat_completion(messages, max_tokens, temperature, timeout, model, component)
+        except Exception:
+            self.shedder.record_failure()
+            raise
+        self.shedder.record_success(time.perf_counter() - started)
+        return content
+    
+    def send_chat_completion(self, messages: List[Dict], max_tokens: int, temperature: float,
+                             timeout: Optional[float], model: str, component: str) -> str:
+        """
+        Appel au fournisseur, hors ordonnanceur
+        
+        Avec LLM_HEDGING=1, l'appel passe en streaming et peut être doublé (voir hedging.py).
+        """
+        if self.hedger is not None:
+            return self.hedger.complete(self.client, messages, max_tokens, temperature,
+                                        timeout, model, component)
+        ledger = get_ledger()
+        started = time.perf_counter()
+        try:
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                **({'timeout': timeout} if timeout else {})
+            )
+        except Exception:
+            if ledger is not None:
+                ledger.record_failure(model, (time.perf_counter() - started) * 1000, component)
+            raise
+        
+        if ledger is not None:
+            ledger.record_openai(response, model, (time.perf_counter() - started) * 1000, component)
+        return response.choices[0].message.content
\ No newline at end of file
@@ -0,0 +1,325 @@
+# cost_ledger.py - Journal des appels LLM (tokens, latence, coût) par utilisateur, vidéo et endpoint
+"""
+Chaque appel LLM est ajouté à un tampon en mémoire (O(1), sans I/O sur le
+chemin de la requête); un thread d'arrière-plan vide le tampon dans SQLite
+par lots (une transaction toutes les `flush_interval` secondes).
+
+L'attribution (endpoint, user_id, video_id) est portée par une ContextVar:
+app.py la fixe au début de chaque requête, les processeurs n'ont rien à propager.
+De même, metered() cumule les tokens des appels d'un bloc (un cas de batch_qa.py).
+
+Variables d'environnement:
+    COST_LEDGER_PATH            fichier SQLite (défaut: llm_ledger.sqlite3, "off" pour désactiver)
+    COST_LEDGER_FLUSH_INTERVAL  secondes entre deux écritures (défaut: 2)
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional, Union
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+# Prix en USD par million de tokens: (prompt, prompt en cache, completion)
+PRICING = {
+    'gpt-4o-mini': (0.15, 0.075, 0.60),
+    'gpt-4o': (2.50, 1.25, 10.00),
+    'gpt-4-turbo': (10.00, 10.00, 30.00),
+    'gpt-4-32k': (60.00, 60.00, 120.00),
+    'gpt-4': (30.00, 30.00, 60.00),
+    'gpt-3.5-turbo': (0.50, 0.50, 1.50),
+}
+
+GROUP_BY_COLUMNS = {
+    'user': 'user_id',
+    'video': 'video_id',
+    'endpoint': 'endpoint',
+    'model': 'model',
+    'component': 'component',
+    'day': "strftime('%Y-%m-%d', ts, 'unixepoch')",
+    'hour': "strftime('%Y-%m-%d %H:00', ts, 'unixepoch')",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_calls (
+    ts REAL NOT NULL,
+    endpoint TEXT,
+    user_id TEXT,
+    video_id TEXT,
+    component TEXT,
+    model TEXT,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    latency_ms REAL,
+    cost_usd REAL NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'ok'
+);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_ts ON llm_calls (ts);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_user ON llm_calls (user_id, ts);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_video ON llm_calls (video_id, ts);
+"""
+
+COLUMNS = ('ts', 'endpoint', 'user_id', 'video_id', 'component', 'model', 'prompt_tokens',
+           'completion_tokens', 'cached_tokens', 'latency_ms', 'cost_usd', 'status')
+
+_attribution: ContextVar[Dict] = ContextVar('llm_attribution', default={})
+_meter: ContextVar[Optional[Dict]] = ContextVar('llm_usage_meter', default=None)
+_meter_lock = threading.Lock()
+
+
+def set_attribution(**fields) -> object:
+    """Fixe l'attribution des appels LLM du contexte courant (retourne le token pour reset)"""
+    return _attribution.set({key: value for key, value in fields.items() if value is not None})
+
+
+def reset_attribution(token) -> None:
+    _attribution.reset(token)
+
+
+def current_attribution() -> Dict:
+    return _attribution.get()
+
+
+@contextmanager
+def attribution(**fields):
+    """Complète l'attribution courante le temps d'un bloc (ex: batch, CLI)"""
+    token = _attribution.set(dict(_attribution.get(), **{k: v for k, v in fields.items() if v is not None}))
+    try:
+        yield
+    finally:
+        _attribution.reset(token)
+
+
+@contextmanager
+def metered():
+    """Cumule appels, tokens et coût des appels LLM enregistrés pendant le bloc"""
+    totals = {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0, 'cost_usd': 0.0}
+    token = _meter.set(totals)
+    try:
+        yield totals
+    finally:
+        _meter.reset(token)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0,
+                  pricing: Optional[Dict] = None) -> float:
+    """Coût estimé en USD (le préfixe de modèle le plus long l'emporte: gpt-4o-2024-08-06 -> gpt-4o)"""
+    pricing = pricing or PRICING
+    model = (model or '').lower()
+    matches = [name for name in pricing if model.startswith(name)]
+    if not matches:
+        return 0.0
+    prompt_price, cached_price, completion_price = pricing[max(matches, key=len)]
+    cached_tokens = min(cached_tokens, prompt_tokens)
+    return ((prompt_tokens - cached_tokens) * prompt_price
+            + cached_tokens * cached_price
+            + completion_tokens * completion_price) / 1_000_000
+
+
+def _parse_time(value: Union[str, float, int, None]) -> Optional[float]:
+    """Epoch en secondes ou date ISO 8601"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
+
+
+class CostLedger:
+    """Journal append-only des appels LLM, écrit par lots dans SQLite"""
+
+    def __init__(self, path: str, flush_interval: float = 2.0, max_pending: int = 100_000,
+                 pricing: Optional[Dict] = None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pricing = pricing or PRICING
+        self.pending: List[tuple] = []
+        self.pending_lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.dropped = 0
+        self.written = 0
+        self._stop = threading.Event()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True, name="cost-ledger")
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        # WAL: les lectures d'agrégats ne bloquent pas les écritures des autres workers
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def record(self, model: str, prompt_tokens: int = 0, completion_tokens: int = 0,
+               cached_tokens: int = 0, latency_ms: Optional[float] = None,
+               component: Optional[str] = None, status: str = 'ok', **fields) -> float:
+        """Ajoute un appel au tampon et retourne son coût estimé"""
+        context = dict(current_attribution(), **fields)
+        cost = estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens, self.pricing)
+        row = (time.time(), context.get('endpoint'), context.get('user_id'), context.get('video_id'),
+               component, model, int(prompt_tokens or 0), int(completion_tokens or 0),
+               int(cached_tokens or 0), None if latency_ms is None else round(latency_ms, 1),
+               cost, status)
+        meter = _meter.get()
+        if meter is not None:
+            with _meter_lock:  # Appels doublés (hedging): enregistrés depuis d'autres threads
+                meter['calls'] += 1
+                meter['prompt_tokens'] += row[6]
+                meter['completion_tokens'] += row[7]
+                meter['cached_tokens'] += row[8]
+                meter['cost_usd'] += cost
+        with self.pending_lock:
+            if len(self.pending) >= self.max_pending:
+                self.dropped += 1  # SQLite indisponible trop longtemps: on ne bloque pas les requêtes
+            else:
+                self.pending.append(row)
+        return cost
+
+    def record_openai(self, response, model: str, latency_ms: float, component: str) -> float:
+        """Enregistre un appel du client OpenAI (response.usage)"""
+        usage = getattr(response, 'usage', None)
+        details = getattr(usage, 'prompt_tokens_details', None)
+        return self.record(
+            getattr(response, 'model', None) or model,
+            prompt_tokens=getattr(usage, 'prompt_tokens', 0) or 0,
+            completion_tokens=getattr(usage, 'completion_tokens', 0) or 0,
+            cached_tokens=getattr(details, 'cached_tokens', 0) or 0,
+            latency_ms=latency_ms,
+            component=component,
+        )
+
+    def record_langchain(self, message, model: str, latency_ms: float, component: str) -> float:
+        """Enregistre un appel LangChain (response_metadata['token_usage'] du message)"""
+        metadata = getattr(message, 'response_metadata', None) or {}
+        usage = metadata.get('token_usage') or {}
+        details = usage.get('prompt_tokens_details') or {}
+        return self.record(
+            metadata.get('model_name') or model,
+            prompt_tokens=usage.get('prompt_tokens', 0) or 0,
+            completion_tokens=usage.get('completion_tokens', 0) or 0,
+            cached_tokens=details.get('cached_tokens', 0) or 0,
+            latency_ms=latency_ms,
+            component=component,
+        )
+
+    def record_failure(self, model: str, latency_ms: float, component: str, status: str = 'error') -> None:
+        self.record(model, latency_ms=latency_ms, component=component, status=status)
+
+    def flush(self) -> int:
+        """Écrit le tampon dans SQLite (une transaction) et retourne le nombre de lignes"""
+        with self.write_lock:
+            with self.pending_lock:
+                rows, self.pending = self.pending, []
+            if not rows:
+                return 0
+            try:
+                connection = self._connect()
+                try:
+                    with connection:
+                        connection.executemany(
+                            f"INSERT INTO llm_calls ({', '.join(COLUMNS)}) "
+                            f"VALUES ({', '.join('?' for _ in COLUMNS)})", rows)
+                finally:
+                    connection.close()
+            except sqlite3.Error as e:
+                print(f"⚠️ Journal des coûts non écrit ({e}), nouvel essai au prochain flush")
+                with self.pending_lock:
+                    self.pending[:0] = rows[:max(0, self.max_pending - len(self.pending))]
+                return 0
+            self.written += len(rows)
+            return len(rows)
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self) -> None:
+        self._stop.set()
+        self.flush()
+
+    def usage(self, group_by: Optional[str] = None, user_id: Optional[str] = None,
+              video_id: Optional[str] = None, endpoint: Optional[str] = None,
+              since=None, until=None, limit: int = 100) -> Dict:
+        """
+        Agrégats (appels, tokens, coût, latence) filtrés par utilisateur, vidéo,
+        endpoint et intervalle de temps, éventuellement groupés
+
+        Args:
+            group_by: user, video, endpoint, model, component, day ou hour
+            since/until: epoch en secondes ou date ISO 8601
+        """
+        if group_by is not None and group_by not in GROUP_BY_COLUMNS:
+            raise ValueError(f"group_by doit être parmi {', '.join(GROUP_BY_COLUMNS)}")
+
+        # Les appels encore dans le tampon font partie de la réponse
+        self.flush()
+
+        conditions, params = [], []
+        for column, value in (('user_id', user_id), ('video_id', video_id), ('endpoint', endpoint)):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        for operator, value in (('>=', _parse_time(since)), ('<', _parse_time(until))):
+            if value is not None:
+                conditions.append(f"ts {operator} ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        aggregates = ("COUNT(*) AS calls, SUM(status != 'ok') AS failed_calls, "
+                      "COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens, "
+                      "COALESCE(SUM(completion_tokens), 0) AS completion_tokens, "
+                      "COALESCE(SUM(cached_tokens), 0) AS cached_tokens, "
+                      "ROUND(COALESCE(SUM(cost_usd), 0), 6) AS cost_usd, "
+                      "ROUND(AVG(latency_ms), 1) AS avg_latency_ms")
+
+        connection = self._connect()
+        connection.row_factory = sqlite3.Row
+        try:
+            totals = dict(connection.execute(f"SELECT {aggregates} FROM llm_calls {where}", params).fetchone())
+            result = {'totals': totals}
+            if group_by:
+                column = GROUP_BY_COLUMNS[group_by]
+                rows = connection.execute(
+                    f"SELECT {column} AS {group_by}, {aggregates} FROM llm_calls {where} "
+                    f"GROUP BY 1 ORDER BY cost_usd DESC LIMIT ?", params + [int(limit)]).fetchall()
+                result['groups'] = [dict(row) for row in rows]
+            return result
+        finally:
+            connection.close()
+
+    def stats(self) -> Dict:
+        with self.pending_lock:
+            pending = len(self.pending)
+        return {'path': self.path, 'pending': pending, 'written': self.written, 'dropped': self.dropped}
+
+
+_ledger: Optional[CostLedger] = None
+_ledger_failed = False  # Création déjà tentée et échouée: pas de nouvel essai à chaque appel LLM
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> Optional[CostLedger]:
+    """Journal partagé du processus, créé depuis l'environnement (None si désactivé ou indisponible)"""
+    global _ledger, _ledger_failed
+    path = os.getenv("COST_LEDGER_PATH", "llm_ledger.sqlite3")
+    if path.lower() in ("", "off", "none", "0") or _ledger_failed:
+        return None
+    with _ledger_lock:
+        if _ledger is None and not _ledger_failed:
+            try:
+                _ledger = CostLedger(path, flush_interval=float(os.getenv("COST_LEDGER_FLUSH_INTERVAL", "2")))
+            except (OSError, sqlite3.Error) as e:
+                print(f"⚠️ Journal des coûts indisponible ({e}), désactivé pour ce processus")
+                _ledger_failed = True
+        return _ledger
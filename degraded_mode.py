@@ -0,0 +1,285 @@
+# degraded_mode.py - Réponses sans LLM: délestage et intentions triviales
+"""
+Quand OpenAI est lent ou indisponible, /ask attendait le timeout complet
+avant de renvoyer une erreur. Deux mécanismes gardent l'extension utile:
+
+- LoadShedder décide de ne pas appeler le LLM:
+  * disjoncteur: après LLM_SHED_FAILURES erreurs consécutives, plus d'appel
+    pendant LLM_SHED_COOLDOWN secondes, puis un seul appel d'essai
+  * file: plus de LLM_SHED_QUEUE_DEPTH appels en attente dans l'ordonnanceur
+  * SLO: le p90 des latences des LLM_SHED_HORIZON dernières secondes dépasse LLM_SHED_LATENCY_SLO_MS
+- ExtractiveAnswerer répond alors immédiatement depuis le transcript:
+  passages autour de la tête de lecture et passages BM25 proches des mots
+  de la question, horodatés et signalés comme réponse de secours
+
+Les questions du type "qu'est-ce qu'il vient de dire ?" n'ont jamais besoin
+du LLM: elles reçoivent le texte exact du passage visé (verbatim_span).
+"""
+from bisect import bisect_left, bisect_right
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Tuple
+import os
+import re
+import threading
+import time
+
+from llm_scheduler import get_scheduler
+from search_index import TranscriptSearchIndex, tokenize
+from stats_utils import percentile
+from time_references import parse_time_references
+
+RECENT_SECONDS = 30.0  # "Ce qui vient d'être dit": les 30 dernières secondes
+MAX_VERBATIM_SECONDS = 120.0  # Au-delà, une citation brute n'est plus une réponse utile
+FALLBACK_NOTICE = ("⚠️ Réponse de secours: l'assistant IA est momentanément indisponible. "
+                   "Voici les passages de la vidéo les plus proches de votre question.")
+
+# Demandes de citation: "qu'est-ce qu'il vient de dire", "what did they just say", "répète"
+SAID_PATTERN = re.compile(
+    r"\b(?:vien(?:t|s|nent)\s+de\s+(?:dire|parler)|(?:a|ont|as)[-\s]+(?:t[-\s]+)?(?:il|elle|ils|elles|on)?\s*dit"
+    r"|qu'?est[-\s]ce\s+qu'?(?:il|elle|ils|elles|on)\s+(?:dit|disait|raconte)|r[ée]p[èée]te[rz]?"
+    r"|what\s+(?:did|does|do|was|were|is)\s+(?:he|she|they|it|the\s+\w+)?\s*(?:just\s+)?(?:say|said|saying)"
+    r"|what\s+was\s+(?:just\s+)?said|repeat|say\s+(?:that|it)\s+again|didn'?t\s+(?:catch|hear))",
+    re.I)
+# Demandes qui exigent une reformulation ou portent sur un contenu précis: jamais une simple citation
+EXPLAIN_PATTERN = re.compile(
+    r"\b(?:expli\w*|explain\w*|pourquoi|why|comment|how|signifi\w*|mean\w*|veut\s+dire|r[ée]sum\w*|summar\w*"
+    r"|compar\w*|d[ée]fini\w*|defin\w*|exemple|example|traduis|translat\w*|combien|quel(?:le)?s?|which)\b",
+    re.I)
+MAX_TRIVIAL_WORDS = 14
+# Seuls mots admis autour du verbe d'une demande de citation ("répète ça stp", "can you repeat that again?"):
+# un complément ("sur l'inflation", "about taxes", "the recipe ingredients") en fait une question de contenu
+QUOTE_FILLER_WORDS = frozenset("""
+ça ca cela ceci ce là encore juste exactement déjà deja stp svp s il te plaît plait une fois
+moi me tu peux pouvez vous est que qu quoi hein pardon désolé desole euh attends ok le la phrase
+dernier dernière derniere passage bout
+that it this again just exactly there right now please one more time once sorry can could you i
+what hey wait oh me for the last sentence bit part
+""".split())
+
+
+def verbatim_span(question: str, current_time: float,
+                  duration: Optional[float] = None) -> Optional[Tuple[float, float, str]]:
+    """
+    (début, fin, libellé) du passage à citer si la question demande seulement ce qui a été dit
+
+        >>> verbatim_span("Qu'est-ce qu'il vient de dire ?", 600)
+        (570.0, 600, "ce qui vient d'être dit")
+        >>> verbatim_span("Pourquoi il vient de dire ça ?", 600) is None
+        True
+        >>> verbatim_span("What did he say about taxes?", 600) is None
+        True
+        >>> verbatim_span("Il a dit combien de grammes de farine ?", 600) is None
+        True
+    """
+    if len(question.split()) > MAX_TRIVIAL_WORDS or EXPLAIN_PATTERN.search(question):
+        return None
+    match = SAID_PATTERN.search(question)
+    if match is None:
+        return None
+    references = parse_time_references(question, current_time, duration)
+    # Rien d'autre que le verbe, des mots de remplissage et le moment visé
+    rest = question[:match.start()] + " " + question[match.end():]
+    for reference in references:
+        rest = rest.replace(reference.text, " ")
+    if any(word not in QUOTE_FILLER_WORDS for word in re.findall(r"[^\W\d_]+", rest.lower())):
+        return None
+    if references:
+        reference = references[0]
+        if reference.end - reference.start > MAX_VERBATIM_SECONDS:
+            return None
+        return reference.start, reference.end, "ce qui a été dit"
+    return max(0.0, current_time - RECENT_SECONDS), current_time, "ce qui vient d'être dit"
+
+
+class LoadShedder:
+    """Décide quand répondre sans LLM (erreurs en amont, profondeur de file, SLO de latence)"""
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0, max_queue_depth: int = 16,
+                 latency_slo: float = 15.0, slo_percentile: float = 90, min_samples: int = 10,
+                 horizon: float = 60.0, scheduler=None):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_queue_depth = max_queue_depth
+        self.latency_slo = latency_slo
+        self.slo_percentile = slo_percentile
+        self.min_samples = min_samples
+        self.horizon = horizon
+        self.scheduler = scheduler
+        self.lock = threading.Lock()
+        self.latencies = deque()  # (instant, secondes) des appels réussis récents
+        self.consecutive_failures = 0
+        self.open_until = 0.0  # Disjoncteur ouvert jusqu'à cet instant (monotonic)
+        self.probe_started = 0.0  # Appel d'essai en cours (demi-ouvert)
+        self.counters = {'successes': 0, 'failures': 0, 'circuit_opened': 0, 'shed_circuit_open': 0,
+                         'shed_queue_depth': 0, 'shed_latency_slo': 0}
+
+    @classmethod
+    def from_env(cls, scheduler=None) -> "LoadShedder":
+        return cls(failure_threshold=int(os.getenv('LLM_SHED_FAILURES', '3')),
+                   cooldown=float(os.getenv('LLM_SHED_COOLDOWN', '30')),
+                   max_queue_depth=int(os.getenv('LLM_SHED_QUEUE_DEPTH', '16')),
+                   latency_slo=float(os.getenv('LLM_SHED_LATENCY_SLO_MS', '15000')) / 1000,
+                   horizon=float(os.getenv('LLM_SHED_HORIZON', '60')),
+                   scheduler=scheduler)
+
+    def _expire(self, now: float) -> None:
+        while self.latencies and now - self.latencies[0][0] > self.horizon:
+            self.latencies.popleft()
+
+    def record_success(self, latency: float) -> None:
+        now = time.monotonic()
+        with self.lock:
+            self.counters['successes'] += 1
+            self.consecutive_failures = 0
+            self.open_until = 0.0
+            self.probe_started = 0.0
+            self.latencies.append((now, latency))
+            self._expire(now)
+
+    def record_failure(self) -> None:
+        """Erreur ou timeout du fournisseur (pas les refus de l'ordonnanceur)"""
+        now = time.monotonic()
+        with self.lock:
+            self.counters['failures'] += 1
+            self.consecutive_failures += 1
+            self.probe_started = 0.0
+            if self.consecutive_failures >= self.failure_threshold:
+                if self.open_until <= now:
+                    self.counters['circuit_opened'] += 1
+                    print(f"🔌 Disjoncteur LLM ouvert ({self.consecutive_failures} erreurs), "
+                          f"réponses locales pendant {self.cooldown:.0f}s")
+                self.open_until = now + self.cooldown
+
+    def shed_reason(self) -> Optional[str]:
+        """Raison de répondre sans LLM ('circuit_open', 'queue_depth', 'latency_slo'), None sinon"""
+        now = time.monotonic()
+        with self.lock:
+            reason = None
+            if self.consecutive_failures >= self.failure_threshold:
+                if now < self.open_until:
+                    reason = 'circuit_open'
+                elif self.probe_started and now - self.probe_started < self.cooldown:
+                    reason = 'circuit_open'  # Un seul appel d'essai à la fois
+                else:
+                    self.probe_started = now  # Demi-ouvert: cette requête teste le fournisseur
+            if reason is None and self.scheduler is not None and self.scheduler.queued >= self.max_queue_depth:
+                reason = 'queue_depth'
+            if reason is None:
+                # Les mesures anciennes expirent: le délestage par SLO s'arrête de lui-même
+                self._expire(now)
+                if len(self.latencies) >= self.min_samples:
+                    observed = percentile([latency for _, latency in self.latencies], self.slo_percentile)
+                    if observed > self.latency_slo:
+                        reason = 'latency_slo'
+            if reason is not None:
+                self.counters[f'shed_{reason}'] += 1
+            return reason
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            observed = percentile([latency for _, latency in self.latencies], self.slo_percentile)
+            return dict(self.counters,
+                        circuit='open' if now < self.open_until else
+                                'half_open' if self.consecutive_failures >= self.failure_threshold else 'closed',
+                        consecutive_failures=self.consecutive_failures,
+                        latency_p90_ms=round(observed * 1000, 1) if observed is not None else None,
+                        latency_slo_ms=round(self.latency_slo * 1000),
+                        max_queue_depth=self.max_queue_depth,
+                        queued=self.scheduler.queued if self.scheduler is not None else 0)
+
+
+class ExtractiveAnswerer:
+    """Réponses construites uniquement depuis le transcript (aucun appel LLM)"""
+
+    def __init__(self, search_index: Optional[TranscriptSearchIndex] = None, max_passages: int = 3,
+                 max_videos: int = 64):
+        # Index BM25 partagé (celui de /search) ou privé, limité à max_videos vidéos
+        self.owns_index = search_index is None
+        self.search_index = search_index if search_index is not None else TranscriptSearchIndex()
+        self.max_passages = max_passages
+        self.max_videos = max_videos
+        self.indexed = deque()
+        self.lock = threading.Lock()
+
+    def format_line(self, segment: Dict) -> str:
+        start = segment['start']
+        return f"[{int(start // 60):02d}:{int(start % 60):02d}] {segment['text']}"
+
+    def lines_between(self, transcript: Sequence[Dict], start: float, end: float) -> List[str]:
+        """Segments en cours ou commencés dans [start, end]"""
+        starts = transcript.starts if hasattr(transcript, 'starts') else [s['start'] for s in transcript]
+        lo, hi = bisect_left(starts, start), bisect_right(starts, end)
+        if lo > 0 and starts[lo - 1] + transcript[lo - 1].get('duration', 0) > start:
+            lo -= 1
+        return [self.format_line(transcript[i]) for i in range(lo, hi)]
+
+    def verbatim(self, transcript: Sequence[Dict], span: Tuple[float, float, str]) -> Optional[str]:
+        start, end, label = span
+        lines = self.lines_between(transcript, start, end)
+        if not lines:
+            return None
+        return (f"Voici {label} ({int(start // 60):02d}:{int(start % 60):02d}"
+                f" - {int(end // 60):02d}:{int(end % 60):02d}) :\n\n" + "\n".join(lines))
+
+    def ensure_indexed(self, video_id: str, transcript: Sequence[Dict]) -> None:
+        if video_id in self.search_index:
+            return
+        self.search_index.add_video(video_id, transcript)
+        if self.owns_index:
+            with self.lock:
+                self.indexed.append(video_id)
+                while len(self.indexed) > self.max_videos:
+                    self.search_index.remove_video(self.indexed.popleft())
+
+    def keyword_passages(self, video_id: str, transcript: Sequence[Dict], question: str,
+                         exclude: Tuple[float, float]) -> List[str]:
+        """Meilleurs passages BM25 de la vidéo pour les mots de la question, hors fenêtre exclue"""
+        if not tokenize(question):
+            return []
+        self.ensure_indexed(video_id, transcript)
+        hits = self.search_index.search(question, limit=self.max_passages * 2,
+                                        per_video=self.max_passages * 2, video_ids=[video_id])['hits']
+        passages = []
+        for hit in hits:
+            if hit['end'] > exclude[0] and hit['start'] < exclude[1]:
+                continue  # Déjà cité autour de la tête de lecture
+            snippet = hit['snippet'] or " ".join(
+                line.split("] ", 1)[1] for line in self.lines_between(transcript, hit['start'], hit['end']))
+            passages.append(f"[{hit['timestamp']}] {snippet}")
+            if len(passages) == self.max_passages:
+                break
+        return passages
+
+    def answer(self, video_id: str, transcript: Sequence[Dict], current_time: float, question: str) -> str:
+        """Réponse de secours: passage autour du moment actuel + passages liés à la question"""
+        around = (max(0.0, current_time - RECENT_SECONDS), current_time + 5)
+        parts = [FALLBACK_NOTICE]
+        recent = self.lines_between(transcript, *around)
+        if recent:
+            parts.append(f"🎯 Autour du moment actuel ({int(current_time // 60):02d}:{int(current_time % 60):02d}) :\n"
+                         + "\n".join(recent))
+        try:
+            related = self.keyword_passages(video_id, transcript, question, around)
+        except Exception as e:
+            print(f"⚠️ Recherche locale impossible pour {video_id}: {e}")
+            related = []
+        if related:
+            parts.append("🔎 Passages liés à votre question :\n" + "\n".join(related))
+        return "\n\n".join(parts)
+
+
+_shedder: Optional[LoadShedder] = None
+_shedder_lock = threading.Lock()
+
+
+def get_load_shedder() -> Optional[LoadShedder]:
+    """Délesteur partagé par les processeurs du worker (LLM_SHEDDING=off pour le désactiver)"""
+    global _shedder
+    if os.getenv('LLM_SHEDDING', 'on').lower() in ('off', '0', 'false', 'no'):
+        return None
+    with _shedder_lock:
+        if _shedder is None:
+            _shedder = LoadShedder.from_env(get_scheduler())
+        return _shedder
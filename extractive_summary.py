@@ -0,0 +1,255 @@
+# extractive_summary.py - Résumé extractif local des sections du contexte étendu (TextRank)
+"""
+Le bloc "CONTEXTE DE RÉFÉRENCE" résume chaque tranche de 5 minutes de la vidéo.
+Plutôt que les 200 premiers caractères de la tranche (souvent des
+hésitations), on garde ses phrases les plus centrales:
+
+1. découpage en phrases (ponctuation, ou groupes de segments pour les sous-titres auto)
+2. vecteurs TF-IDF (IDF calculé sur toute la vidéo), similarité cosinus entre phrases
+3. itération de type PageRank sur la matrice de similarité de chaque section (NumPy)
+4. sélection des meilleures phrases sous un budget (caractères ou tokens), remises dans l'ordre
+
+Le classement est calculé une fois par vidéo et mis en cache; à chaque question,
+seules les phrases hors de la fenêtre prioritaire sont retenues. Aucun appel LLM.
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+import os
+import re
+import threading
+
+import numpy as np
+
+from search_index import tokenize
+
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+def transcript_fingerprint(transcript: Sequence[Dict]) -> Tuple:
+    """Clé de cache indépendante de l'objet (mmap, cache partagé ou liste)"""
+    n = len(transcript)
+    if not n:
+        return (0,)
+    edges = [transcript[i] for i in (0, n // 2, n - 1)]
+    return (n,) + tuple((s['start'], s['text']) for s in edges)
+
+
+class SectionSentences:
+    """Phrases d'une section, avec leur score et leurs segments [begin, end)"""
+
+    __slots__ = ('texts', 'terms', 'begins', 'ends', 'scores', 'costs')
+
+    def __init__(self, texts: List[str], terms: List[frozenset], begins: np.ndarray, ends: np.ndarray,
+                 scores: np.ndarray, costs: np.ndarray):
+        self.texts = texts
+        self.terms = terms
+        self.begins = begins
+        self.ends = ends
+        self.scores = scores
+        self.costs = costs
+
+
+class TextRankSummarizer:
+    """Classement TextRank des phrases de chaque section, mis en cache par vidéo"""
+
+    def __init__(self, budget: int = 200, unit: str = "chars", damping: float = 0.85,
+                 max_iterations: int = 50, tolerance: float = 1e-6, max_sentence_chars: int = 160,
+                 min_terms: int = 3, max_overlap: float = 0.7, cache_size: int = 256,
+                 separator: str = " … "):
+        if unit not in ("chars", "tokens"):
+            raise ValueError(f"Unité de budget inconnue: {unit!r} (chars ou tokens)")
+        self.budget = budget
+        self.unit = unit
+        self.damping = damping
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.max_sentence_chars = max_sentence_chars
+        self.min_terms = min_terms  # Phrases plus pauvres jamais retenues (hésitations, "ok")
+        self.max_overlap = max_overlap  # Jaccard au-delà duquel une phrase est jugée redondante
+        self.separator = separator
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # empreinte du transcript -> {section: SectionSentences}
+        self.lock = threading.Lock()
+        self.stats = {'videos_ranked': 0, 'cache_hits': 0}
+
+    @classmethod
+    def from_env(cls) -> "TextRankSummarizer":
+        tokens = os.getenv("SUMMARY_SECTION_TOKENS")
+        if tokens:
+            return cls(budget=int(tokens), unit="tokens")
+        return cls(budget=int(os.getenv("SUMMARY_SECTION_CHARS", "200")))
+
+    def cost(self, text: str) -> int:
+        # Même estimation que le reste du projet: ~4 caractères par token
+        return len(text) if self.unit == "chars" else max(1, len(text) // 4)
+
+    def split_sentences(self, transcript: Sequence[Dict], begin: int, end: int) -> List[Tuple[str, int, int]]:
+        """
+        Phrases des segments [begin, end): (texte, premier segment, dernier segment + 1)
+
+        Sans ponctuation (sous-titres automatiques), les segments sont regroupés
+        jusqu'à max_sentence_chars.
+        """
+        sentences = []
+        parts: List[str] = []
+        first = begin
+        length = 0
+        for i in range(begin, end):
+            pieces = SENTENCE_END.split(transcript[i]['text'].strip())
+            for j, piece in enumerate(pieces):
+                if not piece:
+                    continue
+                if not parts:
+                    first = i
+                parts.append(piece)
+                length += len(piece) + 1
+                closes = j < len(pieces) - 1 or piece[-1] in ".!?…"
+                if closes or length >= self.max_sentence_chars:
+                    sentences.append((" ".join(parts), first, i + 1))
+                    parts, length = [], 0
+        if parts:
+            sentences.append((" ".join(parts), first, end))
+        return sentences
+
+    def rank(self, matrix: np.ndarray) -> np.ndarray:
+        """
+        Scores PageRank sur la similarité cosinus des lignes (vecteurs TF-IDF)
+
+        Le saut aléatoire est proportionnel à la masse TF-IDF de chaque phrase:
+        sans cela, des hésitations répétées ("euh donc voilà") forment un groupe
+        de phrases identiques qui se renforcent entre elles.
+        """
+        n = matrix.shape[0]
+        mass = matrix.sum(axis=1)
+        if n <= 2 or mass.sum() <= 0:
+            return mass if mass.sum() > 0 else np.ones(n, dtype=np.float64)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        unit = matrix / np.where(norms > 0, norms, 1.0)
+        similarity = unit @ unit.T
+        np.fill_diagonal(similarity, 0.0)
+
+        # Matrice de transition (lignes normalisées; phrase isolée -> saut uniforme)
+        row_sums = similarity.sum(axis=1, keepdims=True)
+        transition = np.where(row_sums > 0, similarity / np.where(row_sums > 0, row_sums, 1.0), 1.0 / n)
+
+        scores = np.full(n, 1.0 / n)
+        teleport = (1.0 - self.damping) * mass / mass.sum()
+        for _ in range(self.max_iterations):
+            updated = teleport + self.damping * (transition.T @ scores)
+            if np.abs(updated - scores).sum() < self.tolerance:
+                return updated
+            scores = updated
+        return scores
+
+    def rank_video(self, transcript: Sequence[Dict],
+                   section_bounds: Dict[int, Tuple[int, int]]) -> Dict[int, SectionSentences]:
+        sections = {key: self.split_sentences(transcript, begin, end)
+                    for key, (begin, end) in section_bounds.items()}
+
+        # Vocabulaire et fréquences documentaires sur toute la vidéo (une phrase = un document)
+        vocabulary: Dict[str, int] = {}
+        tokenized = {}
+        document_freq: List[int] = []
+        for key, sentences in sections.items():
+            tokenized[key] = []
+            for text, _, _ in sentences:
+                ids = [vocabulary.setdefault(token, len(vocabulary)) for token in tokenize(text)]
+                tokenized[key].append(ids)
+                document_freq.extend([0] * (len(vocabulary) - len(document_freq)))
+                for term_id in set(ids):
+                    document_freq[term_id] += 1
+        total = sum(len(sentences) for sentences in sections.values())
+        idf = np.log((1 + total) / (1 + np.asarray(document_freq, dtype=np.float64))) + 1.0
+
+        ranked = {}
+        for key, sentences in sections.items():
+            if not sentences:
+                continue
+            rows = tokenized[key]
+            # Matrice TF-IDF locale à la section (colonnes: termes présents dans la section)
+            local_terms = sorted({term_id for ids in rows for term_id in ids})
+            column = {term_id: c for c, term_id in enumerate(local_terms)}
+            matrix = np.zeros((len(rows), max(1, len(local_terms))), dtype=np.float64)
+            for r, ids in enumerate(rows):
+                for term_id in ids:
+                    matrix[r, column[term_id]] += 1.0
+            if local_terms:
+                matrix *= idf[local_terms]
+            # Phrases trop pauvres: hors du graphe, score négatif (jamais sélectionnées)
+            eligible = np.fromiter((len(set(ids)) >= self.min_terms for ids in rows), dtype=bool, count=len(rows))
+            scores = np.full(len(rows), -1.0)
+            if eligible.any():
+                scores[eligible] = self.rank(matrix[eligible])
+            ranked[key] = SectionSentences(
+                texts=[text for text, _, _ in sentences],
+                terms=[frozenset(ids) for ids in rows],
+                begins=np.fromiter((b for _, b, _ in sentences), dtype=np.int64, count=len(sentences)),
+                ends=np.fromiter((e for _, _, e in sentences), dtype=np.int64, count=len(sentences)),
+                scores=scores,
+                costs=np.fromiter((self.cost(text) for text, _, _ in sentences), dtype=np.int64,
+                                  count=len(sentences)),
+            )
+        return ranked
+
+    def fingerprint(self, transcript: Sequence[Dict]) -> Tuple:
+        return transcript_fingerprint(transcript)
+
+    def cached(self, transcript: Sequence[Dict]) -> Optional[Dict[int, SectionSentences]]:
+        key = self.fingerprint(transcript)
+        with self.lock:
+            ranked = self.cache.get(key)
+            if ranked is not None:
+                self.cache.move_to_end(key)
+                self.stats['cache_hits'] += 1
+            return ranked
+
+    def rank_and_cache(self, transcript: Sequence[Dict],
+                       section_bounds: Dict[int, Tuple[int, int]]) -> Dict[int, SectionSentences]:
+        """Classe toutes les sections de la vidéo (une fois par vidéo, ~ms par heure de transcript)"""
+        key = self.fingerprint(transcript)
+        ranked = self.rank_video(transcript, section_bounds)
+        with self.lock:
+            self.cache[key] = ranked
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            self.stats['videos_ranked'] += 1
+        return ranked
+
+    def redundant(self, section: SectionSentences, index: int, chosen: List[int]) -> bool:
+        terms = section.terms[index]
+        for other in chosen:
+            union = len(terms | section.terms[other])
+            if union and len(terms & section.terms[other]) / union > self.max_overlap:
+                return True
+        return False
+
+    def select(self, section: SectionSentences, lo: int, hi: int) -> str:
+        """Meilleures phrases hors de la fenêtre prioritaire [lo, hi), sous le budget, dans l'ordre"""
+        available = ((section.ends <= lo) | (section.begins >= hi)) & (section.scores >= 0)
+        candidates = np.flatnonzero(available)
+        if not candidates.size:
+            return ""
+        order = candidates[np.argsort(-section.scores[candidates], kind="stable")]
+
+        chosen = []
+        remaining = self.budget
+        separator_cost = self.cost(self.separator) if self.unit == "chars" else 0
+        for index in order:
+            cost = section.costs[index] + (separator_cost if chosen else 0)
+            if cost <= remaining and not self.redundant(section, index, chosen):
+                chosen.append(index)
+                remaining -= cost
+        if not chosen:
+            # Même la meilleure phrase dépasse le budget: on la tronque à un mot près
+            limit = self.budget if self.unit == "chars" else self.budget * 4
+            text = section.texts[order[0]]
+            return text[:limit].rsplit(" ", 1)[0] + "…"
+        return self.separator.join(section.texts[i] for i in sorted(chosen))
+
+
+def summarizer_from_env() -> Optional[TextRankSummarizer]:
+    """SUMMARY_MODE=prefix: ancien résumé (début de chaque section)"""
+    if os.getenv("SUMMARY_MODE", "textrank").lower() == "prefix":
+        return None
+    return TextRankSummarizer.from_env()
@@ -0,0 +1,190 @@
+# fake_openai_server.py - Serveur local compatible OpenAI pour les tests de charge
+"""
+Imite /v1/chat/completions sans appeler OpenAI
+
+- Latence configurable: fixed:800, uniform:200:1500, lognormal:800:0.6 (médiane en ms, sigma)
+- Taux d'erreurs configurable (réponses 500 ou 429)
+- Streaming SSE (stream=true) avec un délai par token
+
+Usage:
+    python fake_openai_server.py --port 8001 --latency lognormal:800:0.6 --error-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 python app.py
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+import argparse
+import json
+import math
+import random
+import threading
+import time
+
+WORDS = ("la vidéo explique ce concept en détail avec un exemple concret puis "
+         "compare les deux approches et résume les points clés").split()
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Distribution de latence (en secondes) depuis une spec 'type:params' (en ms)"""
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+    if kind == "fixed":
+        return lambda: values[0] / 1000
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal":
+        median, sigma = values[0], (values[1] if len(values) > 1 else 0.5)
+        return lambda: random.lognormvariate(math.log(median), sigma) / 1000
+    raise ValueError(f"Distribution de latence inconnue: {spec}")
+
+
+class FakeOpenAIServer:
+    """Serveur HTTP threadé (démarrable en arrière-plan depuis le harnais de test)"""
+
+    def __init__(self, port: int = 8001, latency: str = "lognormal:800:0.5", error_rate: float = 0.0,
+                 rate_limit_share: float = 0.5, completion_tokens: int = 120, token_delay_ms: float = 5.0):
+        self.port = port
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limit_share = rate_limit_share
+        self.completion_tokens = completion_tokens
+        self.token_delay = token_delay_ms / 1000
+        self.stats = {'requests': 0, 'errors': 0, 'streams': 0}
+        self.stats_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    def count(self, key: str) -> None:
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def completion_text(self) -> str:
+        return " ".join(random.choice(WORDS) for _ in range(self.completion_tokens))
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.rstrip("/") in ("/health", "/v1/models"):
+                    return self.send_json(200, {"status": "ok", "stats": server.stats})
+                self.send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self.send_json(404, {"error": {"message": "not found"}})
+
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    return self.send_json(400, {"error": {"message": "invalid json"}})
+
+                server.count('requests')
+                time.sleep(server.latency())
+
+                if random.random() < server.error_rate:
+                    server.count('errors')
+                    if random.random() < server.rate_limit_share:
+                        return self.send_json(429, {"error": {"message": "rate limited", "type": "rate_limit"}},
+                                              {"Retry-After": "1"})
+                    return self.send_json(500, {"error": {"message": "upstream failure", "type": "server_error"}})
+
+                prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+                usage = {
+                    "prompt_tokens": max(1, prompt_chars // 4),
+                    "completion_tokens": server.completion_tokens,
+                    "total_tokens": max(1, prompt_chars // 4) + server.completion_tokens,
+                }
+                model = body.get("model", "gpt-4")
+                created = int(time.time())
+                text = server.completion_text()
+
+                if body.get("stream"):
+                    server.count('streams')
+                    return self.stream(model, created, text, usage)
+
+                self.send_json(200, {
+                    "id": f"chatcmpl-fake-{created}",
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": text}}],
+                    "usage": usage,
+                })
+
+            def stream(self, model: str, created: int, text: str, usage: Dict) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def send_event(payload) -> None:
+                    data = f"data: {payload}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                    self.wfile.flush()
+
+                try:
+                    for i, word in enumerate(text.split(" ")):
+                        delta = {"content": word if i == 0 else " " + word}
+                        if i == 0:
+                            delta["role"] = "assistant"
+                        send_event(json.dumps({
+                            "id": f"chatcmpl-fake-{created}", "object": "chat.completion.chunk",
+                            "created": created, "model": model,
+                            "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                        }))
+                        time.sleep(server.token_delay)
+                    send_event(json.dumps({
+                        "id": f"chatcmpl-fake-{created}", "object": "chat.completion.chunk",
+                        "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                        "usage": usage,
+                    }))
+                    send_event("[DONE]")
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Client parti (requête annulée)
+
+        return Handler
+
+    def start(self) -> None:
+        threading.Thread(target=self.httpd.serve_forever, daemon=True, name="fake-openai").start()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Faux serveur OpenAI pour tests de charge")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default="lognormal:800:0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--token-delay-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(args.port, args.latency, args.error_rate,
+                              completion_tokens=args.completion_tokens, token_delay_ms=args.token_delay_ms)
+    print(f"🤖 Faux serveur OpenAI sur http://127.0.0.1:{args.port}/v1 (latence {args.latency}, erreurs {args.error_rate:.0%})")
+    server.httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+# hedging.py - Requêtes LLM « couvertes » (hedged requests) contre la latence de queue
+"""
+Le p99 de /ask vient de quelques complétions très lentes côté fournisseur,
+pas de la vitesse moyenne. En mode couverture:
+
+1. la requête principale part en streaming
+2. si aucun token n'est arrivé après le percentile P des délais de premier
+   token récents, une requête identique est envoyée
+3. la première qui se termine est utilisée, l'autre est annulée (flux fermé)
+
+Le taux de couverture est plafonné par un seau à jetons (LLM_HEDGE_MAX_RATE:
+au plus 10% de requêtes dupliquées par défaut). Les tentatives annulées sont
+journalisées avec le statut 'cancelled' (composant suffixé ':hedge' pour les
+doublons), et stats() compare le p99 obtenu au p99 de la requête principale
+seule, pour le surcoût payé.
+
+Activation: LLM_HEDGING=1
+"""
+from collections import deque
+from typing import Dict, List, Optional
+import contextvars
+import os
+import threading
+import time
+
+from cost_ledger import estimate_cost, get_ledger
+from stats_utils import percentile
+
+
+class _Attempt:
+    """Une des requêtes envoyées (0: principale, 1: doublon)"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.started = time.perf_counter()
+        self.stream = None
+        self.first_token_ms: Optional[float] = None
+        self.parts: List[str] = []
+        self.usage = None
+        self.model: Optional[str] = None
+        self.cancelled = False
+
+
+class _Race:
+    """État partagé entre les tentatives d'une même requête"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.attempts: List[_Attempt] = []
+        self.running = 0
+        self.first_token = False
+        self.winner: Optional[_Attempt] = None
+        self.errors: List[Exception] = []
+        self.prompt_tokens: Optional[int] = None
+
+
+class HedgedChatCompleter:
+    """Chat completions en streaming avec requête de couverture sur délai de premier token"""
+
+    def __init__(self, percentile: float = 95.0, max_hedge_rate: float = 0.1, burst: float = 5.0,
+                 min_samples: int = 20, min_delay: float = 0.2, window: int = 1000):
+        self.percentile = percentile
+        self.max_hedge_rate = max_hedge_rate
+        self.burst = burst
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.lock = threading.Lock()
+        # Seau à jetons: chaque requête rapporte max_hedge_rate jeton, un doublon en coûte un
+        self.hedge_tokens = 1.0
+        # Délais de premier token (ms) des tentatives récentes
+        self.first_token_samples = deque(maxlen=window)
+        # Latences par requête: obtenue, celle de la requête principale seule (estimée
+        # quand elle a été annulée) et celles, complètes, des principales gagnantes
+        self.latencies = deque(maxlen=window)
+        self.primary_latencies = deque(maxlen=window)
+        self.completed_primary_latencies = deque(maxlen=window)
+        self.counters = {
+            'requests': 0,
+            'hedged': 0,
+            'hedge_wins': 0,
+            'hedges_denied': 0,
+            'errors': 0,
+            'cost_usd': 0.0,
+            'extra_cost_usd': 0.0,
+            'extra_prompt_tokens': 0,
+            'extra_completion_tokens': 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "HedgedChatCompleter":
+        return cls(percentile=float(os.getenv('LLM_HEDGE_PERCENTILE', '95')),
+                   max_hedge_rate=float(os.getenv('LLM_HEDGE_MAX_RATE', '0.1')),
+                   min_samples=int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20')),
+                   min_delay=float(os.getenv('LLM_HEDGE_MIN_DELAY_MS', '200')) / 1000)
+
+    def hedge_delay(self) -> Optional[float]:
+        """Délai (s) avant l'envoi du doublon; None tant que l'historique est trop court"""
+        with self.lock:
+            if len(self.first_token_samples) < self.min_samples:
+                return None
+            value = percentile(self.first_token_samples, self.percentile)
+        return max(self.min_delay, value / 1000)
+
+    def acquire_hedge(self) -> bool:
+        with self.lock:
+            if self.hedge_tokens >= 1.0:
+                self.hedge_tokens -= 1.0
+                return True
+            self.counters['hedges_denied'] += 1
+            return False
+
+    def complete(self, client, messages: List[Dict], max_tokens: int, temperature: float = 0.7,
+                 timeout: Optional[float] = None, model: str = "gpt-4", component: str = "chat") -> str:
+        started = time.perf_counter()
+        with self.lock:
+            self.counters['requests'] += 1
+            self.hedge_tokens = min(self.burst, self.hedge_tokens + self.max_hedge_rate)
+
+        race = _Race()
+        request = dict(model=model, messages=messages, max_tokens=max_tokens,
+                       temperature=temperature, timeout=timeout, component=component)
+        self._launch(client, race, request)
+
+        delay = self.hedge_delay()
+        if timeout is not None and delay is not None and delay >= timeout:
+            delay = None  # Le doublon n'aurait pas le temps de finir
+        if delay is not None:
+            with race.condition:
+                race.condition.wait_for(
+                    lambda: race.first_token or race.winner is not None or race.running == 0, timeout=delay)
+                needs_hedge = not race.first_token and race.winner is None and race.running > 0
+            if needs_hedge and self.acquire_hedge():
+                self._launch(client, race, request)
+
+        remaining = None if timeout is None else max(0.0, timeout - (time.perf_counter() - started))
+        with race.condition:
+            race.condition.wait_for(lambda: race.winner is not None or race.running == 0, timeout=remaining)
+            winner = race.winner
+        self._cancel_losers(race, winner)
+
+        if winner is None:
+            with self.lock:
+                self.counters['errors'] += 1
+            if race.errors:
+                raise race.errors[0]
+            raise TimeoutError(f"Pas de réponse LLM en {timeout:.1f}s")
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        primary = race.attempts[0]
+        with self.lock:
+            self.latencies.append(latency_ms)
+            if winner is primary:
+                self.primary_latencies.append(latency_ms)
+                self.completed_primary_latencies.append(latency_ms)
+            else:
+                self.primary_latencies.append(self.estimate_primary_latency(latency_ms))
+                self.counters['hedge_wins'] += 1
+        return "".join(winner.parts)
+
+    def estimate_primary_latency(self, observed_ms: float) -> float:
+        """
+        Latence qu'aurait eue une principale annulée: médiane des principales
+        complètes plus lentes que la latence observée (la queue de la distribution),
+        ou la latence observée elle-même (borne basse) si aucune ne l'a dépassée
+        """
+        tail = sorted(x for x in self.completed_primary_latencies if x > observed_ms)
+        return tail[len(tail) // 2] if tail else observed_ms
+
+    def _launch(self, client, race: _Race, request: Dict) -> None:
+        with race.condition:
+            attempt = _Attempt(len(race.attempts))
+            race.attempts.append(attempt)
+            race.running += 1
+        if attempt.index > 0:
+            with self.lock:
+                self.counters['hedged'] += 1
+        # Contexte de l'appelant: attribution et cumul de tokens de la requête
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(self._run_attempt, client, race, attempt, request),
+                         daemon=True, name=f"llm-hedge-{attempt.index}").start()
+
+    def _run_attempt(self, client, race: _Race, attempt: _Attempt, request: Dict) -> None:
+        error = None
+        try:
+            stream = client.chat.completions.create(
+                model=request['model'],
+                messages=request['messages'],
+                max_tokens=request['max_tokens'],
+                temperature=request['temperature'],
+                stream=True,
+                stream_options={'include_usage': True},
+                **({'timeout': request['timeout']} if request['timeout'] else {})
+            )
+            with race.condition:
+                attempt.stream = stream
+                attempt.cancelled = attempt.cancelled or race.winner is not None
+            if attempt.cancelled:
+                stream.close()
+            else:
+                for chunk in stream:
+                    if attempt.cancelled:
+                        break
+                    attempt.model = attempt.model or getattr(chunk, 'model', None)
+                    if getattr(chunk, 'usage', None) is not None:
+                        attempt.usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if attempt.first_token_ms is None:
+                            self._on_first_token(race, attempt)
+                        attempt.parts.append(chunk.choices[0].delta.content)
+        except Exception as e:
+            error = e
+        finally:
+            self._finish_attempt(race, attempt, error, request)
+
+    def _on_first_token(self, race: _Race, attempt: _Attempt) -> None:
+        attempt.first_token_ms = (time.perf_counter() - attempt.started) * 1000
+        with self.lock:
+            self.first_token_samples.append(attempt.first_token_ms)
+        with race.condition:
+            race.first_token = True
+            race.condition.notify_all()
+
+    def _finish_attempt(self, race: _Race, attempt: _Attempt, error: Optional[Exception], request: Dict) -> None:
+        latency_ms = (time.perf_counter() - attempt.started) * 1000
+        with race.condition:
+            won = error is None and not attempt.cancelled and race.winner is None
+            if won:
+                race.winner = attempt
+                if attempt.usage is not None:
+                    race.prompt_tokens = getattr(attempt.usage, 'prompt_tokens', None)
+            elif error is not None and not attempt.cancelled:
+                race.errors.append(error)
+            race.running -= 1
+            race.condition.notify_all()
+
+        if attempt.first_token_ms is None and attempt.cancelled:
+            # Annulée avant le premier token: on garde le temps écoulé (sinon l'historique sous-estime la queue)
+            with self.lock:
+                self.first_token_samples.append(latency_ms)
+        self._record(race, attempt, won, error, latency_ms, request)
+
+    def _cancel_losers(self, race: _Race, winner: Optional[_Attempt]) -> None:
+        with race.condition:
+            losers = [a for a in race.attempts if a is not winner]
+            for attempt in losers:
+                attempt.cancelled = True
+        for attempt in losers:
+            if attempt.stream is not None:
+                try:
+                    attempt.stream.close()  # Ferme la connexion HTTP: le fournisseur arrête la génération
+                except Exception:
+                    pass
+
+    def _record(self, race: _Race, attempt: _Attempt, won: bool, error: Optional[Exception],
+                latency_ms: float, request: Dict) -> None:
+        model = attempt.model or request['model']
+        component = request['component'] + (':hedge' if attempt.index > 0 else '')
+        usage = attempt.usage
+        if usage is not None:
+            prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+            completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        else:
+            # Flux interrompu: même prompt que la gagnante, un token par fragment reçu
+            prompt_tokens = race.prompt_tokens or sum(len(str(m.get('content', ''))) for m in request['messages']) // 4
+            completion_tokens = len(attempt.parts)
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = getattr(details, 'cached_tokens', 0) or 0
+
+        if won:
+            status = 'ok'
+        elif attempt.cancelled:
+            status = 'cancelled'
+        else:
+            status = 'error'
+            prompt_tokens = completion_tokens = 0  # Échec: rien de facturé
+
+        ledger = get_ledger()
+        if ledger is not None:
+            cost = ledger.record(model, prompt_tokens, completion_tokens, cached_tokens,
+                                 latency_ms=latency_ms, component=component, status=status)
+        else:
+            cost = estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+
+        with self.lock:
+            self.counters['cost_usd'] += cost
+            if status == 'cancelled':
+                self.counters['extra_cost_usd'] += cost
+                self.counters['extra_prompt_tokens'] += prompt_tokens
+                self.counters['extra_completion_tokens'] += completion_tokens
+
+    def stats(self) -> Dict:
+        """Gain de latence de queue contre surcoût"""
+        with self.lock:
+            counters = dict(self.counters)
+            latencies = list(self.latencies)
+            primary_latencies = list(self.primary_latencies)
+            first_tokens = list(self.first_token_samples)
+        delay = self.hedge_delay()
+
+        def rounded(value):
+            return None if value is None else round(value, 1)
+
+        p99 = percentile(latencies, 99)
+        primary_p99 = percentile(primary_latencies, 99)
+        requests = counters['requests'] or 1
+        base_cost = counters['cost_usd'] - counters['extra_cost_usd']
+        return {
+            'percentile': self.percentile,
+            'hedge_delay_ms': rounded(delay * 1000 if delay is not None else None),
+            'max_hedge_rate': self.max_hedge_rate,
+            'requests': counters['requests'],
+            'hedged': counters['hedged'],
+            'hedge_rate': round(counters['hedged'] / requests, 4),
+            'hedge_wins': counters['hedge_wins'],
+            'hedges_denied': counters['hedges_denied'],
+            'errors': counters['errors'],
+            'first_token_p50_ms': rounded(percentile(first_tokens, 50)),
+            'latency_ms': {
+                'p50': rounded(percentile(latencies, 50)),
+                'p95': rounded(percentile(latencies, 95)),
+                'p99': rounded(p99),
+            },
+            # Principale seule: estimée depuis la queue des principales complètes quand elle a été annulée
+            'primary_only_p99_ms': rounded(primary_p99),
+            'p99_improvement_ms': rounded(primary_p99 - p99 if p99 is not None and primary_p99 is not None else None),
+            'cost_usd': round(counters['cost_usd'], 6),
+            'extra_cost_usd': round(counters['extra_cost_usd'], 6),
+            'extra_spend_ratio': round(counters['extra_cost_usd'] / base_cost, 4) if base_cost > 0 else 0.0,
+            'extra_prompt_tokens': counters['extra_prompt_tokens'],
+            'extra_completion_tokens': counters['extra_completion_tokens'],
+        }
+
+
+def hedger_from_env() -> Optional[HedgedChatCompleter]:
+    """LLM_HEDGING=1 active la couverture des appels chat completions"""
+    if os.getenv('LLM_HEDGING', '0').lower() not in ('1', 'true', 'yes', 'on'):
+        return None
+    return HedgedChatCompleter.from_env()
@@ -0,0 +1,217 @@
+# ingest_transcripts.py - Ingestion en masse des transcripts (catalogue de cours)
+"""
+Pré-charge une liste de vidéos dans le store persistant avant l'arrivée des étudiants.
+
+Usage:
+    python ingest_transcripts.py video_ids.txt
+    python ingest_transcripts.py video_ids.txt --source-dir fixtures/ --concurrency 8 --rate 5
+
+Le fichier contient un video_id par ligne (lignes vides et commentaires '#' ignorés).
+Les vidéos déjà présentes dans le store sont sautées: relancer la commande après
+une interruption reprend là où elle s'était arrêtée.
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from contextual_transcript_processor import ContextualTranscriptProcessor
+from transcript_sources import DirectoryTranscriptSource, normalize_transcript, source_from_env
+from transcript_store import TranscriptStore
+
+
+class RateLimiter:
+    """Token bucket thread-safe: au plus `rate` acquisitions par seconde (rafales de `burst`)"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def read_video_ids(path: str) -> List[str]:
+    """Lit les video_ids (dédupliqués, ordre conservé)"""
+    seen = set()
+    video_ids = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            video_id = line.split("#", 1)[0].strip()
+            if video_id and video_id not in seen:
+                seen.add(video_id)
+                video_ids.append(video_id)
+    return video_ids
+
+
+def index_transcript(store_dir: str, video_id: str, segments: List[Dict]) -> Dict:
+    """Normalise et écrit un transcript dans le store (exécuté dans un processus worker)"""
+    started = time.perf_counter()
+    store = TranscriptStore(store_dir)
+    normalized = normalize_transcript(segments)
+    if not normalized:
+        raise ValueError("transcript vide après normalisation")
+    store.save(video_id, normalized)
+    if store.load(video_id) is None:
+        raise ValueError("relecture du fichier écrit impossible")
+    return {
+        'segments': len(normalized),
+        'index_seconds': time.perf_counter() - started,
+    }
+
+
+class TranscriptIngester:
+    """Récupère (threads, concurrence bornée + rate limit) puis indexe (pool de processus)"""
+
+    def __init__(self, processor: ContextualTranscriptProcessor, store: TranscriptStore,
+                 concurrency: int = 4, rate: float = 2.0, workers: Optional[int] = None):
+        self.processor = processor
+        self.store = store
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(rate, burst=concurrency)
+        self.workers = workers
+
+    def fetch(self, video_id: str) -> Dict:
+        self.rate_limiter.acquire()
+        started = time.perf_counter()
+        segments = self.processor.get_transcript(video_id)
+        return {
+            'video_id': video_id,
+            'segments': list(segments),
+            'fetch_seconds': time.perf_counter() - started,
+        }
+
+    def run(self, video_ids: List[str], force: bool = False) -> Dict:
+        started = time.perf_counter()
+        results = []
+
+        pending = []
+        for video_id in video_ids:
+            try:
+                done = not force and self.store.exists(video_id)
+            except ValueError as e:
+                results.append({'video_id': video_id, 'status': 'failed', 'error': str(e)})
+                continue
+            if done:
+                results.append({'video_id': video_id, 'status': 'skipped'})
+            else:
+                pending.append(video_id)
+
+        print(f"📥 {len(pending)} vidéos à ingérer ({len(video_ids) - len(pending)} déjà présentes ou invalides)")
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as fetchers, \
+                ProcessPoolExecutor(max_workers=self.workers) as indexers:
+            # Chaque transcript part à l'indexation dès qu'il est récupéré, pendant que
+            # les téléchargements suivants continuent
+            index_futures = {}
+            in_flight = {fetchers.submit(self.fetch, video_id) for video_id in pending}
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in index_futures:
+                        result = self.indexed_result(index_futures.pop(future), future)
+                    else:
+                        fetched = future.result()
+                        if fetched['segments']:
+                            index_future = indexers.submit(index_transcript, self.store.directory,
+                                                           fetched['video_id'], fetched['segments'])
+                            index_futures[index_future] = fetched
+                            in_flight.add(index_future)
+                            continue
+                        result = {'video_id': fetched['video_id'], 'status': 'failed',
+                                  'error': 'transcript indisponible',
+                                  'fetch_seconds': round(fetched['fetch_seconds'], 3)}
+                    results.append(result)
+                    self.report(result)
+
+        elapsed = time.perf_counter() - started
+        ingested = [r for r in results if r['status'] == 'ok']
+        total_segments = sum(r['segments'] for r in ingested)
+        return {
+            'videos': results,
+            'summary': {
+                'requested': len(video_ids),
+                'ingested': len(ingested),
+                'skipped': sum(1 for r in results if r['status'] == 'skipped'),
+                'failed': sum(1 for r in results if r['status'] == 'failed'),
+                'elapsed_seconds': round(elapsed, 3),
+                'videos_per_second': round(len(ingested) / elapsed, 3) if elapsed else 0,
+                'segments_per_second': round(total_segments / elapsed, 1) if elapsed else 0,
+            }
+        }
+
+    def indexed_result(self, fetched: Dict, future) -> Dict:
+        result = {'video_id': fetched['video_id'],
+                  'fetch_seconds': round(fetched['fetch_seconds'], 3)}
+        try:
+            indexed = future.result()
+            result.update(status='ok', segments=indexed['segments'],
+                          index_seconds=round(indexed['index_seconds'], 3))
+        except Exception as e:
+            result.update(status='failed', error=str(e))
+        return result
+
+    def report(self, result: Dict) -> None:
+        if result['status'] == 'ok':
+            print(f"✅ {result['video_id']}: {result['segments']} segments "
+                  f"(fetch {result['fetch_seconds']}s, index {result['index_seconds']}s)")
+        else:
+            print(f"❌ {result['video_id']}: {result.get('error')}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Ingestion en masse de transcripts dans le store persistant")
+    parser.add_argument("ids_file", help="Fichier contenant un video_id par ligne")
+    parser.add_argument("--source-dir", help="Lire les transcripts depuis ce répertoire (<video_id>.json) au lieu de YouTube")
+    parser.add_argument("--store-dir", default=os.getenv("TRANSCRIPT_STORE_DIR", "transcript_store"))
+    parser.add_argument("--concurrency", type=int, default=4, help="Téléchargements simultanés")
+    parser.add_argument("--rate", type=float, default=2.0, help="Téléchargements max par seconde (0 = illimité)")
+    parser.add_argument("--workers", type=int, default=None, help="Processus d'indexation")
+    parser.add_argument("--force", action="store_true", help="Ré-ingérer les vidéos déjà présentes")
+    parser.add_argument("--report", help="Écrire le rapport JSON dans ce fichier")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    source = DirectoryTranscriptSource(args.source_dir) if args.source_dir else source_from_env()
+    # Le store est alimenté par les workers: le processeur ne fait que récupérer
+    processor = ContextualTranscriptProcessor(os.getenv('OPENAI_API_KEY', 'api_key'),
+                                              source=source, use_store=False)
+    store = TranscriptStore(args.store_dir)
+
+    ingester = TranscriptIngester(processor, store, concurrency=args.concurrency,
+                                  rate=args.rate, workers=args.workers)
+    report = ingester.run(read_video_ids(args.ids_file), force=args.force)
+
+    summary = report['summary']
+    print(f"\n📊 {summary['ingested']} ingérées, {summary['skipped']} sautées, {summary['failed']} en échec "
+          f"en {summary['elapsed_seconds']}s ({summary['videos_per_second']} vidéos/s, "
+          f"{summary['segments_per_second']} segments/s)")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,304 @@
+# llm_scheduler.py - Ordonnancement équitable des appels LLM entre utilisateurs
+"""
+Tous les utilisateurs partagent la même capacité chez le fournisseur. Sans
+isolation, un utilisateur qui enchaîne les questions (ou un client batch)
+dégrade la latence de /ask pour tous. Devant chaque appel LLM:
+
+- une file par utilisateur, servies par file d'attente équitable pondérée
+  (WFQ: étiquette de fin virtuelle = max(temps virtuel, dernière fin) + 1/poids;
+  le temps virtuel avance à l'étiquette de chaque appel servi, comme en SCFQ)
+- au plus LLM_CAPACITY appels en vol au total, LLM_PER_USER_CONCURRENCY par utilisateur
+- un appel qui attendrait plus de LLM_MAX_QUEUE_WAIT secondes (ou dont la file
+  utilisateur est pleine) est rejeté avec un Retry-After (HTTP 429)
+
+Le temps passé en file et le temps LLM sont cumulés par requête HTTP
+(request_timing()) pour être renvoyés séparément dans la réponse.
+"""
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+import asyncio
+import math
+import os
+import threading
+import time
+
+from cost_ledger import current_attribution
+
+ANONYMOUS_USER = "anonymous"
+
+_timing: ContextVar[Optional[Dict]] = ContextVar('llm_request_timing', default=None)
+
+
+def start_request_timing() -> object:
+    """Nouveau cumul queue_wait_ms / llm_ms pour la requête courante (retourne le jeton de reset)"""
+    return _timing.set({'queue_wait_ms': 0.0, 'llm_ms': 0.0, 'llm_calls': 0})
+
+
+def reset_request_timing(token) -> None:
+    _timing.reset(token)
+
+
+def request_timing() -> Dict:
+    """Temps cumulés des appels LLM de la requête courante (arrondis, en ms)"""
+    timing = _timing.get() or {'queue_wait_ms': 0.0, 'llm_ms': 0.0, 'llm_calls': 0}
+    return {'queue_wait_ms': round(timing['queue_wait_ms'], 1), 'llm_ms': round(timing['llm_ms'], 1),
+            'llm_calls': timing['llm_calls']}
+
+
+class LLMQueueRejected(Exception):
+    """Appel LLM refusé par l'ordonnanceur; retry_after: secondes à attendre avant de réessayer"""
+
+    def __init__(self, message: str, retry_after: int, reason: str, queue_wait_ms: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+        self.queue_wait_ms = queue_wait_ms
+
+
+class _Waiter:
+    """Appel en file: réveillé par l'ordonnanceur (thread ou boucle asyncio)"""
+
+    def __init__(self, user_id: str, finish_tag: float, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.user_id = user_id
+        self.finish_tag = finish_tag
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.loop = loop
+        self.event = None if loop is not None else threading.Event()
+        self.future = loop.create_future() if loop is not None else None
+
+    def wake(self) -> None:
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(True))
+
+
+class _UserState:
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.queue = deque()
+        self.active = 0
+        self.last_finish = 0.0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_ms_total = 0.0
+
+
+class FairShareScheduler:
+    """File d'attente équitable pondérée avec limites par utilisateur"""
+
+    def __init__(self, capacity: int = 8, per_user_limit: int = 2, max_queue_wait: float = 10.0,
+                 max_queue_per_user: int = 20, weights: Optional[Dict[str, float]] = None,
+                 default_weight: float = 1.0):
+        self.capacity = capacity
+        self.per_user_limit = per_user_limit
+        self.max_queue_wait = max_queue_wait
+        self.max_queue_per_user = max_queue_per_user
+        self.weights = weights or {}
+        self.default_weight = default_weight
+        self.lock = threading.Lock()
+        self.users: Dict[str, _UserState] = {}
+        self.active = 0
+        self.queued = 0
+        self.virtual_time = 0.0
+        # Durée moyenne d'un appel (EWMA, s), pour estimer le Retry-After
+        self.service_time = 2.0
+        self.counters = {'admitted': 0, 'rejected_queue_full': 0, 'rejected_wait': 0}
+
+    @classmethod
+    def from_env(cls) -> "FairShareScheduler":
+        return cls(capacity=int(os.getenv('LLM_CAPACITY', '8')),
+                   per_user_limit=int(os.getenv('LLM_PER_USER_CONCURRENCY', '2')),
+                   max_queue_wait=float(os.getenv('LLM_MAX_QUEUE_WAIT', '10')),
+                   max_queue_per_user=int(os.getenv('LLM_MAX_QUEUE_PER_USER', '20')),
+                   weights=parse_weights(os.getenv('LLM_USER_WEIGHTS', '')))
+
+    def _user(self, user_id: str) -> _UserState:
+        state = self.users.get(user_id)
+        if state is None:
+            state = self.users[user_id] = _UserState(self.weights.get(user_id, self.default_weight))
+        return state
+
+    def _enqueue(self, user_id: str, loop=None) -> _Waiter:
+        with self.lock:
+            state = self._user(user_id)
+            if len(state.queue) >= self.max_queue_per_user:
+                state.rejected += 1
+                self.counters['rejected_queue_full'] += 1
+                raise LLMQueueRejected(
+                    f"Trop de questions en attente pour cet utilisateur ({len(state.queue)})",
+                    self._retry_after(len(state.queue)), 'user_queue_full')
+
+            # WFQ: la file d'un utilisateur inactif repart du temps virtuel courant (pas de crédit accumulé)
+            start_tag = max(self.virtual_time, state.last_finish)
+            state.last_finish = start_tag + 1.0 / state.weight
+            waiter = _Waiter(user_id, state.last_finish, loop)
+            state.queue.append(waiter)
+            self.queued += 1
+            self._dispatch()
+        return waiter
+
+    def _dispatch(self) -> None:
+        """Attribue les places libres aux têtes de file éligibles de plus petite étiquette (verrou tenu)"""
+        while self.active < self.capacity and self.queued:
+            best = None
+            for state in self.users.values():
+                if state.queue and state.active < self.per_user_limit:
+                    if best is None or state.queue[0].finish_tag < best.queue[0].finish_tag:
+                        best = state
+            if best is None:
+                return  # Tous les utilisateurs en attente sont à leur limite de concurrence
+            waiter = best.queue.popleft()
+            self.queued -= 1
+            self.active += 1
+            best.active += 1
+            self.virtual_time = max(self.virtual_time, waiter.finish_tag)
+            waiter.granted = True
+            waiter.wake()
+
+    def _admitted(self, waiter: _Waiter) -> float:
+        wait_ms = (time.monotonic() - waiter.enqueued_at) * 1000
+        with self.lock:
+            state = self.users[waiter.user_id]
+            state.admitted += 1
+            state.wait_ms_total += wait_ms
+            self.counters['admitted'] += 1
+        return wait_ms
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Retire un appel de sa file; False s'il a obtenu sa place entre-temps"""
+        with self.lock:
+            if waiter.granted:
+                return False
+            state = self.users[waiter.user_id]
+            state.queue.remove(waiter)
+            self.queued -= 1
+            state.rejected += 1
+            self.counters['rejected_wait'] += 1
+            self._dispatch()
+            return True
+
+    def _release(self, user_id: str, service_seconds: float) -> None:
+        with self.lock:
+            state = self.users[user_id]
+            state.active -= 1
+            self.active -= 1
+            self.service_time = 0.8 * self.service_time + 0.2 * service_seconds
+            self._prune_idle()
+            self._dispatch()
+
+    def _prune_idle(self) -> None:
+        """
+        Oublie les utilisateurs inactifs dont la dernière fin est dépassée (verrou tenu)
+
+        Sans perte: un utilisateur recréé repart de max(temps virtuel, 0), la
+        même étiquette que max(temps virtuel, last_finish).
+        """
+        idle = [user_id for user_id, state in self.users.items()
+                if not state.queue and not state.active and state.last_finish <= self.virtual_time]
+        for user_id in idle:
+            del self.users[user_id]
+
+    def _retry_after(self, ahead: int) -> int:
+        """Estimation grossière du temps avant qu'une place se libère (verrou tenu)"""
+        backlog = self.queued + ahead
+        return max(1, math.ceil(self.service_time * (1 + backlog / max(1, self.capacity))))
+
+    def _rejection(self, waiter: _Waiter, max_wait: float) -> LLMQueueRejected:
+        with self.lock:
+            retry_after = self._retry_after(0)
+        return LLMQueueRejected(f"Capacité LLM saturée: pas de place en {max_wait:.1f}s",
+                                retry_after, 'queue_timeout', max_wait * 1000)
+
+    def _wait_limit(self, max_wait: Optional[float]) -> float:
+        return self.max_queue_wait if max_wait is None else min(self.max_queue_wait, max_wait)
+
+    @contextmanager
+    def slot(self, user_id: Optional[str] = None, max_wait: Optional[float] = None):
+        """
+        Place d'appel LLM pour l'utilisateur (par défaut celui de la requête courante)
+
+        Lève LLMQueueRejected si la file est pleine ou si l'attente dépasse max_wait.
+        """
+        user_id = user_id or current_attribution().get('user_id') or ANONYMOUS_USER
+        wait_limit = self._wait_limit(max_wait)
+        waiter = self._enqueue(user_id)
+        if not waiter.event.wait(wait_limit) and self._abandon(waiter):
+            raise self._rejection(waiter, wait_limit)
+        wait_ms = self._admitted(waiter)
+        with self._timed(user_id, wait_ms) as timing:
+            yield timing
+
+    @asynccontextmanager
+    async def aslot(self, user_id: Optional[str] = None, max_wait: Optional[float] = None):
+        """Équivalent asyncio de slot() (n'occupe pas la boucle pendant l'attente)"""
+        user_id = user_id or current_attribution().get('user_id') or ANONYMOUS_USER
+        wait_limit = self._wait_limit(max_wait)
+        waiter = self._enqueue(user_id, asyncio.get_running_loop())
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), wait_limit)
+        except asyncio.TimeoutError:
+            if self._abandon(waiter):
+                raise self._rejection(waiter, wait_limit)
+        except asyncio.CancelledError:
+            if not self._abandon(waiter):
+                self._release(user_id, 0.0)  # Place obtenue au moment de l'annulation: la rendre
+            raise
+        wait_ms = self._admitted(waiter)
+        with self._timed(user_id, wait_ms) as timing:
+            yield timing
+
+    @contextmanager
+    def _timed(self, user_id: str, wait_ms: float):
+        """Cumule queue_wait_ms / llm_ms dans la requête courante et libère la place"""
+        started = time.monotonic()
+        timing = {'queue_wait_ms': wait_ms}
+        try:
+            yield timing
+        finally:
+            service = time.monotonic() - started
+            self._release(user_id, service)
+            totals = _timing.get()
+            if totals is not None:
+                totals['queue_wait_ms'] += wait_ms
+                totals['llm_ms'] += service * 1000
+                totals['llm_calls'] += 1
+
+    def stats(self) -> Dict:
+        with self.lock:
+            users = {
+                user_id: {'weight': state.weight, 'active': state.active, 'queued': len(state.queue)}
+                for user_id, state in self.users.items() if state.active or state.queue
+            }
+            return dict(self.counters, capacity=self.capacity, per_user_limit=self.per_user_limit,
+                        max_queue_wait=self.max_queue_wait, active=self.active, queued=self.queued,
+                        avg_service_ms=round(self.service_time * 1000, 1), users=users)
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """'batch:0.2,vip:2' -> {'batch': 0.2, 'vip': 2.0}"""
+    weights = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        user_id, _, weight = item.rpartition(':')
+        if not user_id or float(weight) <= 0:
+            raise ValueError(f"Poids utilisateur invalide: {item!r} (attendu user_id:poids > 0)")
+        weights[user_id] = float(weight)
+    return weights
+
+
+_scheduler: Optional[FairShareScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Optional[FairShareScheduler]:
+    """Ordonnanceur partagé par les processeurs du worker (LLM_SCHEDULER=off pour le désactiver)"""
+    global _scheduler
+    if os.getenv('LLM_SCHEDULER', 'on').lower() in ('off', '0', 'false', 'no'):
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = FairShareScheduler.from_env()
+        return _scheduler
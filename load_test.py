@@ -0,0 +1,307 @@
+# load_test.py - Test de charge de bout en bout avec YouTube et OpenAI simulés
+"""
+Démarre app.py contre des transcripts locaux et un faux serveur OpenAI, puis
+génère une charge asynchrone réaliste sur /ask, /ask/simple et les endpoints mémoire.
+
+Usage:
+    python load_test.py --users 50 --duration 60 --llm-latency lognormal:800:0.5 --llm-error-rate 0.02
+    # Serveur déjà démarré: vidéos qu'il sait servir, ou fixtures écrites dans son TRANSCRIPT_SOURCE_DIR
+    python load_test.py --target http://127.0.0.1:5000 --video-ids abc123,def456 --users 20
+    python load_test.py --target http://127.0.0.1:5000 --fixtures-dir /srv/ytai/fixtures --users 20
+
+Le rapport JSON contient le débit, les latences p50/p95/p99 et les taux
+d'erreurs par endpoint, pour obtenir des chiffres de capacité avant chaque release.
+"""
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from fake_openai_server import FakeOpenAIServer
+from stats_utils import percentile
+
+QUESTIONS = [
+    "Qu'est-ce qu'il vient d'expliquer ?",
+    "Peux-tu résumer les deux dernières minutes ?",
+    "C'est quoi la différence entre ces deux approches ?",
+    "Donne-moi un exemple concret",
+    "What is an algorithm?",
+    "Can you explain what was just said?",
+    "Comme tu l'as dit avant, peux-tu préciser ?",
+]
+FIXTURE_WORDS = ("algorithme données tri complexité exemple fonction variable boucle "
+                 "structure liste tableau mémoire performance réseau modèle apprentissage").split()
+
+
+def generate_fixtures(directory: str, videos: int, duration_seconds: int = 1800) -> List[str]:
+    """Transcripts synthétiques <video_id>.json (un segment toutes les ~3 secondes)"""
+    os.makedirs(directory, exist_ok=True)
+    video_ids = []
+    for v in range(videos):
+        video_id = f"loadtest{v:03d}"
+        segments = []
+        t = 0.0
+        while t < duration_seconds:
+            duration = random.uniform(2.0, 4.0)
+            text = " ".join(random.choice(FIXTURE_WORDS) for _ in range(random.randint(6, 14)))
+            segments.append({'start': round(t, 2), 'duration': round(duration, 2), 'text': text})
+            t += duration
+        with open(os.path.join(directory, f"{video_id}.json"), "w", encoding="utf-8") as f:
+            json.dump(segments, f)
+        video_ids.append(video_id)
+    return video_ids
+
+
+async def http_request(host: str, port: int, method: str, path: str,
+                       body: Optional[Dict] = None, timeout: float = 120.0) -> Tuple[int, bytes]:
+    """Client HTTP/1.1 minimal sur asyncio (une connexion par requête)"""
+    payload = json.dumps(body).encode("utf-8") if body is not None else b""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                f"Connection: close\r\n\r\n")
+        writer.write(head.encode("ascii") + payload)
+        await writer.drain()
+        raw = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    status_line, _, rest = raw.partition(b"\r\n")
+    status = int(status_line.split(b" ", 2)[1])
+    return status, rest.partition(b"\r\n\r\n")[2]
+
+
+def latency_percentiles(values: List[float], *quantiles: float) -> Dict[str, Optional[float]]:
+    """p50/p95/... en ms arrondis au dixième (None sans échantillon), via le helper partagé de stats_utils"""
+    result = {}
+    for q in quantiles:
+        value = percentile(values, q)
+        result[f"p{q}"] = round(value, 1) if value is not None else None
+    return result
+
+
+class LoadGenerator:
+    """Utilisateurs virtuels: regardent une vidéo, posent des questions, parfois sautent dans la vidéo"""
+
+    def __init__(self, base_url: str, video_ids: List[str], users: int, duration: float,
+                 think_time: float = 5.0, request_timeout: float = 120.0):
+        parsed = urlparse(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.video_ids = video_ids
+        self.users = users
+        self.duration = duration
+        self.think_time = think_time
+        self.request_timeout = request_timeout
+        self.samples = {}  # endpoint -> [(latence ms, ok)]
+        # Popularité des vidéos type Zipf: quelques vidéos concentrent la charge
+        self.video_weights = [1.0 / (rank + 1) for rank in range(len(video_ids))]
+
+    async def call(self, endpoint: str, method: str, path: str, body: Optional[Dict] = None) -> None:
+        started = time.perf_counter()
+        try:
+            status, _ = await http_request(self.host, self.port, method, path, body, self.request_timeout)
+            ok = status < 400
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            ok = False
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.samples.setdefault(endpoint, []).append((latency_ms, ok))
+
+    async def user(self, user_index: int, deadline: float) -> None:
+        user_id = f"loadtest_user_{user_index}"
+        video_id = random.choices(self.video_ids, self.video_weights)[0]
+        current_time = random.uniform(0, 600)
+        await asyncio.sleep(random.uniform(0, self.think_time))
+
+        while time.monotonic() < deadline:
+            roll = random.random()
+            body = {"video_id": video_id, "current_time": round(current_time, 1),
+                    "question": random.choice(QUESTIONS), "user_id": user_id}
+            if roll < 0.75:
+                await self.call("/ask", "POST", "/ask", body)
+            elif roll < 0.85:
+                await self.call("/ask/simple", "POST", "/ask/simple", body)
+            elif roll < 0.93:
+                await self.call("/conversation/history", "GET",
+                                f"/conversation/history/{video_id}?user_id={user_id}")
+            elif roll < 0.97:
+                await self.call("/memory/stats", "GET", "/memory/stats")
+            else:
+                await self.call("/conversation/clear", "POST", f"/conversation/clear/{video_id}",
+                                {"user_id": user_id})
+
+            # La vidéo continue pendant la réflexion; parfois l'utilisateur saute ou change de vidéo
+            pause = random.expovariate(1.0 / self.think_time)
+            current_time += pause
+            if random.random() < 0.1:
+                current_time = random.uniform(0, 1500)
+            if random.random() < 0.03:
+                video_id = random.choices(self.video_ids, self.video_weights)[0]
+                current_time = random.uniform(0, 600)
+            await asyncio.sleep(pause)
+
+    async def run(self) -> Dict:
+        started = time.monotonic()
+        deadline = started + self.duration
+        await asyncio.gather(*(self.user(i, deadline) for i in range(self.users)))
+        return self.report(time.monotonic() - started)
+
+    def report(self, elapsed: float) -> Dict:
+        endpoints = {}
+        all_latencies = []
+        total_errors = 0
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = sorted(latency for latency, _ in samples)
+            errors = sum(1 for _, ok in samples if not ok)
+            total_errors += errors
+            all_latencies.extend(latencies)
+            endpoints[endpoint] = {
+                'requests': len(samples),
+                'errors': errors,
+                'error_rate': round(errors / len(samples), 4),
+                'throughput_rps': round(len(samples) / elapsed, 2),
+                'latency_ms': dict(latency_percentiles(latencies, 50, 95, 99), max=round(latencies[-1], 1)),
+            }
+        all_latencies.sort()
+        total = len(all_latencies)
+        return {
+            'users': self.users,
+            'elapsed_seconds': round(elapsed, 2),
+            'total': {
+                'requests': total,
+                'errors': total_errors,
+                'error_rate': round(total_errors / total, 4) if total else 0,
+                'throughput_rps': round(total / elapsed, 2) if elapsed else 0,
+                'latency_ms': latency_percentiles(all_latencies, 50, 95, 99),
+            },
+            'endpoints': endpoints,
+        }
+
+
+def check_videos(base_url: str, video_ids: List[str]) -> List[str]:
+    """Vidéos dont le serveur ne trouve pas le transcript (GET /transcript/<video_id>)"""
+    parsed = urlparse(base_url)
+    missing = []
+    for video_id in video_ids:
+        try:
+            status, _ = asyncio.run(http_request(parsed.hostname, parsed.port or 80, "GET",
+                                                 f"/transcript/{video_id}", timeout=30))
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            status = None
+        if status != 200:
+            missing.append(video_id)
+    return missing
+
+
+def wait_until_healthy(base_url: str, timeout: float = 60.0) -> None:
+    parsed = urlparse(base_url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            status, _ = asyncio.run(http_request(parsed.hostname, parsed.port or 80, "GET", "/health/ready", timeout=2))
+            if status == 200:
+                return
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Le serveur {base_url} n'a pas démarré en {timeout}s")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Test de charge de bout en bout")
+    parser.add_argument("--target", help="URL d'un serveur déjà démarré (sinon app.py est lancé localement)")
+    parser.add_argument("--app-port", type=int, default=5050)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=60.0, help="Durée du test en secondes")
+    parser.add_argument("--think-time", type=float, default=5.0, help="Pause moyenne entre deux actions (s)")
+    parser.add_argument("--videos", type=int, default=10)
+    parser.add_argument("--video-ids", help="Avec --target: vidéos (séparées par des virgules) que le serveur sait servir")
+    parser.add_argument("--fixtures-dir", help="Écrire les transcripts synthétiques ici (avec --target: le "
+                                               "TRANSCRIPT_SOURCE_DIR du serveur visé)")
+    parser.add_argument("--llm-port", type=int, default=8001)
+    parser.add_argument("--llm-latency", default="lognormal:800:0.5")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-completion-tokens", type=int, default=120)
+    parser.add_argument("--llm-token-delay-ms", type=float, default=5.0, help="Délai par token en streaming")
+    parser.add_argument("--transcript-latency-ms", type=float, default=300.0)
+    parser.add_argument("--output", help="Écrire le rapport JSON dans ce fichier")
+    args = parser.parse_args(argv)
+    if args.target and not (args.video_ids or args.fixtures_dir):
+        # Les fixtures d'un répertoire temporaire local sont invisibles pour un serveur distant
+        parser.error("--target demande --video-ids (vidéos connues du serveur) ou --fixtures-dir "
+                     "(répertoire lu par le serveur via TRANSCRIPT_SOURCE_DIR)")
+
+    workdir = tempfile.mkdtemp(prefix="ytai_loadtest_")
+    fixtures_dir = args.fixtures_dir or os.path.join(workdir, "fixtures")
+    if args.video_ids:
+        video_ids = [video_id.strip() for video_id in args.video_ids.split(",") if video_id.strip()]
+    else:
+        video_ids = generate_fixtures(fixtures_dir, args.videos)
+
+    llm = None
+    app_process = None
+    base_url = args.target
+    try:
+        if not base_url:
+            llm = FakeOpenAIServer(args.llm_port, args.llm_latency, args.llm_error_rate,
+                                   completion_tokens=args.llm_completion_tokens,
+                                   token_delay_ms=args.llm_token_delay_ms)
+            llm.start()
+
+            env = dict(os.environ,
+                       FLASK_PORT=str(args.app_port),
+                       OPENAI_API_KEY="sk-loadtest",
+                       OPENAI_BASE_URL=f"http://127.0.0.1:{args.llm_port}/v1",
+                       OPENAI_API_BASE=f"http://127.0.0.1:{args.llm_port}/v1",
+                       TRANSCRIPT_SOURCE_DIR=fixtures_dir,
+                       TRANSCRIPT_SOURCE_LATENCY_MS=str(args.transcript_latency_ms),
+                       TRANSCRIPT_STORE_DIR=os.path.join(workdir, "store"),
+                       COST_LEDGER_PATH=os.path.join(workdir, "llm_ledger.sqlite3"))
+            app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+            app_process = subprocess.Popen([sys.executable, app_path], env=env,
+                                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            base_url = f"http://127.0.0.1:{args.app_port}"
+            print(f"🚀 app.py démarré sur {base_url}, faux OpenAI sur le port {args.llm_port}")
+
+        wait_until_healthy(base_url)
+        missing = check_videos(base_url, video_ids)
+        if missing:
+            print(f"❌ Transcripts introuvables sur {base_url}: {', '.join(missing[:10])}"
+                  f"{'...' if len(missing) > 10 else ''}")
+            return 2
+        print(f"🔥 Charge: {args.users} utilisateurs pendant {args.duration}s sur {len(video_ids)} vidéos")
+        generator = LoadGenerator(base_url, video_ids, args.users, args.duration, args.think_time)
+        report = asyncio.run(generator.run())
+        report['config'] = {
+            'llm_latency': args.llm_latency, 'llm_error_rate': args.llm_error_rate,
+            'transcript_latency_ms': args.transcript_latency_ms, 'videos': args.videos,
+            'think_time': args.think_time,
+        }
+        if llm is not None:
+            report['fake_llm'] = dict(llm.stats)
+    finally:
+        if app_process is not None:
+            app_process.terminate()
+            app_process.wait(timeout=10)
+        if llm is not None:
+            llm.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,73 +1,163 @@
 # memory_system.py - Système de mémoire pour l'assistant
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence
 from datetime import datetime, timedelta
+from collections import OrderedDict
 import json
+import threading
+from llm_scheduler import LLMQueueRejected
 
 class ConversationMemory:
-    def __init__(self, max_messages: int = 10, session_timeout: int = 1800):  # 30 minutes
+    # Surcoût approximatif (dicts, datetimes, clés) compté en plus du texte
+    SESSION_OVERHEAD_BYTES = 400
+    MESSAGE_OVERHEAD_BYTES = 250
+
+    def __init__(self, max_messages: int = 10, session_timeout: int = 1800,  # 30 minutes
+                 max_total_bytes: int = 256 * 1024 * 1024, cleanup_interval: Optional[float] = None):
         """
         Système de mémoire pour les conversations
         
+        Les sessions sont gardées dans un OrderedDict trié par dernière activité:
+        la plus ancienne est toujours en tête, ce qui rend l'expiration et
+        l'éviction LRU en O(1) par session retirée. Les statistiques sont des
+        compteurs tenus à jour à chaque modification.
+        
         Args:
             max_messages: Nombre maximum de messages à retenir par session
             session_timeout: Timeout de session en secondes
+            max_total_bytes: Plafond mémoire (estimé) de toutes les sessions
+            cleanup_interval: Période du nettoyage en arrière-plan (None: pas de thread,
+                les sessions expirées sont retirées à l'accès; l'app appelle start_cleanup_timer)
         """
-        self.sessions = {}  # video_id -> conversation_data
+        self.sessions = OrderedDict()  # session_key -> conversation_data (ordre: dernière activité)
         self.max_messages = max_messages
         self.session_timeout = session_timeout
+        self.max_total_bytes = max_total_bytes
+        self.lock = threading.RLock()
+        
+        # Compteurs pour des statistiques en O(1)
+        self._by_creation = OrderedDict()  # session_key -> created_at (la plus ancienne en tête)
+        self.total_messages = 0
+        self.total_bytes = 0
+        self.expired_sessions = 0
+        self.evicted_sessions = 0
+        
+        # Callbacks appelés avec la clé de chaque session retirée (expiration, éviction, effacement)
+        self.on_session_removed = []
+        
+        self.cleanup_interval = cleanup_interval
+        self._cleanup_timer = None
+        if cleanup_interval:
+            self.start_cleanup_timer()
     
     def get_session_key(self, video_id: str, user_id: str = "default") -> str:
         """Génère une clé de session unique"""
         return f"{video_id}_{user_id}"
     
+    def _message_size(self, message: Dict) -> int:
+        return (len(message['question'].encode('utf-8')) + len(message['response'].encode('utf-8'))
+                + self.MESSAGE_OVERHEAD_BYTES)
+    
+    def _remove_session(self, session_key: str) -> None:
+        """Retire une session et met à jour les compteurs (appelant sous verrou)"""
+        session = self.sessions.pop(session_key)
+        self._by_creation.pop(session_key, None)
+        self.total_messages -= len(session['messages'])
+        self.total_bytes -= session['size_bytes']
+        for callback in self.on_session_removed:
+            callback(session_key)
+    
+    def _is_expired(self, session: Dict, now: datetime) -> bool:
+        return (now - session['last_activity']).total_seconds() > self.session_timeout
+    
+    def _expire_oldest(self, now: datetime) -> int:
+        """Retire les sessions expirées en tête de l'ordre d'activité (appelant sous verrou)"""
+        expired = 0
+        while self.sessions:
+            session_key, session = next(iter(self.sessions.items()))
+            if not self._is_expired(session, now):
+                break
+            self._remove_session(session_key)
+            expired += 1
+        self.expired_sessions += expired
+        return expired
+    
+    def _evict_over_budget(self, protected_key: str) -> None:
+        """Éviction des sessions les moins récemment actives au-delà du plafond mémoire"""
+        while self.total_bytes > self.max_total_bytes and len(self.sessions) > 1:
+            session_key = next(iter(self.sessions))
+            if session_key == protected_key:
+                break
+            self._remove_session(session_key)
+            self.evicted_sessions += 1
+    
     def add_message(self, video_id: str, question: str, response: str, 
                    timestamp: float, user_id: str = "default") -> None:
         """Ajoute un message à l'historique"""
         session_key = self.get_session_key(video_id, user_id)
         current_time = datetime.now()
         
-        if session_key not in self.sessions:
-            self.sessions[session_key] = {
-                'video_id': video_id,
-                'user_id': user_id,
-                'created_at': current_time,
-                'last_activity': current_time,
-                'messages': []
+        with self.lock:
+            self._expire_oldest(current_time)
+            
+            if session_key not in self.sessions:
+                self.sessions[session_key] = {
+                    'video_id': video_id,
+                    'user_id': user_id,
+                    'created_at': current_time,
+                    'last_activity': current_time,
+                    'messages': [],
+                    'size_bytes': self.SESSION_OVERHEAD_BYTES
+                }
+                self._by_creation[session_key] = current_time
+                self.total_bytes += self.SESSION_OVERHEAD_BYTES
+            session = self.sessions[session_key]
+            
+            # Ajouter le nouveau message
+            message = {
+                'question': question,
+                'response': response,
+                'timestamp': timestamp,
+                'time_formatted': self.format_timestamp(timestamp),
+                'created_at': current_time
             }
-        
-        # Ajouter le nouveau message
-        self.sessions[session_key]['messages'].append({
-            'question': question,
-            'response': response,
-            'timestamp': timestamp,
-            'time_formatted': self.format_timestamp(timestamp),
-            'created_at': current_time
-        })
-        
-        # Mettre à jour la dernière activité
-        self.sessions[session_key]['last_activity'] = current_time
-        
-        # Limiter le nombre de messages
-        if len(self.sessions[session_key]['messages']) > self.max_messages:
-            self.sessions[session_key]['messages'] = self.sessions[session_key]['messages'][-self.max_messages:]
+            message_size = self._message_size(message)
+            session['messages'].append(message)
+            session['size_bytes'] += message_size
+            self.total_messages += 1
+            self.total_bytes += message_size
+            
+            # Mettre à jour la dernière activité (la session passe en fin d'ordre LRU)
+            session['last_activity'] = current_time
+            self.sessions.move_to_end(session_key)
+            
+            # Limiter le nombre de messages
+            if len(session['messages']) > self.max_messages:
+                dropped = session['messages'][:-self.max_messages]
+                dropped_size = sum(self._message_size(m) for m in dropped)
+                session['messages'] = session['messages'][-self.max_messages:]
+                session['size_bytes'] -= dropped_size
+                self.total_messages -= len(dropped)
+                self.total_bytes -= dropped_size
+            
+            self._evict_over_budget(session_key)
     
     def get_conversation_history(self, video_id: str, user_id: str = "default") -> List[Dict]:
         """Récupère l'historique de conversation pour une session"""
         session_key = self.get_session_key(video_id, user_id)
         
-        if session_key not in self.sessions:
-            return []
-        
-        # Vérifier si la session n'a pas expiré
-        session = self.sessions[session_key]
-        time_since_last_activity = datetime.now() - session['last_activity']
-        
-        if time_since_last_activity.total_seconds() > self.session_timeout:
-            # Session expirée, la supprimer
-            del self.sessions[session_key]
-            return []
-        
-        return session['messages']
+        with self.lock:
+            session = self.sessions.get(session_key)
+            if session is None:
+                return []
+            
+            # Vérifier si la session n'a pas expiré
+            if self._is_expired(session, datetime.now()):
+                # Session expirée, la supprimer
+                self._remove_session(session_key)
+                self.expired_sessions += 1
+                return []
+            
+            return list(session['messages'])
     
     def get_conversation_context(self, video_id: str, user_id: str = "default") -> str:
         """Génère un contexte textuel de la conversation pour l'IA"""
@@ -87,23 +177,33 @@ class ConversationMemory:
     def clear_session(self, video_id: str, user_id: str = "default") -> None:
         """Efface une session spécifique"""
         session_key = self.get_session_key(video_id, user_id)
-        if session_key in self.sessions:
-            del self.sessions[session_key]
+        with self.lock:
+            if session_key in self.sessions:
+                self._remove_session(session_key)
     
     def cleanup_expired_sessions(self) -> int:
         """Nettoie les sessions expirées"""
-        current_time = datetime.now()
-        expired_keys = []
-        
-        for session_key, session in self.sessions.items():
-            time_since_last_activity = current_time - session['last_activity']
-            if time_since_last_activity.total_seconds() > self.session_timeout:
-                expired_keys.append(session_key)
+        with self.lock:
+            return self._expire_oldest(datetime.now())
+    
+    def start_cleanup_timer(self, interval: Optional[float] = None) -> None:
+        """Nettoyage périodique en arrière-plan (thread daemon, toutes les 60 s par défaut)"""
+        self.cleanup_interval = interval or self.cleanup_interval or 60
         
-        for key in expired_keys:
-            del self.sessions[key]
+        def run():
+            cleaned = self.cleanup_expired_sessions()
+            if cleaned:
+                print(f"🧹 {cleaned} sessions expirées nettoyées")
+            self.start_cleanup_timer()
         
-        return len(expired_keys)
+        self._cleanup_timer = threading.Timer(self.cleanup_interval, run)
+        self._cleanup_timer.daemon = True
+        self._cleanup_timer.start()
+    
+    def stop_cleanup_timer(self) -> None:
+        if self._cleanup_timer is not None:
+            self._cleanup_timer.cancel()
+            self._cleanup_timer = None
     
     def format_timestamp(self, seconds: float) -> str:
         """Formate les secondes en MM:SS"""
@@ -112,68 +212,128 @@ class ConversationMemory:
         return f"{minutes:02d}:{seconds:02d}"
     
     def get_stats(self) -> Dict:
-        """Statistiques du système de mémoire"""
-        return {
-            'active_sessions': len(self.sessions),
-            'total_messages': sum(len(session['messages']) for session in self.sessions.values()),
-            'oldest_session': min([session['created_at'] for session in self.sessions.values()]) if self.sessions else None
-        }
+        """Statistiques du système de mémoire (compteurs, O(1) hors sessions expirées)"""
+        with self.lock:
+            self._expire_oldest(datetime.now())
+            return {
+                'active_sessions': len(self.sessions),
+                'total_messages': self.total_messages,
+                'oldest_session': next(iter(self._by_creation.values())) if self._by_creation else None,
+                'memory_bytes': self.total_bytes,
+                'max_memory_bytes': self.max_total_bytes,
+                'expired_sessions': self.expired_sessions,
+                'evicted_sessions': self.evicted_sessions
+            }
 
 # Classe mise à jour du processeur contextuel avec mémoire
 class ContextualTranscriptProcessorWithMemory:
-    def __init__(self, api_key: str):
-        from openai import OpenAI
+    def __init__(self, api_key: str, max_cached_contexts: int = 1024):
         self.api_key = api_key
-        self.client = OpenAI(api_key=api_key)
         self.memory = ConversationMemory()
         
-        # Import du processeur original pour récupérer les transcripts
+        # Dernières fenêtres de contexte par session, mises à jour incrémentalement
+        self.context_cache = OrderedDict()  # session_key -> ContextWindowState
+        self.max_cached_contexts = max_cached_contexts
+        self.context_lock = threading.Lock()
+        self.memory.on_session_removed.append(self.forget_session_context)
+        
+        # Processeur original: récupération des transcripts et appels OpenAI (journalisés)
         from contextual_transcript_processor import ContextualTranscriptProcessor
         self.transcript_processor = ContextualTranscriptProcessor(api_key)
     
     def ask_question_with_memory(self, video_id: str, current_time: float, 
-                                question: str, user_id: str = "default") -> Dict:
+                                question: str, user_id: str = "default",
+                                timeout: Optional[float] = None,
+                                transcript: Optional[Sequence[Dict]] = None) -> Dict:
         """
         Pose une question en tenant compte de l'historique de conversation
+        
+        Args:
+            timeout: Timeout de l'appel OpenAI en secondes (None: défaut du client)
+            transcript: Transcript déjà chargé (batch_qa.py), sinon récupéré ici
         """
         # 1. Récupérer l'historique de conversation
         conversation_context = self.memory.get_conversation_context(video_id, user_id)
         
         # 2. Récupérer le transcript et créer le contexte
-        transcript = self.transcript_processor.get_transcript(video_id)
+        if transcript is None:
+            transcript = self.transcript_processor.get_transcript(video_id)
         if not transcript:
             return {"error": "Impossible de récupérer le transcript de cette vidéo."}
         
-        contextual_data = self.transcript_processor.create_contextual_windows(transcript, current_time)
+        # Citation demandée ("qu'est-ce qu'il vient de dire ?") ou LLM délesté: réponse locale
+        local = self.transcript_processor.local_answer(video_id, transcript, current_time, question)
+        if local is not None:
+            return self.local_result(video_id, current_time, question, user_id, local, conversation_context)
+
+        contextual_data = self.get_session_context(video_id, user_id, transcript, current_time)
+        # Moments cités dans la question ("à 12:30", "il y a 5 minutes"): hors du cache de session
+        contextual_data = self.transcript_processor.apply_time_references(contextual_data, transcript, question)
         
         # 3. Construire le prompt avec mémoire
         prompt = self.build_ai_prompt_with_memory(contextual_data, question, conversation_context)
         
         # 4. Interroger l'IA
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
+            ai_response = self.transcript_processor.complete_chat(
+                [
                     {"role": "system", "content": "Tu es un assistant IA spécialisé dans l'explication de contenu vidéo avec mémoire des conversations précédentes."},
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=600,
-                temperature=0.7
+                timeout=timeout,
+                component="ask_memory"
             )
             
-            ai_response = response.choices[0].message.content
-            
             # 5. Sauvegarder dans la mémoire
             self.memory.add_message(video_id, question, ai_response, current_time, user_id)
             
             return {
                 "response": ai_response,
                 "has_conversation_history": bool(conversation_context),
-                "conversation_length": len(self.memory.get_conversation_history(video_id, user_id))
+                "conversation_length": len(self.memory.get_conversation_history(video_id, user_id)),
+                "answer_mode": "llm",
+                "degraded": False
             }
-            
+
+        except LLMQueueRejected:
+            raise  # Rendu en HTTP 429 par l'API
         except Exception as e:
-            return {"error": f"Erreur lors de la génération de la réponse: {e}"}
+            print(f"❌ Erreur LLM ({e}), réponse de secours")
+            local = self.transcript_processor.fallback_answer(video_id, transcript, current_time,
+                                                              question, 'upstream_error')
+            return self.local_result(video_id, current_time, question, user_id, local, conversation_context)
+
+    def local_result(self, video_id: str, current_time: float, question: str, user_id: str,
+                     local: Dict, conversation_context: str) -> Dict:
+        """Résultat d'une réponse sans LLM; seules les citations entrent dans l'historique"""
+        if not local['degraded']:
+            self.memory.add_message(video_id, question, local['response'], current_time, user_id)
+        return dict(local,
+                    has_conversation_history=bool(conversation_context),
+                    conversation_length=len(self.memory.get_conversation_history(video_id, user_id)))
+    
+    def get_session_context(self, video_id: str, user_id: str, transcript, current_time: float) -> Dict:
+        """
+        Fenêtres de contexte de la session, réutilisées depuis la question précédente
+        
+        Quand la tête de lecture a avancé, seuls les segments entrants/sortants
+        sont traités; un saut dans la vidéo provoque une reconstruction complète.
+        """
+        session_key = self.memory.get_session_key(video_id, user_id)
+        with self.context_lock:
+            previous = self.context_cache.get(session_key)
+        
+        state = self.transcript_processor.build_window_state(transcript, current_time, previous)
+        
+        with self.context_lock:
+            self.context_cache[session_key] = state
+            self.context_cache.move_to_end(session_key)
+            while len(self.context_cache) > self.max_cached_contexts:
+                self.context_cache.popitem(last=False)
+        
+        print(f"🧩 Contexte {state.mode} ({state.hi - state.lo} segments prioritaires)")
+        return state.contextual_data
     
     def build_ai_prompt_with_memory(self, contextual_data: Dict, user_question: str, 
                                    conversation_context: str) -> str:
@@ -220,6 +380,12 @@ Réponse:"""
     def clear_conversation(self, video_id: str, user_id: str = "default"):
         """Efface l'historique de conversation pour une vidéo"""
         self.memory.clear_session(video_id, user_id)
+        self.forget_session_context(self.memory.get_session_key(video_id, user_id))
+    
+    def forget_session_context(self, session_key: str) -> None:
+        """Oublie les fenêtres de contexte d'une session retirée de la mémoire"""
+        with self.context_lock:
+            self.context_cache.pop(session_key, None)
     
     def get_conversation_stats(self) -> Dict:
         """Statistiques de mémoire"""
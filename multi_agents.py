@@ -1,24 +1,101 @@
 # multi_agent.py - Système Multi-Agents avec LangChain
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
-from langchain.schema import HumanMessage, SystemMessage, AIMessage
-from langchain_community.callbacks.manager import get_openai_callback
-from typing import Dict, List, Any, Tuple
+# LangChain est importé à la construction de l'assistant: importer ce module reste léger
+from typing import Dict, List, Any, Optional, Tuple
+import asyncio
 import json
+import os
 import re
+import threading
+import time
 from datetime import datetime
-from pydantic import BaseModel
+from cost_ledger import get_ledger
+from llm_scheduler import get_scheduler
+from degraded_mode import get_load_shedder
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: Optional[int] = None
+_loop_lock = threading.Lock()
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """
+    Boucle asyncio du processus, dans un thread daemon, créée au premier usage
+
+    Le client async de ChatOpenAI (pool httpx) reste lié à la boucle où il a
+    servi la première fois: un asyncio.run() par requête le ferait travailler
+    sur des boucles fermées ("Event loop is closed"). Toutes les exécutions
+    spéculatives passent donc par cette boucle unique (recréée après fork).
+    """
+    global _loop, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid() or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, daemon=True, name="agents-event-loop").start()
+            _loop, _loop_pid = loop, os.getpid()
+        return _loop
+
+
+def run_coroutine(coroutine, timeout: Optional[float] = None):
+    """
+    Exécute la coroutine sur la boucle du processus et attend son résultat
+
+    Le contexte de l'appelant (attribution des coûts, compteur de tokens de
+    batch_qa.py) est copié dans la tâche par call_soon_threadsafe.
+    """
+    future = asyncio.run_coroutine_threadsafe(coroutine, background_loop())
+    try:
+        return future.result(timeout)
+    except BaseException:
+        future.cancel()
+        raise
+
+
+# Analyse utilisée quand l'analyseur échoue, et pour la réponse spéculative
+DEFAULT_ANALYSIS = {
+    "question_type": "general",
+    "context_strategy": "current_focus",
+    "response_style": "conversational",
+    "keywords": [],
+    "confidence": 0.3,
+    "reasoning": "Default analysis"
+}
+
+# Analyse des questions qui citent un moment précis ("à 12:30", "il y a 5 minutes"):
+# le passage cité est déjà dans le contexte prioritaire, l'analyseur n'apporte rien
+TIME_REFERENCE_ANALYSIS = {
+    "question_type": "timestamp",
+    "context_strategy": "time_reference",
+    "response_style": "detailed",
+    "keywords": [],
+    "confidence": 0.9,
+    "reasoning": "Explicit time reference in question"
+}
 
 class MultiAgentYouTubeAssistant:
-    def __init__(self, api_key: str, model_name: str = "gpt-4"):
+    # Champs de l'analyse qui doivent correspondre au défaut pour garder la réponse spéculative
+    SPECULATION_MATCH_FIELDS = ('context_strategy', 'response_style')
+    
+    def __init__(self, api_key: str, model_name: str = "gpt-4", speculative: bool = False):
         """
         Initialise le système multi-agents
         
         Args:
             api_key: Clé API OpenAI
             model_name: Modèle à utiliser (gpt-4, gpt-3.5-turbo, etc.)
+            speculative: Lancer le répondeur (stratégie par défaut) en parallèle de l'analyseur
         """
         self.api_key = api_key
+        self.model_name = model_name
+        self.speculative = speculative
+        self.speculation_stats = {
+            'attempts': 0,
+            'hits': 0,
+            'misses': 0,
+            'saved_seconds': 0.0,
+            'wasted_seconds': 0.0
+        }
+        self.stats_lock = threading.Lock()
+        from langchain_openai import ChatOpenAI
         self.llm = ChatOpenAI(
             openai_api_key=api_key,
             model_name=model_name,
@@ -38,6 +115,8 @@ class MultiAgentYouTubeAssistant:
     
     def setup_agents(self):
         """Configure les prompts des deux agents"""
+        from langchain.prompts import (ChatPromptTemplate, HumanMessagePromptTemplate,
+                                       SystemMessagePromptTemplate)
         
         # Agent 1: Analyseur de questions
         self.analyzer_prompt = ChatPromptTemplate.from_messages([
@@ -142,104 +221,198 @@ Génère maintenant une réponse optimale selon l'analyse fournie:
 """)
         ])
     
-    def analyze_question(self, user_question: str, contextual_data: Dict) -> Dict:
-        """
-        Agent 1: Analyse la question de l'utilisateur
-        """
+    def call_options(self, timeout: Optional[float]) -> Dict:
+        """Options transmises à l'appel OpenAI (timeout par requête)"""
+        return {'timeout': timeout} if timeout else {}
+
+    def record_call(self, message, component: str, started: float, status: str = 'ok') -> None:
+        """Enregistre l'appel dans le journal des coûts (tokens de response_metadata) et le délesteur"""
+        latency_ms = (time.perf_counter() - started) * 1000
+        shedder = get_load_shedder()
+        if shedder is not None and status == 'ok':
+            shedder.record_success(latency_ms / 1000)
+        elif shedder is not None and status == 'error':
+            shedder.record_failure()
+        ledger = get_ledger()
+        if ledger is None:
+            return
+        if status != 'ok':
+            ledger.record_failure(self.model_name, latency_ms, component, status)
+            return
+        cost = ledger.record_langchain(message, self.model_name, latency_ms, component)
+        print(f"💰 Coût Agent {component}: ${cost:.4f}")
+
+    def invoke_llm(self, messages: List, component: str, timeout: Optional[float] = None):
+        scheduler = get_scheduler()
+        if scheduler is None:
+            return self._invoke_llm(messages, component, timeout)
+        # Même file équitable que les appels /ask (la capacité LLM est partagée)
+        with scheduler.slot(max_wait=timeout) as timing:
+            if timeout:
+                timeout = max(0.5, timeout - timing['queue_wait_ms'] / 1000)
+            return self._invoke_llm(messages, component, timeout)
+
+    def _invoke_llm(self, messages: List, component: str, timeout: Optional[float]):
+        started = time.perf_counter()
         try:
-            # Créer un aperçu du contexte prioritaire pour l'analyseur
-            priority_preview = (
-                contextual_data['priority_window_text'][:300] + "..."
-                if len(contextual_data['priority_window_text']) > 300
-                else contextual_data['priority_window_text']
-            )
+            message = self.llm.invoke(messages, **self.call_options(timeout))
+        except Exception:
+            self.record_call(None, component, started, 'error')
+            raise
+        self.record_call(message, component, started)
+        return message
 
-            # Formatage du prompt pour l'analyseur
-            analyzer_messages = self.analyzer_prompt.format_messages(
-                user_question=user_question,
-                current_time_formatted=contextual_data['current_time_formatted'],
-                priority_context_preview=priority_preview
-            )
+    async def ainvoke_llm(self, messages: List, component: str):
+        scheduler = get_scheduler()
+        if scheduler is None:
+            return await self._ainvoke_llm(messages, component)
+        async with scheduler.aslot():
+            return await self._ainvoke_llm(messages, component)
 
-            # Appel à l'agent analyseur avec invoke()
-            with get_openai_callback() as cb:
-                analysis_response = self.llm.invoke(analyzer_messages)
-                print(f"💰 Coût Agent Analyseur: ${cb.total_cost:.4f}")
+    async def _ainvoke_llm(self, messages: List, component: str):
+        started = time.perf_counter()
+        try:
+            message = await self.llm.ainvoke(messages)
+        except asyncio.CancelledError:
+            # Réponse spéculative abandonnée: les tokens déjà facturés sont inconnus
+            self.record_call(None, component, started, 'cancelled')
+            raise
+        except Exception:
+            self.record_call(None, component, started, 'error')
+            raise
+        self.record_call(message, component, started)
+        return message
 
-            # Récupérer le texte brut
-            analysis_text = analysis_response.content.strip()
+    def build_analyzer_messages(self, user_question: str, contextual_data: Dict) -> List:
+        """Messages de l'agent analyseur"""
+        # Créer un aperçu du contexte prioritaire pour l'analyseur
+        priority_preview = (
+            contextual_data['priority_window_text'][:300] + "..."
+            if len(contextual_data['priority_window_text']) > 300
+            else contextual_data['priority_window_text']
+        )
 
-            # Essayer d'extraire du JSON
-            json_match = re.search(r'\{.*\}', analysis_text, re.DOTALL)
-            if json_match:
-                candidate = json_match.group(0)
-            else:
-                # Si pas d'accolades, on essaie de forcer
-                candidate = "{" + analysis_text + "}"
+        # Formatage du prompt pour l'analyseur
+        return self.analyzer_prompt.format_messages(
+            user_question=user_question,
+            current_time_formatted=contextual_data['current_time_formatted'],
+            priority_context_preview=priority_preview
+        )
 
-            # Nettoyage basique
-            candidate = candidate.replace("'", '"').replace("\n", " ").strip()
+    def parse_analysis(self, analysis_text: str) -> Dict:
+        """Extrait le JSON de la réponse de l'analyseur (fallback si mal formé)"""
+        # Essayer d'extraire du JSON
+        json_match = re.search(r'\{.*\}', analysis_text, re.DOTALL)
+        if json_match:
+            candidate = json_match.group(0)
+        else:
+            # Si pas d'accolades, on essaie de forcer
+            candidate = "{" + analysis_text + "}"
 
-            try:
-                analysis_json = json.loads(candidate)
-            except json.JSONDecodeError as e:
-                print(f"⚠️ JSON mal formé même après nettoyage ({e}), fallback utilisé")
-                analysis_json = {
-                    "question_type": "general",
-                    "context_strategy": "current_focus",
-                    "response_style": "conversational",
-                    "keywords": [],
-                    "confidence": 0.4,
-                    "reasoning": f"Parsing failed: {str(e)}"
-                }
-
-            print(f"🔍 Analyse terminée: "
-                f"{analysis_json.get('question_type', 'general')} | "
-                f"{analysis_json.get('context_strategy', 'current_focus')} | "
-                f"{analysis_json.get('response_style', 'conversational')}")
-            return analysis_json
+        # Nettoyage basique
+        candidate = candidate.replace("'", '"').replace("\n", " ").strip()
+
+        try:
+            analysis_json = json.loads(candidate)
+        except json.JSONDecodeError as e:
+            print(f"⚠️ JSON mal formé même après nettoyage ({e}), fallback utilisé")
+            analysis_json = dict(DEFAULT_ANALYSIS, confidence=0.4, reasoning=f"Parsing failed: {str(e)}")
+
+        print(f"🔍 Analyse terminée: "
+            f"{analysis_json.get('question_type', 'general')} | "
+            f"{analysis_json.get('context_strategy', 'current_focus')} | "
+            f"{analysis_json.get('response_style', 'conversational')}")
+        return analysis_json
+
+    def invoke_analyzer(self, user_question: str, contextual_data: Dict,
+                        timeout: Optional[float] = None) -> Dict:
+        """Appel de l'agent analyseur (les erreurs et timeouts sont propagés)"""
+        if contextual_data.get('time_references'):
+            return dict(TIME_REFERENCE_ANALYSIS)
+        analyzer_messages = self.build_analyzer_messages(user_question, contextual_data)
+
+        # Appel à l'agent analyseur avec invoke()
+        analysis_response = self.invoke_llm(analyzer_messages, "analyzer", timeout)
+
+        # Récupérer le texte brut
+        return self.parse_analysis(analysis_response.content.strip())
+
+    def analyze_question(self, user_question: str, contextual_data: Dict) -> Dict:
+        """
+        Agent 1: Analyse la question de l'utilisateur
+        """
+        try:
+            return self.invoke_analyzer(user_question, contextual_data)
 
         except Exception as e:
             print(f"❌ Erreur dans analyze_question: {e}")
             # Analyse par défaut
-            return {
-                "question_type": "general",
-                "context_strategy": "current_focus",
-                "response_style": "conversational",
-                "keywords": [],
-                "confidence": 0.3,
-                "reasoning": f"Error fallback: {str(e)}"
-            }
+            return dict(DEFAULT_ANALYSIS, reasoning=f"Error fallback: {str(e)}")
 
+    async def aanalyze_question(self, user_question: str, contextual_data: Dict) -> Dict:
+        """Version asynchrone (annulable) de analyze_question"""
+        if contextual_data.get('time_references'):
+            return dict(TIME_REFERENCE_ANALYSIS)
+        try:
+            analyzer_messages = self.build_analyzer_messages(user_question, contextual_data)
+
+            analysis_response = await self.ainvoke_llm(analyzer_messages, "analyzer")
+
+            return self.parse_analysis(analysis_response.content.strip())
+
+        except Exception as e:
+            print(f"❌ Erreur dans aanalyze_question: {e}")
+            return dict(DEFAULT_ANALYSIS, reasoning=f"Error fallback: {str(e)}")
+
+    def build_responder_messages(self, original_question: str, analysis: Dict, contextual_data: Dict) -> List:
+        """Messages de l'agent répondeur, avec le contexte ajusté à la stratégie"""
+        # Ajuster le contexte selon la stratégie analysée
+        context_data = self.adjust_context_by_strategy(contextual_data, analysis)
+        
+        # Formatage du prompt pour le générateur de réponses
+        return self.responder_prompt.format_messages(
+            original_question=original_question,
+            question_type=analysis['question_type'],
+            context_strategy=analysis['context_strategy'],
+            response_style=analysis['response_style'],
+            keywords=', '.join(analysis.get('keywords', [])),
+            current_time_formatted=contextual_data['current_time_formatted'],
+            priority_context=context_data['priority_context'],
+            extended_context=context_data['extended_context']
+        )
+
+    def invoke_responder(self, original_question: str, analysis: Dict, contextual_data: Dict,
+                         timeout: Optional[float] = None) -> str:
+        """Appel de l'agent répondeur (les erreurs et timeouts sont propagés)"""
+        responder_messages = self.build_responder_messages(original_question, analysis, contextual_data)
+        
+        # Appel à l'agent répondeur
+        response = self.invoke_llm(responder_messages, "responder", timeout)
+        
+        return response.content.strip()
+    
     def generate_response(self, original_question: str, analysis: Dict, contextual_data: Dict) -> str:
         """
         Agent 2: Génère la réponse basée sur l'analyse
         """
         try:
-            # Ajuster le contexte selon la stratégie analysée
-            context_data = self.adjust_context_by_strategy(contextual_data, analysis)
+            return self.invoke_responder(original_question, analysis, contextual_data)
             
-            # Formatage du prompt pour le générateur de réponses
-            responder_messages = self.responder_prompt.format_messages(
-                original_question=original_question,
-                question_type=analysis['question_type'],
-                context_strategy=analysis['context_strategy'],
-                response_style=analysis['response_style'],
-                keywords=', '.join(analysis.get('keywords', [])),
-                current_time_formatted=contextual_data['current_time_formatted'],
-                priority_context=context_data['priority_context'],
-                extended_context=context_data['extended_context']
-            )
+        except Exception as e:
+            print(f"❌ Erreur dans generate_response: {e}")
+            return f"Désolé, une erreur est survenue lors de la génération de la réponse: {str(e)}"
+    
+    async def agenerate_response(self, original_question: str, analysis: Dict, contextual_data: Dict) -> str:
+        """Version asynchrone (annulable) de generate_response"""
+        try:
+            responder_messages = self.build_responder_messages(original_question, analysis, contextual_data)
             
-            # Appel à l'agent répondeur
-            with get_openai_callback() as cb:
-                response = self.llm.invoke(responder_messages)
-                print(f"💰 Coût Agent Répondeur: ${cb.total_cost:.4f}")
+            response = await self.ainvoke_llm(responder_messages, "responder")
             
             return response.content.strip()
             
         except Exception as e:
-            print(f"❌ Erreur dans generate_response: {e}")
+            print(f"❌ Erreur dans agenerate_response: {e}")
             return f"Désolé, une erreur est survenue lors de la génération de la réponse: {str(e)}"
     
     def adjust_context_by_strategy(self, contextual_data: Dict, analysis: Dict) -> Dict:
@@ -269,6 +442,13 @@ Génère maintenant une réponse optimale selon l'analyse fournie:
                 'extended_context': contextual_data['extended_context_summary']
             }
             
+        elif strategy == "time_reference":
+            # Passages cités déjà dans le contexte prioritaire; le résumé de la vidéo est omis
+            return {
+                'priority_context': contextual_data['priority_window_text'],
+                'extended_context': contextual_data['extended_context_summary']
+            }
+            
         elif strategy == "specific_search":
             # Rechercher des mots-clés spécifiques (implémentation simplifiée)
             keywords = analysis.get('keywords', [])
@@ -306,7 +486,8 @@ Génère maintenant une réponse optimale selon l'analyse fournie:
         
         return '\n\n'.join(relevant_paragraphs) if relevant_paragraphs else context[:1000] + "..."
     
-    def process_question(self, user_question: str, contextual_data: Dict) -> Dict:
+    def process_question(self, user_question: str, contextual_data: Dict,
+                         speculative: Optional[bool] = None) -> Dict:
         """
         Pipeline complet: Analyse + Génération de réponse
         
@@ -317,6 +498,14 @@ Génère maintenant une réponse optimale selon l'analyse fournie:
         print(f"📝 Question: {user_question}")
         print(f"⏰ Moment: {contextual_data['current_time_formatted']}")
         
+        speculative = self.speculative if speculative is None else speculative
+        if speculative and not contextual_data.get('time_references'):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return run_coroutine(self.process_question_speculative(user_question, contextual_data))
+            print("⚠️ Boucle asyncio déjà active, exécution séquentielle")
+        
         # Étape 1: Analyse de la question
         analysis = self.analyze_question(user_question, contextual_data)
         
@@ -330,6 +519,84 @@ Génère maintenant une réponse optimale selon l'analyse fournie:
             'timestamp': datetime.now().isoformat(),
             'context_used': len(contextual_data['priority_context'])
         }
+    
+    def analysis_matches_default(self, analysis: Dict) -> bool:
+        return all(analysis.get(field) == DEFAULT_ANALYSIS[field] for field in self.SPECULATION_MATCH_FIELDS)
+    
+    async def process_question_speculative(self, user_question: str, contextual_data: Dict) -> Dict:
+        """
+        Exécution spéculative: le répondeur démarre tout de suite avec la stratégie
+        par défaut pendant que l'analyseur tourne. Si l'analyse concorde, la réponse
+        spéculative est gardée (latence = max des deux appels au lieu de la somme);
+        sinon elle est annulée et le répondeur est relancé avec la vraie analyse.
+        """
+        started = time.perf_counter()
+        timings = {}
+        
+        async def timed(name, coroutine):
+            begin = time.perf_counter()
+            try:
+                return await coroutine
+            finally:
+                timings[name] = time.perf_counter() - begin
+        
+        analysis_task = asyncio.create_task(
+            timed('analysis', self.aanalyze_question(user_question, contextual_data)))
+        speculative_task = asyncio.create_task(
+            timed('speculative', self.agenerate_response(user_question, DEFAULT_ANALYSIS, contextual_data)))
+        
+        analysis = await analysis_task
+        hit = self.analysis_matches_default(analysis)
+        
+        if hit:
+            response = await speculative_task
+            elapsed = time.perf_counter() - started
+            # Version séquentielle: analyse puis réponse
+            saved = max(0.0, timings['analysis'] + timings['speculative'] - elapsed)
+            wasted = 0.0
+            print(f"🎯 Spéculation réussie: {saved * 1000:.0f} ms gagnées")
+        else:
+            speculative_task.cancel()
+            try:
+                await speculative_task
+            except asyncio.CancelledError:
+                pass
+            wasted = timings.get('speculative', 0.0)
+            saved = 0.0
+            print(f"↩️ Spéculation ratée ({analysis.get('context_strategy')}/{analysis.get('response_style')}), relance du répondeur")
+            response = await self.agenerate_response(user_question, analysis, contextual_data)
+            elapsed = time.perf_counter() - started
+        
+        with self.stats_lock:
+            self.speculation_stats['attempts'] += 1
+            self.speculation_stats['hits' if hit else 'misses'] += 1
+            self.speculation_stats['saved_seconds'] += saved
+            self.speculation_stats['wasted_seconds'] += wasted
+        
+        return {
+            'response': response,
+            'analysis': analysis,
+            'timestamp': datetime.now().isoformat(),
+            'context_used': len(contextual_data['priority_context']),
+            'speculation': {
+                'hit': hit,
+                'analysis_ms': round(timings['analysis'] * 1000, 1),
+                'total_ms': round(elapsed * 1000, 1),
+                'saved_ms': round(saved * 1000, 1),
+                'wasted_ms': round(wasted * 1000, 1)
+            }
+        }
+    
+    def get_speculation_stats(self) -> Dict:
+        """Taux de réussite et latence gagnée par l'exécution spéculative"""
+        with self.stats_lock:
+            stats = dict(self.speculation_stats)
+        attempts = stats['attempts']
+        stats['hit_rate'] = round(stats['hits'] / attempts, 3) if attempts else None
+        stats['avg_saved_ms'] = round(stats['saved_seconds'] * 1000 / attempts, 1) if attempts else None
+        stats['saved_seconds'] = round(stats['saved_seconds'], 3)
+        stats['wasted_seconds'] = round(stats['wasted_seconds'], 3)
+        return stats
 
 # Fonction utilitaire pour tester le système
 def test_multi_agent_system():
@@ -0,0 +1,391 @@
+# router.py - Routage des requêtes vers les nœuds backend par hachage cohérent du video_id
+"""
+Front de routage pour déployer plusieurs backends app.py
+
+Toutes les questions sur une même vidéo arrivent sur le même nœud: ses caches
+(transcript, fenêtres de contexte, mémoire de conversation) restent chauds et
+ne sont pas dupliqués. L'anneau utilise des nœuds virtuels: quand un nœud
+rejoint ou quitte le cluster, seules ~1/N des vidéos changent de propriétaire.
+
+Test local avec plusieurs processus:
+    FLASK_PORT=5001 python app.py
+    FLASK_PORT=5002 python app.py
+    python router.py --nodes http://127.0.0.1:5001,http://127.0.0.1:5002 --port 5000
+
+Ajout/retrait de nœuds (POST/DELETE /router/nodes): jeton ROUTER_ADMIN_TOKEN
+(en-tête "Authorization: Bearer <jeton>"); sans jeton configuré, seules les
+requêtes venant de la machine du routeur sont acceptées.
+
+Une requête n'est reroutée vers le nœud suivant que si la connexion n'a pas pu
+être établie: après l'envoi du corps (POST /ask), un timeout de lecture doublerait
+l'appel LLM et marquerait en panne un nœud simplement lent.
+"""
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import argparse
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+from flask import Flask, Response, jsonify, request
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+import requests
+
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+
+class ConsistentHashRing:
+    """Anneau de hachage cohérent avec nœuds virtuels"""
+
+    def __init__(self, nodes: Optional[List[str]] = None, vnodes: int = 100):
+        self.vnodes = vnodes
+        self.ring = []  # hachages triés
+        self.owners = {}  # hachage -> nœud
+        self.nodes = set()
+        self.lock = threading.Lock()
+        for node in nodes or []:
+            self.add_node(node)
+
+    @staticmethod
+    def hash_key(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def add_node(self, node: str) -> None:
+        with self.lock:
+            if node in self.nodes:
+                return
+            self.nodes.add(node)
+            for i in range(self.vnodes):
+                point = self.hash_key(f"{node}#{i}")
+                self.owners[point] = node
+            self.ring = sorted(self.owners)
+
+    def remove_node(self, node: str) -> None:
+        with self.lock:
+            if node not in self.nodes:
+                return
+            self.nodes.discard(node)
+            self.owners = {point: owner for point, owner in self.owners.items() if owner != node}
+            self.ring = sorted(self.owners)
+
+    def get_nodes(self, key: str, count: int = 1) -> List[str]:
+        """Propriétaire de la clé puis les nœuds suivants sur l'anneau (pour le repli)"""
+        with self.lock:
+            if not self.ring:
+                return []
+            position = bisect_right(self.ring, self.hash_key(key)) % len(self.ring)
+            found = []
+            for step in range(len(self.ring)):
+                node = self.owners[self.ring[(position + step) % len(self.ring)]]
+                if node not in found:
+                    found.append(node)
+                    if len(found) == count:
+                        break
+            return found
+
+    def get_node(self, key: str) -> Optional[str]:
+        nodes = self.get_nodes(key)
+        return nodes[0] if nodes else None
+
+
+class BackendPool:
+    """Nœuds configurés et leur état de santé; seuls les nœuds sains sont sur l'anneau"""
+
+    def __init__(self, nodes: List[str], vnodes: int = 100, health_interval: float = 5.0,
+                 health_timeout: float = 2.0, failure_threshold: int = 2):
+        self.ring = ConsistentHashRing(vnodes=vnodes)
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.failure_threshold = failure_threshold
+        self.status = {}  # nœud -> {'healthy', 'failures', 'last_check'}
+        self.lock = threading.Lock()
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node: str) -> None:
+        node = node.rstrip("/")
+        with self.lock:
+            self.status.setdefault(node, {'healthy': True, 'failures': 0, 'last_check': None})
+        self.ring.add_node(node)
+        print(f"➕ Nœud ajouté: {node}")
+
+    def remove_node(self, node: str) -> None:
+        node = node.rstrip("/")
+        with self.lock:
+            self.status.pop(node, None)
+        self.ring.remove_node(node)
+        print(f"➖ Nœud retiré: {node}")
+
+    def mark_failure(self, node: str) -> None:
+        with self.lock:
+            status = self.status.get(node)
+            if status is None:
+                return
+            status['failures'] += 1
+            unhealthy = status['healthy'] and status['failures'] >= self.failure_threshold
+            if unhealthy:
+                status['healthy'] = False
+        if unhealthy:
+            self.ring.remove_node(node)
+            print(f"🔴 Nœud hors service: {node}")
+
+    def mark_success(self, node: str) -> None:
+        with self.lock:
+            status = self.status.get(node)
+            if status is None:
+                return
+            status['failures'] = 0
+            recovered = not status['healthy']
+            status['healthy'] = True
+        if recovered:
+            self.ring.add_node(node)
+            print(f"🟢 Nœud de retour: {node}")
+
+    def check_health(self) -> None:
+        for node in list(self.status):
+            try:
+                # Readiness: un nœud qui préchauffe ses caches n'entre pas encore sur l'anneau
+                response = requests.get(f"{node}/health/ready", timeout=self.health_timeout)
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            with self.lock:
+                if node in self.status:
+                    self.status[node]['last_check'] = time.time()
+            if ok:
+                self.mark_success(node)
+            else:
+                self.mark_failure(node)
+
+    def start_health_checks(self) -> None:
+        def loop():
+            while True:
+                self.check_health()
+                time.sleep(self.health_interval)
+
+        threading.Thread(target=loop, daemon=True, name="router-health").start()
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {node: dict(status) for node, status in self.status.items()}
+
+
+def connection_refused(error: requests.RequestException) -> bool:
+    """Vrai si la connexion au nœud n'a jamais été établie (aucun octet de la requête envoyé)"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.ConnectionError) or not error.args:
+        return False
+    reason = getattr(error.args[0], 'reason', error.args[0])  # MaxRetryError -> cause
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+def create_router(pool: BackendPool, forward_timeout: float = 120.0,
+                  admin_token: Optional[str] = None) -> Flask:
+    app = Flask(__name__)
+    sessions = threading.local()
+    search_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="router-search")
+
+    def http_session() -> requests.Session:
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        return sessions.session
+
+    def forwarded_headers() -> Dict:
+        headers = {'Content-Type': request.headers.get('Content-Type', 'application/json')}
+        # Transcripts envoyés par l'extension: corps gzip + hash du contenu
+        for header in ('Content-Encoding', 'X-Transcript-Hash'):
+            if header in request.headers:
+                headers[header] = request.headers[header]
+        return headers
+
+    def forward(video_id: Optional[str]):
+        if not video_id:
+            return jsonify({"error": "video_id requis pour le routage"}), 400
+
+        # Propriétaire puis voisins sur l'anneau si le propriétaire ne répond pas
+        candidates = pool.ring.get_nodes(video_id, count=2)
+        if not candidates:
+            return jsonify({"error": "Aucun nœud backend disponible"}), 503
+
+        for node in candidates:
+            try:
+                upstream = http_session().request(
+                    request.method,
+                    f"{node}{request.full_path.rstrip('?')}",
+                    data=request.get_data(),
+                    headers=forwarded_headers(),
+                    timeout=forward_timeout,
+                )
+            except requests.RequestException as e:
+                if connection_refused(e):
+                    print(f"⚠️ Nœud injoignable {node}: {e}")
+                    pool.mark_failure(node)
+                    continue
+                # Requête déjà envoyée: la rejouer ailleurs doublerait le travail (et l'appel LLM)
+                print(f"⚠️ Échec de transfert vers {node} après envoi: {e}")
+                status = 504 if isinstance(e, requests.Timeout) else 502
+                return jsonify({"error": "Le nœud backend n'a pas répondu", "video_id": video_id,
+                                "node": node}), status
+
+            pool.mark_success(node)
+            response = Response(upstream.content, status=upstream.status_code,
+                                content_type=upstream.headers.get('Content-Type'))
+            for header in ('Retry-After',):
+                if header in upstream.headers:
+                    response.headers[header] = upstream.headers[header]
+            response.headers['X-Routed-To'] = node
+            return response
+
+        return jsonify({"error": "Nœuds backend injoignables", "video_id": video_id}), 502
+
+    @app.route('/ask', methods=['POST'])
+    @app.route('/ask/<path:variant>', methods=['POST'])
+    def route_ask(variant=None):
+        data = request.get_json(force=True, silent=True) or {}
+        return forward(data.get("video_id"))
+
+    @app.route('/conversation/<action>/<video_id>', methods=['GET', 'POST'])
+    def route_conversation(action, video_id):
+        return forward(video_id)
+
+    @app.route('/transcript/<video_id>', methods=['GET'])
+    def route_transcript(video_id):
+        return forward(video_id)
+
+    @app.route('/transcript/upload/<video_id>', methods=['GET', 'POST'])
+    def route_transcript_upload(video_id):
+        return forward(video_id)
+
+    @app.route('/search', methods=['GET'])
+    def route_search():
+        """Chaque nœud n'indexe que ses vidéos: la recherche interroge tous les nœuds et fusionne"""
+        started = time.perf_counter()
+        nodes = sorted(pool.ring.nodes)
+        if not nodes:
+            return jsonify({"error": "Aucun nœud backend disponible"}), 503
+        try:
+            limit = min(max(int(request.args.get("limit", 10)), 1), 50)
+        except ValueError:
+            return jsonify({"error": "limit doit être un entier"}), 400
+        params = list(request.args.items(multi=True))
+
+        def query(node):
+            try:
+                upstream = http_session().get(f"{node}/search", params=params, timeout=forward_timeout)
+            except requests.RequestException as e:
+                if connection_refused(e):
+                    pool.mark_failure(node)
+                return node, None, str(e)
+            if upstream.status_code != 200:
+                return node, None, f"HTTP {upstream.status_code}"
+            return node, upstream.json(), None
+
+        hits, failed = [], {}
+        index = {'videos': 0, 'passages': 0, 'indexed_hours': 0.0}
+        for node, result, error in search_executor.map(query, nodes):
+            if result is None:
+                failed[node] = error
+                continue
+            hits.extend(result.get('hits', []))
+            for key in index:
+                index[key] += result.get('index', {}).get(key, 0)
+
+        if failed and len(failed) == len(nodes):
+            return jsonify({"error": "Nœuds backend injoignables", "failed_nodes": failed}), 502
+
+        # Scores BM25 calculés avec les statistiques de chaque nœud: comparables en pratique
+        # car le hachage répartit les vidéos uniformément
+        hits.sort(key=lambda hit: hit.get('score', 0), reverse=True)
+        return jsonify({
+            "query": request.args.get("q"),
+            "hits": hits[:limit],
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+            "nodes": len(nodes),
+            "failed_nodes": failed,
+            "index": dict(index, indexed_hours=round(index['indexed_hours'], 1))
+        })
+
+    @app.route('/router/nodes', methods=['GET'])
+    def list_nodes():
+        return jsonify({
+            "nodes": pool.snapshot(),
+            "ring_nodes": sorted(pool.ring.nodes),
+            "vnodes": pool.ring.vnodes
+        })
+
+    def admin_denied():
+        """Réponse d'erreur si l'appelant ne peut pas modifier l'anneau, sinon None"""
+        if admin_token:
+            supplied = request.headers.get('Authorization', '')
+            if hmac.compare_digest(supplied.encode(), f"Bearer {admin_token}".encode()):
+                return None
+            return jsonify({"error": "Jeton d'administration requis"}), 401
+        if request.remote_addr in LOCAL_ADDRESSES:
+            return None
+        return jsonify({"error": "Administration du routeur réservée à l'hôte local "
+                                 "(ou configurer ROUTER_ADMIN_TOKEN)"}), 403
+
+    @app.route('/router/nodes', methods=['POST'])
+    def add_node():
+        denied = admin_denied()
+        if denied is not None:
+            return denied
+        node = (request.get_json(force=True, silent=True) or {}).get("node")
+        if not node:
+            return jsonify({"error": "node requis"}), 400
+        pool.add_node(node)
+        return jsonify({"success": True, "node": node})
+
+    @app.route('/router/nodes', methods=['DELETE'])
+    def remove_node():
+        denied = admin_denied()
+        if denied is not None:
+            return denied
+        node = (request.get_json(force=True, silent=True) or {}).get("node")
+        if not node:
+            return jsonify({"error": "node requis"}), 400
+        pool.remove_node(node)
+        return jsonify({"success": True, "node": node})
+
+    @app.route('/router/owner/<video_id>', methods=['GET'])
+    def owner(video_id):
+        return jsonify({"video_id": video_id, "node": pool.ring.get_node(video_id)})
+
+    @app.route('/health', methods=['GET'])
+    def health():
+        healthy = sorted(pool.ring.nodes)
+        return jsonify({
+            "status": "ok" if healthy else "degraded",
+            "service": "YouTube AI Assistant Router",
+            "healthy_nodes": healthy,
+            "total_nodes": len(pool.snapshot())
+        }), 200 if healthy else 503
+
+    return app
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Routeur par hachage cohérent du video_id")
+    parser.add_argument("--nodes", required=True, help="URLs des backends, séparées par des virgules")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--vnodes", type=int, default=100, help="Nœuds virtuels par backend")
+    parser.add_argument("--health-interval", type=float, default=5.0)
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout de transfert (secondes)")
+    parser.add_argument("--admin-token", default=os.getenv("ROUTER_ADMIN_TOKEN"),
+                        help="Jeton requis pour POST/DELETE /router/nodes (défaut: hôte local uniquement)")
+    args = parser.parse_args(argv)
+
+    pool = BackendPool([node for node in args.nodes.split(",") if node.strip()],
+                       vnodes=args.vnodes, health_interval=args.health_interval)
+    pool.start_health_checks()
+
+    print(f"🧭 Routeur démarré sur le port {args.port} ({len(pool.status)} nœuds, {args.vnodes} nœuds virtuels chacun)")
+    create_router(pool, forward_timeout=args.timeout, admin_token=args.admin_token).run(port=args.port, threaded=True, use_reloader=False)
+
+
+if __name__ == "__main__":
+    main()
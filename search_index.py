@@ -0,0 +1,341 @@
+# search_index.py - Recherche plein texte BM25 sur tous les transcripts chargés
+"""
+Index inversé partitionné par vidéo
+
+Chaque transcript est découpé en passages d'environ 30 secondes. Une vidéo
+forme un shard compact (tableaux triés: termes, offsets, postings, fréquences);
+seules les statistiques globales (vocabulaire, fréquences documentaires,
+longueur moyenne des passages) sont partagées. Ajouter ou remplacer une
+vidéo ne touche que son shard, sans reconstruire l'index.
+
+Le texte n'est pas conservé: les extraits des meilleurs résultats sont relus
+depuis le transcript (store mmap / cache) au moment de la requête.
+"""
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import heapq
+import math
+import queue
+import re
+import threading
+import time
+import unicodedata
+
+PASSAGE_SECONDS = 30.0
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+le la les un une des du de d l au aux et ou mais donc car ni que qui quoi dont ce cet cette ces
+il elle ils elles on nous vous je tu me te se lui leur leurs son sa ses mon ma mes ton ta tes
+est sont etre a ai as avons avez ont avoir fait faire pas ne plus tres bien en dans par pour sur
+avec sans sous entre comme si alors aussi y c s n qu j m t ca ici la voila
+the a an and or but of to in on at by for with from is are was were be been it this that these
+those as not no so if then than there here we you they he she i me my our your their its do does
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Mots en minuscules, sans accents ni mots vides"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return [token for token in TOKEN_PATTERN.findall(text) if token not in STOPWORDS]
+
+
+def build_passages(transcript: Sequence[Dict], passage_seconds: float = PASSAGE_SECONDS) -> List[Tuple[int, int]]:
+    """Bornes [lo, hi) des segments de chaque passage (~passage_seconds chacun)"""
+    bounds = []
+    lo = 0
+    for i in range(1, len(transcript) + 1):
+        if i == len(transcript) or transcript[i]['start'] - transcript[lo]['start'] >= passage_seconds:
+            bounds.append((lo, i))
+            lo = i
+    return bounds
+
+
+class VideoShard:
+    """Index d'une vidéo: postings triés par identifiant de terme (format CSR)"""
+
+    __slots__ = ('video_id', 'terms', 'offsets', 'postings', 'freqs', 'max_freqs', 'lengths',
+                 'min_length', 'segment_bounds', 'starts', 'ends', 'total_length')
+
+    def __init__(self, video_id: str):
+        self.video_id = video_id
+        self.terms = array('I')      # identifiants de termes triés
+        self.offsets = array('I', [0])  # postings du terme i: offsets[i]:offsets[i + 1]
+        self.postings = array('I')   # numéros de passage
+        self.freqs = array('H')      # fréquence du terme dans le passage
+        self.max_freqs = array('H')  # fréquence maximale de chaque terme (borne de score)
+        self.lengths = array('H')    # nombre de tokens par passage
+        self.min_length = 0
+        self.segment_bounds = array('I')  # lo, hi des segments de chaque passage
+        self.starts = array('d')
+        self.ends = array('d')
+        self.total_length = 0
+
+    def postings_for(self, term_id: int) -> Optional[Tuple[int, int, int]]:
+        """(début, fin) des postings du terme et sa fréquence maximale, None si absent"""
+        i = bisect_left(self.terms, term_id)
+        if i < len(self.terms) and self.terms[i] == term_id:
+            return self.offsets[i], self.offsets[i + 1], self.max_freqs[i]
+        return None
+
+    def term_counts(self):
+        """(terme, nombre de passages le contenant), pour la mise à jour des statistiques globales"""
+        for i, term_id in enumerate(self.terms):
+            yield term_id, self.offsets[i + 1] - self.offsets[i]
+
+    @property
+    def passage_count(self) -> int:
+        return len(self.lengths)
+
+    @property
+    def duration(self) -> float:
+        return self.ends[-1] if self.ends else 0.0
+
+
+class TranscriptSearchIndex:
+    """
+    Index BM25 global, un shard par vidéo
+
+    Args:
+        loader: video_id -> transcript, pour construire les extraits des résultats
+    """
+
+    def __init__(self, loader: Optional[Callable[[str], Sequence[Dict]]] = None,
+                 passage_seconds: float = PASSAGE_SECONDS):
+        self.loader = loader
+        self.passage_seconds = passage_seconds
+        self.shards: Dict[str, VideoShard] = {}
+        self.vocabulary: Dict[str, int] = {}
+        self.document_frequency = array('I')  # par identifiant de terme
+        self.passage_count = 0
+        self.total_length = 0
+        self.total_duration = 0.0
+        self.lock = threading.RLock()
+
+        # Indexation en arrière-plan des transcripts qui arrivent pendant les requêtes
+        self.pending = set()
+        self.queue = queue.Queue()
+        self.worker = None
+
+    def __contains__(self, video_id: str) -> bool:
+        return video_id in self.shards
+
+    def add_video(self, video_id: str, transcript: Sequence[Dict]) -> VideoShard:
+        """Indexe (ou réindexe) une vidéo; seul son shard et les compteurs globaux changent"""
+        bounds = build_passages(transcript, self.passage_seconds)
+        passage_terms = []
+        for lo, hi in bounds:
+            tokens = tokenize(" ".join(transcript[i]['text'] for i in range(lo, hi)))
+            passage_terms.append(Counter(tokens))
+
+        shard = VideoShard(video_id)
+        for (lo, hi), counts in zip(bounds, passage_terms):
+            last = transcript[hi - 1]
+            shard.segment_bounds.extend((lo, hi))
+            shard.starts.append(float(transcript[lo]['start']))
+            shard.ends.append(float(last['start']) + float(last['duration']))
+            length = min(sum(counts.values()), 65535)
+            shard.lengths.append(length)
+            shard.total_length += length
+        shard.min_length = min(shard.lengths) if shard.lengths else 0
+
+        with self.lock:
+            by_term: Dict[int, List[Tuple[int, int]]] = {}
+            for passage, counts in enumerate(passage_terms):
+                for token, count in counts.items():
+                    term_id = self.vocabulary.get(token)
+                    if term_id is None:
+                        term_id = self.vocabulary[token] = len(self.vocabulary)
+                        self.document_frequency.append(0)
+                    by_term.setdefault(term_id, []).append((passage, min(count, 65535)))
+
+            for term_id in sorted(by_term):
+                shard.terms.append(term_id)
+                for passage, count in by_term[term_id]:
+                    shard.postings.append(passage)
+                    shard.freqs.append(count)
+                shard.offsets.append(len(shard.postings))
+                shard.max_freqs.append(max(count for _, count in by_term[term_id]))
+
+            self._remove_shard_stats(self.shards.get(video_id))
+            for term_id, count in shard.term_counts():
+                self.document_frequency[term_id] += count
+            self.passage_count += shard.passage_count
+            self.total_length += shard.total_length
+            self.total_duration += shard.duration
+            self.shards[video_id] = shard
+        return shard
+
+    def remove_video(self, video_id: str) -> None:
+        with self.lock:
+            self._remove_shard_stats(self.shards.pop(video_id, None))
+
+    def _remove_shard_stats(self, shard: Optional[VideoShard]) -> None:
+        if shard is None:
+            return
+        for term_id, count in shard.term_counts():
+            self.document_frequency[term_id] -= count
+        self.passage_count -= shard.passage_count
+        self.total_length -= shard.total_length
+        self.total_duration -= shard.duration
+
+    def submit(self, video_id: str, transcript: Sequence[Dict]) -> None:
+        """Indexation asynchrone (ignorée si la vidéo est déjà indexée ou en attente)"""
+        if not transcript or video_id in self.shards:
+            return
+        with self.lock:
+            if video_id in self.pending or video_id in self.shards:
+                return
+            self.pending.add(video_id)
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._index_loop, daemon=True, name="search-index")
+                self.worker.start()
+        self.queue.put((video_id, transcript))
+
+    def _index_loop(self) -> None:
+        while True:
+            video_id, transcript = self.queue.get()
+            try:
+                self.add_video(video_id, transcript)
+            except Exception as e:
+                print(f"⚠️ Indexation de {video_id} impossible: {e}")
+            finally:
+                with self.lock:
+                    self.pending.discard(video_id)
+
+    def index_store(self, store) -> int:
+        """Indexe les transcripts du store absents de l'index (lecture sans mmap persistant)"""
+        indexed = 0
+        for video_id in store.video_ids():
+            if video_id in self.shards:
+                continue
+            segments = store.read_segments(video_id)
+            if segments:
+                self.add_video(video_id, segments)
+                indexed += 1
+        return indexed
+
+    def search(self, query: str, limit: int = 10, per_video: int = 3,
+               video_ids: Optional[Sequence[str]] = None) -> Dict:
+        """
+        Passages les plus pertinents (BM25) sur toutes les vidéos indexées
+
+        Returns:
+            {'hits': [{'video_id', 'start', 'end', 'timestamp', 'score', 'snippet'}], 'latency_ms', ...}
+        """
+        started = time.perf_counter()
+        tokens = tokenize(query)
+        with self.lock:
+            passage_count = self.passage_count
+            average_length = self.total_length / passage_count if passage_count else 1.0
+            weights = []
+            for token in set(tokens):
+                term_id = self.vocabulary.get(token)
+                if term_id is None or not self.document_frequency[term_id]:
+                    continue
+                frequency = self.document_frequency[term_id]
+                idf = math.log(1 + (passage_count - frequency + 0.5) / (frequency + 0.5))
+                weights.append((term_id, idf))
+            if video_ids is not None:
+                shards = [self.shards[v] for v in video_ids if v in self.shards]
+            else:
+                shards = list(self.shards.values())
+
+        # Borne supérieure du score de chaque shard (fréquence max, passage le plus court):
+        # les shards sont évalués par borne décroissante et on s'arrête dès qu'aucun
+        # ne peut plus entrer dans le top (les termes fréquents ne coûtent plus tout l'index)
+        candidates = []
+        for shard in shards:
+            matched = []
+            bound = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * shard.min_length / average_length)
+            for term_id, idf in weights:
+                found = shard.postings_for(term_id)
+                if found is not None:
+                    matched.append((found[0], found[1], idf))
+                    bound += idf * found[2] * (BM25_K1 + 1) / (found[2] + norm)
+            if matched:
+                candidates.append((bound, shard.video_id, shard, matched))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+        best = []  # tas (score, video_id, passage) des meilleurs résultats
+        scored_videos = 0
+        for bound, video_id, shard, matched in candidates:
+            if len(best) == limit and bound <= best[0][0]:
+                break
+            scored_videos += 1
+            scores = {}
+            lengths, postings, freqs = shard.lengths, shard.postings, shard.freqs
+            norms = [BM25_K1 * (1 - BM25_B + BM25_B * length / average_length) for length in lengths]
+            for begin, end, idf in matched:
+                factor = idf * (BM25_K1 + 1)
+                for k in range(begin, end):
+                    passage = postings[k]
+                    tf = freqs[k]
+                    scores[passage] = scores.get(passage, 0.0) + factor * tf / (tf + norms[passage])
+            for passage, score in heapq.nlargest(per_video, scores.items(), key=lambda item: item[1]):
+                entry = (score, video_id, passage)
+                if len(best) < limit:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+
+        hits = []
+        for score, video_id, passage in sorted(best, reverse=True):
+            shard = self.shards.get(video_id)
+            if shard is None or passage >= shard.passage_count:
+                continue  # vidéo réindexée entre-temps
+            start = shard.starts[passage]
+            hits.append({
+                'video_id': video_id,
+                'start': round(start, 2),
+                'end': round(shard.ends[passage], 2),
+                'timestamp': f"{int(start // 60):02d}:{int(start % 60):02d}",
+                'score': round(score, 4),
+                'snippet': self.snippet(shard, passage, tokens),
+            })
+
+        return {
+            'query': query,
+            'hits': hits,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 2),
+            'matched_videos': len(candidates),
+            'scored_videos': scored_videos,
+        }
+
+    def snippet(self, shard: VideoShard, passage: int, tokens: List[str], width: int = 220) -> str:
+        """Extrait du passage centré sur le premier terme de la requête"""
+        if self.loader is None:
+            return ""
+        try:
+            transcript = self.loader(shard.video_id)
+            lo, hi = shard.segment_bounds[2 * passage], shard.segment_bounds[2 * passage + 1]
+            text = " ".join(transcript[i]['text'] for i in range(lo, min(hi, len(transcript))))
+        except Exception as e:
+            print(f"⚠️ Extrait indisponible pour {shard.video_id}: {e}")
+            return ""
+
+        folded = "".join(char for char in unicodedata.normalize("NFKD", text.lower())
+                         if not unicodedata.combining(char))
+        positions = [folded.find(token) for token in tokens]
+        positions = [p for p in positions if p >= 0]
+        # Les accents retirés décalent légèrement les positions: approximation suffisante pour centrer
+        center = min(positions) if positions else 0
+        begin = max(0, center - width // 3)
+        excerpt = text[begin:begin + width].strip()
+        return ("..." if begin > 0 else "") + excerpt + ("..." if begin + width < len(text) else "")
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                'videos': len(self.shards),
+                'passages': self.passage_count,
+                'vocabulary': len(self.vocabulary),
+                'indexed_hours': round(self.total_duration / 3600, 1),
+                'pending': len(self.pending),
+            }
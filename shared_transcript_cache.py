@@ -0,0 +1,376 @@
+# shared_transcript_cache.py - Cache de transcripts partagé entre processus workers
+"""
+Cache de transcripts en mémoire partagée (multiprocessing.shared_memory)
+
+Chaque transcript est copié une seule fois par machine dans un segment de
+mémoire partagée, au même format binaire que le store (transcript_store.py).
+Un petit index partagé (table de hachage à adressage ouvert) associe chaque
+video_id à son segment; tous les workers lisent les transcripts sans copie.
+
+- Comptage de références: chaque slot liste les PID des workers qui utilisent le segment
+- Éviction LRU des segments sans utilisateur vivant quand le plafond d'octets est atteint
+- Les PID de workers morts sont ignorés puis retirés (os.kill(pid, 0))
+- Verrou inter-processus via fcntl.flock (les workers n'ont pas besoin d'un parent commun);
+  un cache créé avant fork (gunicorn --preload) rouvre son fichier de verrou dans chaque enfant
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Sequence
+import atexit
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+import weakref
+
+from transcript_store import MappedTranscript, encode_transcript
+
+try:
+    import fcntl
+except ImportError:  # Windows: pas de verrou inter-processus, mode partagé indisponible
+    fcntl = None
+
+INDEX_MAGIC = b"YTSC"
+INDEX_VERSION = 1
+MAX_HOLDERS = 16
+
+# En-tête: magic, version, nb_slots, octets utilisés, plafond d'octets
+INDEX_HEADER = struct.Struct("<4sIIxxxxQQ")
+# Slot: état, video_id, nom du segment, taille, dernier accès, PID des utilisateurs
+SLOT = struct.Struct("<B7x64s40sQd" + "i" * MAX_HOLDERS)
+
+SLOT_EMPTY, SLOT_USED, SLOT_DELETED = 0, 1, 2
+
+_instances = weakref.WeakSet()
+
+
+def _after_fork_in_child() -> None:
+    for cache in list(_instances):
+        cache._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _open_shared_memory(name: str, create: bool = False, size: int = 0) -> shared_memory.SharedMemory:
+    """
+    Ouvre un segment sans le confier au resource_tracker
+
+    Sinon Python supprime le segment à la sortie du premier processus qui l'a
+    ouvert, alors qu'il doit survivre tant que d'autres workers l'utilisent.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    except TypeError:
+        # Python < 3.13: pas de paramètre track
+        shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+def _unlink_shared_memory(shm: shared_memory.SharedMemory) -> None:
+    """Supprime le segment (unlink() désinscrit aussi du resource_tracker avant Python 3.13)"""
+    try:
+        from multiprocessing import resource_tracker
+        if not hasattr(shm, "_track"):
+            resource_tracker.register(shm._name, "shared_memory")
+    except Exception:
+        pass
+    shm.unlink()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedTranscriptCache:
+    """Cache de transcripts partagé par tous les workers d'une machine"""
+
+    def __init__(self, name: str = "ytai", capacity_bytes: int = 512 * 1024 * 1024,
+                 slots: int = 4096, max_local: int = 256, lock_dir: Optional[str] = None):
+        if fcntl is None:
+            raise RuntimeError("Cache partagé indisponible sur cette plateforme (fcntl requis)")
+        self.name = name
+        self.max_local = max_local
+        self._local = OrderedDict()  # video_id -> (nom du segment, MappedTranscript)
+        self._thread_lock = threading.Lock()
+
+        self._lock_path = os.path.join(lock_dir or tempfile.gettempdir(), f"{name}_transcript_cache.lock")
+        self._lock_file = open(self._lock_path, "a+b")
+        _instances.add(self)
+
+        index_size = INDEX_HEADER.size + SLOT.size * slots
+        with self._locked():
+            try:
+                self._index = _open_shared_memory(f"{name}_index", create=True, size=index_size)
+                INDEX_HEADER.pack_into(self._index.buf, 0, INDEX_MAGIC, INDEX_VERSION, slots, 0, capacity_bytes)
+                print(f"🧠 Index de cache partagé créé: {slots} slots, plafond {capacity_bytes // (1024 * 1024)} Mo")
+            except FileExistsError:
+                self._index = _open_shared_memory(f"{name}_index")
+
+            magic, version, self.slots, _, _ = INDEX_HEADER.unpack_from(self._index.buf, 0)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION:
+                raise RuntimeError(f"Index de cache partagé incompatible: {name}_index")
+
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls) -> "SharedTranscriptCache":
+        return cls(
+            name=os.getenv("SHARED_CACHE_NAME", "ytai"),
+            capacity_bytes=int(os.getenv("SHARED_CACHE_BYTES", str(512 * 1024 * 1024))),
+            slots=int(os.getenv("SHARED_CACHE_SLOTS", "4096")),
+        )
+
+    @property
+    def pid(self) -> int:
+        """PID du processus courant (pas celui qui a créé le cache, qui a pu forker depuis)"""
+        return os.getpid()
+
+    def _after_fork(self) -> None:
+        """
+        Dans un enfant forké: le descripteur hérité partage sa description de fichier
+        avec le parent, flock n'exclurait plus rien entre eux. On rouvre le fichier,
+        on repart d'un verrou de threads neuf et l'enfant se réinscrit comme
+        utilisateur des segments au prochain get().
+        """
+        self._thread_lock = threading.Lock()
+        if not self._lock_file.closed:
+            self._lock_file.close()
+            self._lock_file = open(self._lock_path, "a+b")
+        self._local = OrderedDict()
+
+    # --- Verrouillage -------------------------------------------------------
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    # --- Accès à l'index (appelants sous verrou) ---------------------------
+
+    def _slot_offset(self, index: int) -> int:
+        return INDEX_HEADER.size + index * SLOT.size
+
+    def _read_slot(self, index: int):
+        state, video_id, segment, size, last_access, *holders = SLOT.unpack_from(
+            self._index.buf, self._slot_offset(index))
+        return state, video_id.rstrip(b"\0").decode(), segment.rstrip(b"\0").decode(), size, last_access, holders
+
+    def _write_slot(self, index: int, state: int, video_id: str, segment: str,
+                    size: int, last_access: float, holders: Sequence[int]) -> None:
+        holders = list(holders)[:MAX_HOLDERS]
+        holders += [0] * (MAX_HOLDERS - len(holders))
+        SLOT.pack_into(self._index.buf, self._slot_offset(index), state, video_id.encode(),
+                       segment.encode(), size, last_access, *holders)
+
+    def _header(self):
+        _, _, _, used_bytes, capacity = INDEX_HEADER.unpack_from(self._index.buf, 0)
+        return used_bytes, capacity
+
+    def _set_used_bytes(self, used_bytes: int) -> None:
+        _, capacity = self._header()
+        INDEX_HEADER.pack_into(self._index.buf, 0, INDEX_MAGIC, INDEX_VERSION, self.slots,
+                               max(0, used_bytes), capacity)
+
+    def _probe(self, video_id: str):
+        """Position du slot de video_id (ou None) et premier slot libre rencontré"""
+        start = int.from_bytes(hashlib.blake2b(video_id.encode(), digest_size=8).digest(), "little") % self.slots
+        free = None
+        for step in range(self.slots):
+            index = (start + step) % self.slots
+            state, slot_video_id, *_ = self._read_slot(index)
+            if state == SLOT_EMPTY:
+                return None, free if free is not None else index
+            if state == SLOT_DELETED:
+                if free is None:
+                    free = index
+            elif slot_video_id == video_id:
+                return index, free
+        return None, free
+
+    def _live_holders(self, holders: Sequence[int]):
+        return [pid for pid in holders if pid and _pid_alive(pid)]
+
+    def _remove_slot(self, index: int) -> None:
+        state, video_id, segment, size, _, _ = self._read_slot(index)
+        self._write_slot(index, SLOT_DELETED, "", "", 0, 0.0, [])
+        used_bytes, _ = self._header()
+        self._set_used_bytes(used_bytes - size)
+        try:
+            shm = _open_shared_memory(segment)
+            shm.close()
+            _unlink_shared_memory(shm)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, needed: int) -> None:
+        """Libère des segments LRU sans utilisateur vivant jusqu'à avoir `needed` octets"""
+        used_bytes, capacity = self._header()
+        if used_bytes + needed <= capacity:
+            return
+
+        candidates = []
+        for index in range(self.slots):
+            state, video_id, segment, size, last_access, holders = self._read_slot(index)
+            if state != SLOT_USED:
+                continue
+            live = self._live_holders(holders)
+            if live != [pid for pid in holders if pid]:
+                # Nettoyage des workers morts
+                self._write_slot(index, state, video_id, segment, size, last_access, live)
+            if not live:
+                candidates.append((last_access, index, size, video_id))
+
+        for _, index, size, video_id in sorted(candidates):
+            if used_bytes + needed <= capacity:
+                break
+            self._remove_slot(index)
+            used_bytes -= size
+            print(f"🗑️ Cache partagé: éviction de {video_id} ({size} octets)")
+
+    # --- API publique ------------------------------------------------------
+
+    def get(self, video_id: str) -> Optional[MappedTranscript]:
+        """Transcript partagé (sans copie) ou None s'il n'est pas en cache"""
+        with self._locked():
+            index, _ = self._probe(video_id)
+            if index is None:
+                self._local.pop(video_id, None)
+                return None
+
+            state, _, segment, size, _, holders = self._read_slot(index)
+            if self.pid not in holders:
+                holders = self._live_holders(holders)
+                if len(holders) >= MAX_HOLDERS:
+                    holders = holders[1:]
+                holders.append(self.pid)
+            self._write_slot(index, state, video_id, segment, size, time.time(), holders)
+
+            local = self._local.get(video_id)
+            if local and local[0] == segment:
+                self._local.move_to_end(video_id)
+                return local[1]
+
+            try:
+                shm = _open_shared_memory(segment)
+            except FileNotFoundError:
+                self._remove_slot(index)
+                return None
+            transcript = MappedTranscript(shm.buf[:size], source=f"shm:{segment}", verify=False, owner=shm)
+            self._local[video_id] = (segment, transcript)
+
+            # Au-delà de max_local, ce worker libère ses transcripts les plus anciens
+            while len(self._local) > self.max_local:
+                old_video_id, _ = self._local.popitem(last=False)
+                self._drop_holder(old_video_id)
+            return transcript
+
+    def put(self, video_id: str, segments: Sequence[Dict]) -> Optional[MappedTranscript]:
+        """Copie le transcript en mémoire partagée (une fois pour toute la machine)"""
+        data = encode_transcript(list(segments))
+        with self._locked():
+            index, _ = self._probe(video_id)
+            # Sinon déjà publié par un autre worker
+            if index is None:
+                _, capacity = self._header()
+                if len(data) > capacity:
+                    print(f"⚠️ Transcript {video_id} trop volumineux pour le cache partagé")
+                    return None
+                self._evict(len(data))
+                index, free = self._probe(video_id)
+                if free is None:
+                    print("⚠️ Cache partagé plein (plus de slots libres)")
+                    return None
+
+                segment = f"{self.name}_{hashlib.blake2b(video_id.encode(), digest_size=6).hexdigest()}_{time.time_ns() % 10 ** 9}"
+                shm = _open_shared_memory(segment, create=True, size=len(data))
+                shm.buf[:len(data)] = data
+                shm.close()
+                self._write_slot(free, SLOT_USED, video_id, segment, len(data), time.time(), [])
+                used_bytes, _ = self._header()
+                self._set_used_bytes(used_bytes + len(data))
+
+        return self.get(video_id)
+
+    def release(self, video_id: str) -> None:
+        """Le worker n'utilise plus ce transcript (il devient évictable)"""
+        with self._locked():
+            self._local.pop(video_id, None)
+            self._drop_holder(video_id)
+
+    def _drop_holder(self, video_id: str) -> None:
+        index, _ = self._probe(video_id)
+        if index is None:
+            return
+        state, _, segment, size, last_access, holders = self._read_slot(index)
+        self._write_slot(index, state, video_id, segment, size, last_access,
+                         [pid for pid in holders if pid and pid != self.pid])
+
+    def stats(self) -> Dict:
+        with self._locked():
+            used_bytes, capacity = self._header()
+            entries = sum(1 for index in range(self.slots) if self._read_slot(index)[0] == SLOT_USED)
+        return {
+            'mode': 'shared',
+            'entries': entries,
+            'used_bytes': used_bytes,
+            'capacity_bytes': capacity,
+            'local_attachments': len(self._local),
+        }
+
+    def close(self) -> None:
+        """Retire ce worker de tous les slots (appelé automatiquement à la sortie)"""
+        if self._lock_file.closed:
+            return
+        try:
+            with self._locked():
+                for index in range(self.slots):
+                    state, video_id, segment, size, last_access, holders = self._read_slot(index)
+                    if state == SLOT_USED and self.pid in holders:
+                        self._write_slot(index, state, video_id, segment, size, last_access,
+                                         [pid for pid in holders if pid and pid != self.pid])
+        finally:
+            self._local.clear()
+            self._lock_file.close()
+
+    def destroy(self) -> None:
+        """Supprime tous les segments et l'index (maintenance, tous workers arrêtés)"""
+        with self._locked():
+            for index in range(self.slots):
+                if self._read_slot(index)[0] == SLOT_USED:
+                    self._remove_slot(index)
+            self._local.clear()
+        try:
+            _unlink_shared_memory(self._index)
+        except FileNotFoundError:
+            pass
+
+
+def cache_from_env() -> Optional[SharedTranscriptCache]:
+    """Cache partagé si TRANSCRIPT_CACHE_MODE=shared (sinon aucun cache inter-processus)"""
+    if os.getenv("TRANSCRIPT_CACHE_MODE", "").lower() != "shared":
+        return None
+    try:
+        return SharedTranscriptCache.from_env()
+    except (RuntimeError, OSError) as e:
+        print(f"⚠️ {e}, cache local uniquement")
+        return None
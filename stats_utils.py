@@ -0,0 +1,24 @@
+# stats_utils.py - Petits helpers statistiques partagés (sans dépendance)
+"""
+Percentiles des rapports et des décisions de latence: délai de couverture
+(hedging), SLO du délestage (degraded_mode), rapports de load_test et batch_qa.
+Un seul calcul pour que tous les chiffres soient comparables.
+"""
+from typing import Iterable, Optional
+import math
+
+
+def percentile(samples: Iterable[float], q: float) -> Optional[float]:
+    """
+    Percentile par rang le plus proche (q entre 0 et 100): plus petite valeur
+    dont au moins q% des échantillons sont inférieurs ou égaux (None sans échantillon)
+
+    >>> percentile(range(1, 101), 99), percentile(range(1, 11), 50), percentile([3, 1, 2], 0)
+    (99, 5, 1)
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    # q * n / 100 plutôt que q / 100 * n: exact pour des q et n entiers (0.07 * 100 > 7)
+    index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered) / 100) - 1))
+    return ordered[index]
@@ -0,0 +1,92 @@
+import time
+
+from agent_pipeline import DeadlineAwareAgentPipeline
+
+
+class FakeTranscriptProcessor:
+    def __init__(self, load_seconds: float = 0.0):
+        self.load_seconds = load_seconds
+
+    def get_transcript(self, video_id):
+        time.sleep(self.load_seconds)
+        return [{'start': 0.0, 'duration': 5.0, 'text': 'bonjour'}]
+
+    def local_answer(self, video_id, transcript, current_time, question):
+        return None
+
+    def apply_time_references(self, contextual_data, transcript, question):
+        return contextual_data
+
+
+class FakeMemory:
+    def __init__(self):
+        self.messages = []
+
+    def add_message(self, video_id, question, response, current_time, user_id):
+        self.messages.append(response)
+
+
+class FakeProcessor:
+    def __init__(self, load_seconds: float = 0.0):
+        self.transcript_processor = FakeTranscriptProcessor(load_seconds)
+        self.memory = FakeMemory()
+
+    def get_session_context(self, video_id, user_id, transcript, current_time):
+        return {'priority_context': []}
+
+    def ask_question_with_memory(self, video_id, current_time, question, user_id, timeout=None):
+        return {'response': 'appel unique', 'answer_mode': 'llm', 'degraded': False}
+
+
+class SlowAnalyzerAssistant:
+    """L'analyseur consomme tout son timeout puis échoue, comme un appel LLM trop lent"""
+
+    def invoke_analyzer(self, question, contextual_data, timeout=None):
+        time.sleep(timeout)
+        raise TimeoutError("Request timed out")
+
+    def invoke_responder(self, question, analysis, contextual_data, timeout=None):
+        return "réponse"
+
+
+class FailingAnalyzerAssistant(SlowAnalyzerAssistant):
+    def invoke_analyzer(self, question, contextual_data, timeout=None):
+        raise ValueError("HTTP 500")
+
+
+def make_pipeline(assistant, load_seconds: float = 0.0) -> DeadlineAwareAgentPipeline:
+    pipeline = DeadlineAwareAgentPipeline(FakeProcessor(load_seconds), assistant)
+    pipeline.estimates['analysis'].value = 0.05
+    pipeline.estimates['generation'].value = 0.05
+    return pipeline
+
+
+def test_analysis_timeout_updates_estimate():
+    pipeline = make_pipeline(SlowAnalyzerAssistant())
+    result = pipeline.run("vid", 10.0, "question", budget_seconds=0.4)
+    assert result['path'] == 'agents_default_analysis'
+    assert result['response'] == "réponse"
+    assert not result['deadline_exceeded']
+    # ~0.35 s observés avec alpha=0.2: l'estimation a nettement augmenté
+    assert pipeline.estimates['analysis'].value > 0.1
+
+
+def test_fast_analysis_error_leaves_estimate_alone():
+    pipeline = make_pipeline(FailingAnalyzerAssistant())
+    pipeline.run("vid", 10.0, "question", budget_seconds=0.4)
+    assert pipeline.estimates['analysis'].value == 0.05
+
+
+def test_budget_exhausted_is_flagged():
+    pipeline = make_pipeline(SlowAnalyzerAssistant(), load_seconds=0.2)
+    result = pipeline.run("vid", 10.0, "question", budget_seconds=0.1)
+    assert result['deadline_exceeded']
+    assert 'error' in result
+
+
+def test_other_errors_are_not_deadline_errors():
+    pipeline = make_pipeline(SlowAnalyzerAssistant())
+    pipeline.processor.transcript_processor.get_transcript = lambda video_id: []
+    result = pipeline.run("vid", 10.0, "question")
+    assert 'error' in result
+    assert not result['deadline_exceeded']
@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("flask")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Comme gunicorn app:app / flask run: le module est importé, create_app() n'est jamais appelé
+SCRIPT = """
+import json
+import app
+client = app.app.test_client()
+health = client.get('/health')
+transcript = client.get('/transcript/vid1')
+print(json.dumps({'health': health.status_code, 'status': health.get_json().get('status'),
+                  'transcript': transcript.status_code,
+                  'segments': (transcript.get_json() or {}).get('segments_count')}))
+"""
+
+
+def test_routes_work_without_calling_create_app(tmp_path):
+    fixtures = tmp_path / "fixtures"
+    fixtures.mkdir()
+    (fixtures / "vid1.json").write_text(json.dumps([{"start": 0, "duration": 1, "text": "bonjour"}]))
+    env = dict(os.environ,
+               TRANSCRIPT_STORE_DIR=str(tmp_path / "store"),
+               TRANSCRIPT_SOURCE_DIR=str(fixtures),
+               WARMUP_SNAPSHOT_PATH=str(tmp_path / "snapshot.json"),
+               COST_LEDGER_PATH="off")
+    output = subprocess.run([sys.executable, "-c", SCRIPT], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert output.returncode == 0, output.stderr
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    assert result == {'health': 200, 'status': 'ok', 'transcript': 200, 'segments': 1}
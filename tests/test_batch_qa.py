@@ -0,0 +1,66 @@
+import json
+import threading
+
+from batch_qa import BatchQARunner, read_cases
+
+
+class FakeProcessor:
+    """Le premier cas de vid1 attend que le transcript de vid2 soit en cours de chargement"""
+
+    def __init__(self):
+        self.loading = {}
+        self.prefetched_during_cases = []
+
+    def get_transcript(self, video_id):
+        self.loading.setdefault(video_id, threading.Event()).set()
+        if video_id == 'missing':
+            raise ValueError("vidéo introuvable")
+        return [{'start': 0.0, 'duration': 5.0, 'text': f"transcript {video_id}"}]
+
+    def answer_question(self, video_id, transcript, current_time, question):
+        if video_id == 'vid1':
+            next_load = self.loading.setdefault('vid2', threading.Event())
+            self.prefetched_during_cases.append(next_load.wait(timeout=2))
+        return {'response': transcript[0]['text'], 'answer_mode': 'llm', 'degraded': False}
+
+
+def write_cases(path, cases):
+    path.write_text("".join(json.dumps(case) + "\n" for case in cases), encoding="utf-8")
+
+
+def test_next_video_loads_while_current_cases_run(tmp_path):
+    cases_path = tmp_path / "cases.jsonl"
+    write_cases(cases_path, [
+        {'id': 'a', 'video_id': 'vid1', 'current_time': 10, 'question': "q1"},
+        {'id': 'b', 'video_id': 'vid1', 'current_time': 20, 'question': "q2"},
+        {'id': 'c', 'video_id': 'vid2', 'current_time': 30, 'question': "q3"},
+    ])
+    processor = FakeProcessor()
+    runner = BatchQARunner(processor, concurrency=1)
+    summary = runner.run(read_cases(str(cases_path), 'simple'), str(tmp_path / "out.jsonl"))
+    # Avec une seule place, soumettre le second cas de vid1 bloque jusqu'à la fin du premier:
+    # vid2 doit déjà être en chargement pendant ce premier cas
+    assert processor.prefetched_during_cases[0] is True
+    assert summary['ok'] == 3
+    responses = {r['id']: r['response'] for r in runner.results}
+    assert responses == {'a': "transcript vid1", 'b': "transcript vid1", 'c': "transcript vid2"}
+
+
+def test_unavailable_transcript_fails_its_cases_only(tmp_path):
+    cases_path = tmp_path / "cases.jsonl"
+    write_cases(cases_path, [
+        {'id': 'a', 'video_id': 'missing', 'current_time': 10, 'question': "q1"},
+        {'id': 'b', 'video_id': 'vid2', 'current_time': 20, 'question': "q2"},
+    ])
+    runner = BatchQARunner(FakeProcessor())
+    summary = runner.run(read_cases(str(cases_path), 'simple'), str(tmp_path / "out.jsonl"))
+    assert (summary['ok'], summary['failed']) == (1, 1)
+    assert next(r for r in runner.results if r['id'] == 'a')['error'] == 'transcript indisponible'
+
+
+def test_summary_uses_nearest_rank_percentiles():
+    runner = BatchQARunner(FakeProcessor())
+    assert runner.summary(1.0, 0)['latency_p50_ms'] == 0.0
+    runner.results = [{'status': 'ok', 'tokens': None, 'latency_ms': float(ms)} for ms in range(1, 11)]
+    summary = runner.summary(1.0, 0)
+    assert (summary['latency_p50_ms'], summary['latency_p95_ms']) == (5.0, 10.0)
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from contextual_transcript_processor import ContextualTranscriptProcessor  # noqa: E402
+from extractive_summary import TextRankSummarizer  # noqa: E402
+from topic_segmentation import TextTilingSegmenter  # noqa: E402
+
+TOPICS = [
+    "les réseaux de neurones apprennent des poids par descente de gradient",
+    "la cuisine italienne utilise des tomates du basilic et de l'huile d'olive",
+    "le moteur thermique transforme la chaleur en travail mécanique",
+    "les volcans rejettent de la lave et des cendres pendant une éruption",
+]
+
+
+def make_transcript(minutes: int = 30):
+    rng = random.Random(7)
+    transcript = []
+    for i in range(minutes * 12):
+        words = TOPICS[(i // 120) % len(TOPICS)].split()
+        rng.shuffle(words)
+        transcript.append({'start': i * 5.0, 'duration': 5.0, 'text': " ".join(words[:6]) + f" ({i})."})
+    return transcript
+
+
+def make_processor(summary: str, chapters: bool) -> ContextualTranscriptProcessor:
+    processor = ContextualTranscriptProcessor("test", use_store=False)
+    processor.summarizer = TextRankSummarizer() if summary == 'textrank' else None
+    processor.segmenter = TextTilingSegmenter() if chapters else None
+    return processor
+
+
+@pytest.mark.parametrize("chapters", [False, True])
+@pytest.mark.parametrize("summary", ['prefix', 'textrank'])
+def test_incremental_windows_match_full_rebuild(summary, chapters):
+    processor = make_processor(summary, chapters)
+    transcript = make_transcript()
+    rng = random.Random(42)
+    state = None
+    current_time = 600.0
+    modes = set()
+    for _ in range(300):
+        move = rng.random()
+        if move < 0.5:
+            current_time += rng.uniform(0, 20)  # Lecture
+        elif move < 0.8:
+            current_time += rng.uniform(-90, 90)  # Petit saut
+        else:
+            current_time = rng.uniform(0, 1800)  # Seek lointain
+        current_time = min(max(current_time, 0.0), 1800.0)
+
+        state = processor.build_window_state(transcript, current_time, state)
+        modes.add(state.mode)
+        expected = processor.create_contextual_windows(transcript, current_time)
+        actual = dict(state.contextual_data, extended_context=list(state.contextual_data['extended_context']))
+        assert actual == expected, (state.mode, current_time)
+    assert modes == {'full', 'incremental', 'reused'}
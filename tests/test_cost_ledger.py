@@ -0,0 +1,94 @@
+import contextvars
+import threading
+
+import pytest
+
+import cost_ledger
+from cost_ledger import CostLedger, attribution, estimate_cost, get_ledger, metered
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = CostLedger(str(tmp_path / "ledger.sqlite3"), flush_interval=3600)
+    yield ledger
+    ledger.close()
+
+
+@pytest.fixture
+def fresh_singleton(monkeypatch):
+    monkeypatch.setattr(cost_ledger, "_ledger", None)
+    monkeypatch.setattr(cost_ledger, "_ledger_failed", False)
+
+
+def test_usage_aggregates_by_user_video_and_endpoint(ledger):
+    with attribution(endpoint='/ask', user_id='alice', video_id='vid1'):
+        ledger.record('gpt-4o-mini', prompt_tokens=1000, completion_tokens=100, latency_ms=120.0)
+        ledger.record('gpt-4o-mini', prompt_tokens=2000, completion_tokens=200, cached_tokens=1000,
+                      latency_ms=80.0)
+    with attribution(endpoint='/ask/agents', user_id='bob', video_id='vid2'):
+        ledger.record_failure('gpt-4o', latency_ms=5000.0, component='analyzer', status='timeout')
+    assert ledger.stats()['pending'] == 3
+    assert ledger.flush() == 3
+    assert ledger.stats() == {'path': ledger.path, 'pending': 0, 'written': 3, 'dropped': 0}
+
+    totals = ledger.usage()['totals']
+    assert (totals['calls'], totals['failed_calls']) == (3, 1)
+    assert (totals['prompt_tokens'], totals['completion_tokens'], totals['cached_tokens']) == (3000, 300, 1000)
+    expected_cost = (estimate_cost('gpt-4o-mini', 1000, 100)
+                     + estimate_cost('gpt-4o-mini', 2000, 200, cached_tokens=1000))
+    assert totals['cost_usd'] == round(expected_cost, 6)
+
+    by_user = {row['user']: row for row in ledger.usage(group_by='user')['groups']}
+    assert (by_user['alice']['calls'], by_user['bob']['calls']) == (2, 1)
+    assert by_user['alice']['avg_latency_ms'] == 100.0
+    assert [row['video'] for row in ledger.usage(group_by='video', user_id='alice')['groups']] == ['vid1']
+    by_endpoint = {row['endpoint']: row['calls'] for row in ledger.usage(group_by='endpoint')['groups']}
+    assert by_endpoint == {'/ask': 2, '/ask/agents': 1}
+    assert ledger.usage(video_id='vid2')['totals']['failed_calls'] == 1
+    with pytest.raises(ValueError):
+        ledger.usage(group_by='planet')
+
+
+def test_usage_includes_unflushed_rows(ledger):
+    ledger.record('gpt-4o', prompt_tokens=10, completion_tokens=5)
+    assert ledger.usage()['totals']['calls'] == 1
+
+
+def test_attribution_follows_a_copied_context_across_threads(ledger):
+    with attribution(endpoint='/ask', user_id='alice'), metered() as totals:
+        context = contextvars.copy_context()
+        # Thread nu: ni attribution ni cumul (c'est pourquoi le hedging copie le contexte)
+        bare = threading.Thread(target=ledger.record, args=('gpt-4o-mini',), kwargs={'prompt_tokens': 1})
+        hop = threading.Thread(target=context.run, args=(ledger.record, 'gpt-4o-mini'),
+                               kwargs={'prompt_tokens': 7, 'component': 'hedge'})
+        for thread in (bare, hop):
+            thread.start()
+            thread.join()
+    assert (totals['calls'], totals['prompt_tokens']) == (1, 7)
+    groups = {row['user']: row['prompt_tokens'] for row in ledger.usage(group_by='user')['groups']}
+    assert groups == {'alice': 7, None: 1}
+
+
+def test_unwritable_path_disables_ledger_once(tmp_path, monkeypatch, capsys, fresh_singleton):
+    blocker = tmp_path / "not_a_directory"
+    blocker.write_text("")
+    monkeypatch.setenv("COST_LEDGER_PATH", str(blocker / "ledger.sqlite3"))
+    attempts = []
+    original = cost_ledger.CostLedger
+    monkeypatch.setattr(cost_ledger, "CostLedger", lambda *args, **kwargs: attempts.append(1) or original(*args, **kwargs))
+
+    assert get_ledger() is None
+    assert get_ledger() is None
+    assert len(attempts) == 1
+    assert capsys.readouterr().out.count("Journal des coûts indisponible") == 1
+
+
+def test_get_ledger_is_a_singleton_and_can_be_turned_off(tmp_path, monkeypatch, fresh_singleton):
+    monkeypatch.setenv("COST_LEDGER_PATH", "off")
+    assert get_ledger() is None
+    monkeypatch.setenv("COST_LEDGER_PATH", str(tmp_path / "ledger.sqlite3"))
+    ledger = get_ledger()
+    try:
+        assert ledger is not None and get_ledger() is ledger
+    finally:
+        ledger.close()
@@ -0,0 +1,57 @@
+import pytest
+
+from contextual_transcript_processor import ContextualTranscriptProcessor
+from degraded_mode import verbatim_span
+from transcript_sources import TranscriptSource
+
+
+@pytest.mark.parametrize("question", [
+    "Qu'est-ce qu'il vient de dire ?",
+    "What did they just say?",
+    "Can you repeat that?",
+    "Répète stp",
+    "Il a dit quoi ?",
+    "Sorry, I didn't catch that",
+    "Tu peux répéter la dernière phrase ?",
+    "Qu'est-ce qu'il a dit à 12:30 ?",
+    "What did she say 2 minutes ago?",
+])
+def test_quote_requests(question):
+    assert verbatim_span(question, 600, 3000) is not None
+
+
+@pytest.mark.parametrize("question", [
+    "What did he say about taxes?",
+    "Qu'est-ce qu'il dit sur l'inflation ?",
+    "Il a dit combien de grammes de farine ?",
+    "Can you repeat the recipe ingredients?",
+    "Sur l'inflation, qu'est-ce qu'il dit ?",
+    "Qu'est-ce qu'il vient de dire à propos des impôts ?",
+    "Pourquoi il vient de dire ça ?",
+    "What does the speaker say is the main risk?",
+])
+def test_content_questions_go_to_the_llm(question):
+    assert verbatim_span(question, 600, 3000) is None
+
+
+def test_time_reference_sets_the_quoted_span():
+    assert verbatim_span("Qu'est-ce qu'il a dit à 12:30 ?", 600) == (735.0, 795.0, "ce qui a été dit")
+    assert verbatim_span("Qu'est-ce qu'il vient de dire ?", 600) == (570.0, 600, "ce qui vient d'être dit")
+    # Une plage trop longue n'est pas une citation utile
+    assert verbatim_span("Qu'est-ce qu'il a dit entre 10:00 et 20:00 ?", 1500) is None
+
+
+class EmptySource(TranscriptSource):
+    name = "test"
+
+    def fetch(self, video_id):
+        return []
+
+
+def test_local_answer_only_for_quote_requests():
+    processor = ContextualTranscriptProcessor("test", use_store=False, source=EmptySource())
+    processor.shedder = None  # LLM sain: pas de délestage
+    transcript = [{"start": i * 10.0, "duration": 10.0, "text": f"phrase {i}"} for i in range(100)]
+    assert processor.local_answer("vid", transcript, 600, "What did he say about taxes?") is None
+    answer = processor.local_answer("vid", transcript, 600, "What did he just say?")
+    assert answer['answer_mode'] == 'verbatim' and "phrase 58" in answer['response']
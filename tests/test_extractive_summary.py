@@ -0,0 +1,89 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from extractive_summary import TextRankSummarizer, transcript_fingerprint  # noqa: E402
+
+
+def make_transcript(texts, step=10.0):
+    return [{"start": i * step, "duration": step, "text": text} for i, text in enumerate(texts)]
+
+
+LECTURE = make_transcript([
+    "Euh donc voilà.",
+    "La descente de gradient ajuste les poids du réseau de neurones.",
+    "Euh donc voilà.",
+    "Chaque pas de gradient réduit la fonction de perte du réseau.",
+    "Le taux d'apprentissage fixe la taille du pas de gradient.",
+    "Bon.",
+    "Un taux trop grand fait diverger la descente de gradient.",
+])
+
+
+def test_split_sentences_on_punctuation_and_length():
+    summarizer = TextRankSummarizer(max_sentence_chars=30)
+    punctuated = make_transcript(["Première phrase. Deuxième", "phrase ici. Fin"])
+    assert summarizer.split_sentences(punctuated, 0, 2) == [
+        ("Première phrase.", 0, 1), ("Deuxième phrase ici.", 0, 2), ("Fin", 1, 2)]
+    automatic = make_transcript(["sous titres automatiques", "sans aucune ponctuation", "du tout"])
+    assert summarizer.split_sentences(automatic, 0, 3) == [
+        ("sous titres automatiques sans aucune ponctuation", 0, 2), ("du tout", 2, 3)]
+
+
+def test_sentences_introducing_several_new_terms_are_counted():
+    # Régression: termes 7 et 8 introduits par la même phrase; set({7, 8}) itère 8 avant 7
+    transcript = make_transcript(["zero deux trois quatre cinq six sept.", "huit neuf sept.",
+                                  "huit neuf dix onze.", "douze treize zero deux."])
+    summarizer = TextRankSummarizer()
+    ranked = summarizer.rank_video(transcript, {0: (0, 4)})
+    assert len(ranked[0].texts) == 4
+    assert np.all(ranked[0].scores > 0)
+
+
+def test_select_prefers_central_sentences_and_skips_fillers():
+    summarizer = TextRankSummarizer(budget=140)
+    section = summarizer.rank_video(LECTURE, {0: (0, len(LECTURE))})[0]
+    summary = summarizer.select(section, 0, 0)
+    assert "Euh" not in summary and "Bon" not in summary
+    assert "gradient" in summary
+    assert len(summary) <= 140
+    # Phrases remises dans l'ordre de la vidéo
+    kept = summary.split(summarizer.separator)
+    assert kept == sorted(kept, key=lambda text: [t for t in section.texts].index(text))
+
+
+def test_select_excludes_priority_window():
+    summarizer = TextRankSummarizer(budget=1000)
+    section = summarizer.rank_video(LECTURE, {0: (0, len(LECTURE))})[0]
+    summary = summarizer.select(section, 1, 5)
+    assert summary.split(summarizer.separator) == [LECTURE[6]["text"]]
+    assert summarizer.select(section, 0, len(LECTURE)) == ""
+
+
+def test_redundant_sentences_are_not_repeated():
+    transcript = make_transcript(["Le gradient réduit la perte du réseau."] * 3
+                                 + ["Les données sont normalisées avant entraînement."])
+    summarizer = TextRankSummarizer(budget=1000)
+    section = summarizer.rank_video(transcript, {0: (0, 4)})[0]
+    assert summarizer.select(section, 0, 0).count("gradient") == 1
+
+
+def test_over_budget_sentence_is_truncated_on_a_word():
+    summarizer = TextRankSummarizer(budget=20)
+    section = summarizer.rank_video(LECTURE, {0: (0, len(LECTURE))})[0]
+    summary = summarizer.select(section, 0, 0)
+    assert summary.endswith("…") and len(summary) <= 21
+    assert " " not in summary[-2:]
+
+
+def test_rank_and_cache_keys_on_content():
+    summarizer = TextRankSummarizer(cache_size=1)
+    bounds = {0: (0, len(LECTURE))}
+    assert summarizer.cached(LECTURE) is None
+    ranked = summarizer.rank_and_cache(LECTURE, bounds)
+    assert summarizer.cached([dict(s) for s in LECTURE]) is ranked
+    other = make_transcript(["Autre vidéo sur la cuisine italienne."])
+    assert transcript_fingerprint(other) != transcript_fingerprint(LECTURE)
+    summarizer.rank_and_cache(other, {0: (0, 1)})
+    assert summarizer.cached(LECTURE) is None  # Évincé (cache_size=1)
+    assert summarizer.stats == {'videos_ranked': 2, 'cache_hits': 1}
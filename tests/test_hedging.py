@@ -0,0 +1,61 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import hedging
+from cost_ledger import attribution, current_attribution
+from hedging import HedgedChatCompleter
+
+
+class FakeStream:
+    def __init__(self, delay: float, text: str):
+        self.delay = delay
+        self.text = text
+
+    def __iter__(self):
+        time.sleep(self.delay)
+        yield SimpleNamespace(model="gpt-4", usage=None,
+                              choices=[SimpleNamespace(delta=SimpleNamespace(content=self.text))])
+        yield SimpleNamespace(model="gpt-4", choices=[],
+                              usage=SimpleNamespace(prompt_tokens=10, completion_tokens=1))
+
+    def close(self):
+        pass
+
+
+class FakeClient:
+    """Première requête lente, doublon rapide"""
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        with self.lock:
+            self.calls += 1
+            slow = self.calls == 1
+        return FakeStream(0.5 if slow else 0.0, "lente" if slow else "rapide")
+
+
+class RecordingLedger:
+    def __init__(self):
+        self.rows = []
+
+    def record(self, model, prompt_tokens=0, completion_tokens=0, cached_tokens=0, **fields):
+        self.rows.append((fields.get('component'), fields.get('status'), current_attribution().get('user_id')))
+        return 0.0
+
+
+def test_hedged_attempts_keep_caller_attribution(monkeypatch):
+    ledger = RecordingLedger()
+    monkeypatch.setattr(hedging, "get_ledger", lambda: ledger)
+    hedger = HedgedChatCompleter(min_samples=1, min_delay=0.01)
+    hedger.first_token_samples.append(10.0)
+
+    with attribution(endpoint="/ask", user_id="alice"):
+        assert hedger.complete(FakeClient(), [{"role": "user", "content": "q"}], max_tokens=10) == "rapide"
+    deadline = time.time() + 2
+    while len(ledger.rows) < 2 and time.time() < deadline:
+        time.sleep(0.01)  # La principale annulée finit dans son thread
+    assert sorted(ledger.rows) == [("chat", "cancelled", "alice"), ("chat:hedge", "ok", "alice")]
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from llm_scheduler import FairShareScheduler, LLMQueueRejected
+
+
+def test_one_off_users_are_not_retained():
+    scheduler = FairShareScheduler(capacity=4)
+    for i in range(1000):
+        with scheduler.slot(f"user{i}"):
+            pass
+    assert scheduler.users == {}
+    assert scheduler.virtual_time == 1000.0
+    assert scheduler.counters['admitted'] == 1000
+
+
+def test_light_user_is_not_queued_behind_heavy_backlog():
+    scheduler = FairShareScheduler(capacity=1, per_user_limit=1)
+    heavy = [scheduler._enqueue("heavy") for _ in range(3)]
+    assert heavy[0].granted
+    light = scheduler._enqueue("light")
+
+    scheduler._release("heavy", 0.1)
+    assert heavy[1].granted and not light.granted
+    scheduler._release("heavy", 0.1)
+    # Le nouvel utilisateur passe avant la troisième question du gros consommateur
+    assert light.granted and not heavy[2].granted
+    scheduler._release("light", 0.1)
+    assert heavy[2].granted
+    scheduler._release("heavy", 0.1)
+    assert scheduler.users == {} and scheduler.active == 0
+
+
+def test_idle_user_gets_no_credit_after_virtual_time_moves_on():
+    scheduler = FairShareScheduler(capacity=1, per_user_limit=1)
+    with scheduler.slot("early"):
+        pass
+    for _ in range(5):
+        with scheduler.slot("busy"):
+            pass
+    first = scheduler._enqueue("busy")
+    queued = [scheduler._enqueue("busy"), scheduler._enqueue("early")]
+    assert first.granted and not any(w.granted for w in queued)
+    # "early" repart du temps virtuel courant: pas de priorité accumulée, mais une place par tour
+    assert queued[1].finish_tag == queued[0].finish_tag
+
+
+def test_waiter_times_out_when_capacity_is_held():
+    scheduler = FairShareScheduler(capacity=1, max_queue_wait=0.05)
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with scheduler.slot("owner"):
+            held.set()
+            release.wait(2)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    held.wait(2)
+    with pytest.raises(LLMQueueRejected) as error:
+        with scheduler.slot("other"):
+            pass
+    assert error.value.reason == 'queue_timeout'
+    release.set()
+    thread.join()
+    assert scheduler.active == 0 and scheduler.queued == 0
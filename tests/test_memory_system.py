@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+import threading
+
+from memory_system import ConversationMemory
+
+
+def session_sizes(memory: ConversationMemory) -> int:
+    return sum(session['size_bytes'] for session in memory.sessions.values())
+
+
+def test_no_cleanup_thread_by_default():
+    before = threading.active_count()
+    memory = ConversationMemory()
+    assert memory._cleanup_timer is None
+    assert threading.active_count() == before
+    memory.start_cleanup_timer(interval=3600)
+    try:
+        assert memory._cleanup_timer is not None and memory._cleanup_timer.daemon
+    finally:
+        memory.stop_cleanup_timer()
+
+
+def test_byte_cap_evicts_least_recently_active_sessions():
+    memory = ConversationMemory(max_total_bytes=8000)
+    for user in range(6):
+        memory.add_message("vid", f"question {user}", "x" * 500, 10.0, user_id=f"u{user}")
+        assert memory.total_bytes == session_sizes(memory)
+    # u0 redevient active: u1 est désormais la moins récente
+    memory.add_message("vid", "encore", "y" * 10, 20.0, user_id="u0")
+    for user in range(6, 10):
+        memory.add_message("vid", f"question {user}", "x" * 500, 10.0, user_id=f"u{user}")
+        assert memory.total_bytes <= memory.max_total_bytes
+        assert memory.total_bytes == session_sizes(memory)
+
+    remaining = [session['user_id'] for session in memory.sessions.values()]
+    assert remaining[-1] == "u9"
+    assert remaining == ["u5", "u0", "u6", "u7", "u8", "u9"]
+    stats = memory.get_stats()
+    assert stats['evicted_sessions'] == 10 - len(remaining)
+    assert stats['total_messages'] == sum(len(s['messages']) for s in memory.sessions.values())
+    assert stats['memory_bytes'] == session_sizes(memory)
+
+
+def test_message_cap_keeps_counters_consistent():
+    memory = ConversationMemory(max_messages=3)
+    for i in range(8):
+        memory.add_message("vid", f"q{i}", f"r{i}", float(i))
+    assert [m['question'] for m in memory.get_conversation_history("vid")] == ["q5", "q6", "q7"]
+    assert memory.total_messages == 3
+    assert memory.total_bytes == session_sizes(memory)
+    memory.clear_session("vid")
+    assert (memory.total_messages, memory.total_bytes, len(memory._by_creation)) == (0, 0, 0)
+
+
+def test_expiry_stops_at_first_active_session():
+    memory = ConversationMemory(session_timeout=60)
+    removed = []
+    memory.on_session_removed.append(removed.append)
+    for user in ("old1", "old2", "fresh"):
+        memory.add_message("vid", "q", "r", 0.0, user_id=user)
+    long_ago = datetime.now() - timedelta(seconds=120)
+    for key in ("vid_old1", "vid_old2"):
+        memory.sessions[key]['last_activity'] = long_ago
+    # Une session expirée derrière une active n'est pas visitée: l'ordre d'activité suffit
+    memory.sessions.move_to_end("vid_old2")
+
+    assert memory.cleanup_expired_sessions() == 1
+    assert removed == ["vid_old1"]
+    assert list(memory.sessions) == ["vid_fresh", "vid_old2"]
+    assert memory.total_bytes == session_sizes(memory)
+    assert memory.get_conversation_history("vid", "old2") == []
+    assert memory.get_stats()['expired_sessions'] == 2
+    assert memory.total_messages == 1
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cost_ledger import attribution, current_attribution
+from multi_agents import DEFAULT_ANALYSIS, MultiAgentYouTubeAssistant, run_coroutine
+
+
+class LoopBoundClient:
+    """Comme le pool httpx de ChatOpenAI: utilisable uniquement sur sa première boucle"""
+
+    def __init__(self):
+        self.loop = None
+
+    async def call(self, value):
+        loop = asyncio.get_running_loop()
+        if self.loop is None:
+            self.loop = loop
+        if loop is not self.loop:
+            raise RuntimeError("Event loop is closed")
+        await asyncio.sleep(0.01)
+        return value
+
+
+def test_run_coroutine_reuses_one_loop_across_calls_and_threads():
+    client = LoopBoundClient()
+    assert [run_coroutine(client.call(i)) for i in range(3)] == [0, 1, 2]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        assert sorted(pool.map(lambda i: run_coroutine(client.call(i)), range(8))) == list(range(8))
+
+
+def test_run_coroutine_keeps_caller_context():
+    async def attributed():
+        return current_attribution().get('user_id')
+
+    with attribution(endpoint='test', user_id='alice'):
+        assert run_coroutine(attributed()) == 'alice'
+    assert run_coroutine(attributed()) is None
+
+
+def test_speculative_process_question_survives_repeated_calls():
+    client = LoopBoundClient()
+    assistant = MultiAgentYouTubeAssistant.__new__(MultiAgentYouTubeAssistant)
+    assistant.speculative = True
+    assistant.speculation_stats = {'attempts': 0, 'hits': 0, 'misses': 0,
+                                   'saved_seconds': 0.0, 'wasted_seconds': 0.0}
+    assistant.stats_lock = threading.Lock()
+
+    async def aanalyze_question(question, contextual_data):
+        return await client.call(dict(DEFAULT_ANALYSIS))
+
+    async def agenerate_response(question, analysis, contextual_data):
+        return await client.call(f"réponse à {question}")
+
+    assistant.aanalyze_question = aanalyze_question
+    assistant.agenerate_response = agenerate_response
+    contextual_data = {'current_time_formatted': '01:00', 'priority_context': []}
+    for i in range(3):
+        result = assistant.process_question(f"q{i}", contextual_data)
+        assert result['response'] == f"réponse à q{i}"
+        assert result['speculation']['hit']
+    assert assistant.get_speculation_stats()['attempts'] == 3
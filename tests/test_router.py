@@ -0,0 +1,112 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("flask")
+
+from router import BackendPool, create_router  # noqa: E402
+
+
+class Backend(BaseHTTPRequestHandler):
+    delay = 0.0
+    calls = None
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.calls.append(self.path)
+        time.sleep(self.delay)
+        body = json.dumps({"node": self.server.server_address[1]}).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass  # Le routeur a abandonné la requête (timeout)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_backend(delay: float = 0.0):
+    handler = type("Handler", (Backend,), {"delay": delay, "calls": []})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler.calls
+
+
+def closed_port_url() -> str:
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return f"http://127.0.0.1:{port}"
+
+
+def video_owned_by(pool: BackendPool, node: str) -> str:
+    return next(v for v in (f"vid{i}" for i in range(1000)) if pool.ring.get_node(v) == node)
+
+
+def test_connect_error_fails_over_to_next_node():
+    server, calls = start_backend()
+    healthy = f"http://127.0.0.1:{server.server_address[1]}"
+    dead = closed_port_url()
+    pool = BackendPool([dead, healthy], failure_threshold=1)
+    client = create_router(pool, forward_timeout=5).test_client()
+    try:
+        response = client.post("/ask", json={"video_id": video_owned_by(pool, dead)})
+        assert response.status_code == 200
+        assert response.headers["X-Routed-To"] == healthy
+        assert calls == ["/ask"]
+        assert not pool.snapshot()[dead]["healthy"]
+    finally:
+        server.shutdown()
+
+
+def test_read_timeout_after_post_is_not_retried():
+    slow, slow_calls = start_backend(delay=1.0)
+    other, other_calls = start_backend()
+    slow_url = f"http://127.0.0.1:{slow.server_address[1]}"
+    other_url = f"http://127.0.0.1:{other.server_address[1]}"
+    pool = BackendPool([slow_url, other_url], failure_threshold=1)
+    client = create_router(pool, forward_timeout=0.3).test_client()
+    try:
+        response = client.post("/ask", json={"video_id": video_owned_by(pool, slow_url)})
+        assert response.status_code == 504
+        assert slow_calls == ["/ask"]
+        assert other_calls == []  # Pas de second appel LLM sur un autre nœud
+        assert pool.snapshot()[slow_url]["healthy"]  # Lent n'est pas en panne
+    finally:
+        slow.shutdown()
+        other.shutdown()
+
+
+def test_node_admin_requires_token():
+    pool = BackendPool(["http://127.0.0.1:1"])
+    client = create_router(pool, admin_token="s3cret").test_client()
+    assert client.post("/router/nodes", json={"node": "http://evil:80"}).status_code == 401
+    assert client.post("/router/nodes", json={"node": "http://evil:80"},
+                       headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert "http://evil:80" not in pool.snapshot()
+    response = client.post("/router/nodes", json={"node": "http://10.0.0.2:5000"},
+                           headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert "http://10.0.0.2:5000" in pool.snapshot()
+    assert client.delete("/router/nodes", json={"node": "http://10.0.0.2:5000"}).status_code == 401
+
+
+def test_node_admin_without_token_is_local_only():
+    pool = BackendPool(["http://127.0.0.1:1"])
+    client = create_router(pool).test_client()
+    remote = {"REMOTE_ADDR": "203.0.113.7"}
+    assert client.post("/router/nodes", json={"node": "http://evil:80"},
+                       environ_base=remote).status_code == 403
+    assert client.delete("/router/nodes", json={"node": "http://127.0.0.1:1"},
+                         environ_base=remote).status_code == 403
+    assert client.post("/router/nodes", json={"node": "http://127.0.0.1:2"},
+                       environ_base={"REMOTE_ADDR": "127.0.0.1"}).status_code == 200
@@ -0,0 +1,111 @@
+from collections import Counter
+import math
+import random
+
+from search_index import BM25_B, BM25_K1, TranscriptSearchIndex, build_passages, tokenize
+from transcript_store import TranscriptStore
+
+WORDS = "reseau neurone gradient descente banane recette farine sucre impot inflation taux budget".split()
+
+
+def make_transcript(texts, step=10.0):
+    return [{"start": i * step, "duration": step, "text": text} for i, text in enumerate(texts)]
+
+
+def random_corpus(seed=0, videos=12, segments=30):
+    rng = random.Random(seed)
+    return {
+        f"vid{v}": make_transcript([" ".join(rng.choices(WORDS, k=rng.randint(3, 12))) for _ in range(segments)])
+        for v in range(videos)
+    }
+
+
+def brute_force(corpus, query, passage_seconds=30.0):
+    """BM25 exhaustif sur tous les passages, sans shards ni bornes"""
+    passages = []
+    for video_id, transcript in corpus.items():
+        for lo, hi in build_passages(transcript, passage_seconds):
+            counts = Counter(tokenize(" ".join(s["text"] for s in transcript[lo:hi])))
+            passages.append((video_id, transcript[lo]["start"], counts))
+    average = sum(sum(c.values()) for _, _, c in passages) / len(passages)
+    scores = []
+    for video_id, start, counts in passages:
+        length = sum(counts.values())
+        score = 0.0
+        for token in set(tokenize(query)):
+            df = sum(1 for _, _, c in passages if token in c)
+            if not df or token not in counts:
+                continue
+            idf = math.log(1 + (len(passages) - df + 0.5) / (df + 0.5))
+            tf = counts[token]
+            score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average))
+        if score > 0:
+            scores.append((round(score, 4), video_id, start))
+    return sorted(scores, reverse=True)
+
+
+def test_tokenize_folds_accents_and_drops_stopwords():
+    assert tokenize("Le Réseau de NEURONES et l'été") == ["reseau", "neurones", "ete"]
+    assert tokenize("the gradient of a function") == ["gradient", "function"]
+
+
+def test_build_passages_groups_by_duration():
+    transcript = make_transcript(["a"] * 7, step=10.0)
+    assert build_passages(transcript, 30.0) == [(0, 3), (3, 6), (6, 7)]
+    assert build_passages([], 30.0) == []
+
+
+def test_search_matches_exhaustive_bm25():
+    corpus = random_corpus()
+    index = TranscriptSearchIndex()
+    for video_id, transcript in corpus.items():
+        index.add_video(video_id, transcript)
+    for query in ("gradient", "farine sucre", "inflation taux budget", "banane reseau"):
+        expected = brute_force(corpus, query)
+        # per_video illimité: l'arrêt anticipé sur les bornes ne doit rien changer au top
+        hits = index.search(query, limit=5, per_video=100)['hits']
+        assert [h['score'] for h in hits] == [score for score, _, _ in expected[:5]]
+
+
+def test_search_respects_per_video_and_filter():
+    corpus = random_corpus(seed=1)
+    index = TranscriptSearchIndex()
+    for video_id, transcript in corpus.items():
+        index.add_video(video_id, transcript)
+    hits = index.search("gradient", limit=20, per_video=1)['hits']
+    assert len({h['video_id'] for h in hits}) == len(hits)
+    hits = index.search("gradient", limit=20, video_ids=["vid3"])['hits']
+    assert hits and {h['video_id'] for h in hits} == {"vid3"}
+
+
+def test_reindex_and_remove_keep_global_stats_consistent():
+    corpus = random_corpus(seed=2, videos=3)
+    index = TranscriptSearchIndex()
+    for video_id, transcript in corpus.items():
+        index.add_video(video_id, transcript)
+    before = (index.passage_count, index.total_length, list(index.document_frequency))
+
+    index.add_video("vid1", make_transcript(["budget budget"]))
+    index.add_video("vid1", corpus["vid1"])
+    assert (index.passage_count, index.total_length, list(index.document_frequency)) == before
+
+    index.remove_video("vid0")
+    index.remove_video("vid1")
+    index.remove_video("vid2")
+    assert index.passage_count == 0 and index.total_length == 0
+    assert not any(index.document_frequency)
+    assert index.search("gradient")['hits'] == []
+
+
+def test_snippet_and_index_store(tmp_path):
+    store = TranscriptStore(str(tmp_path))
+    store.save("vidA", make_transcript(["introduction générale", "la descente de gradient converge", "fin"]))
+    store.save("vidB", make_transcript(["recette de la banane flambée"]))
+    index = TranscriptSearchIndex(loader=store.load)
+    assert index.index_store(store) == 2
+    assert index.index_store(store) == 0
+    hits = index.search("descente")['hits']
+    assert [h['video_id'] for h in hits] == ["vidA"]
+    assert "descente de gradient" in hits[0]['snippet']
+    assert hits[0]['timestamp'] == "00:00"
+    assert index.stats()['videos'] == 2
@@ -0,0 +1,89 @@
+import os
+import uuid
+
+import pytest
+
+fcntl = pytest.importorskip("fcntl")
+
+from shared_transcript_cache import SharedTranscriptCache  # noqa: E402
+from transcript_store import encode_transcript  # noqa: E402
+
+SEGMENTS = [{"start": float(i), "duration": 1.0, "text": f"segment {i}"} for i in range(50)]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SharedTranscriptCache(name=f"t{uuid.uuid4().hex[:8]}", capacity_bytes=64 * 1024,
+                                  slots=16, lock_dir=str(tmp_path))
+    yield cache
+    cache.destroy()
+    cache.close()
+
+
+def holders_of(cache, video_id):
+    with cache._locked():
+        index, _ = cache._probe(video_id)
+        return [pid for pid in cache._read_slot(index)[5] if pid]
+
+
+def test_put_get_round_trip(cache):
+    assert cache.get("vid1") is None
+    shared = cache.put("vid1", SEGMENTS)
+    assert list(shared) == SEGMENTS
+    assert cache.get("vid1") is shared
+    assert holders_of(cache, "vid1") == [os.getpid()]
+    assert cache.stats()["entries"] == 1
+
+
+def test_release_makes_entry_evictable(cache):
+    cache.put("vid1", SEGMENTS)
+    cache.release("vid1")
+    assert holders_of(cache, "vid1") == []
+    # Assez gros pour ne tenir qu'à condition d'évincer vid1
+    big = [{"start": float(i), "duration": 1.0, "text": "x" * 200} for i in range(286)]
+    assert 64 * 1024 - len(encode_transcript(SEGMENTS)) < len(encode_transcript(big)) <= 64 * 1024
+    cache.put("vid2", big)
+    assert cache.get("vid1") is None
+    assert cache.get("vid2") is not None
+
+
+def test_forked_child_has_its_own_lock_and_pid(cache):
+    cache.put("vid1", SEGMENTS)
+    read_fd, write_fd = os.pipe()
+    with cache._locked():
+        pid = os.fork()
+        if pid == 0:  # Enfant: ne jamais revenir dans pytest
+            status = 1
+            try:
+                os.close(read_fd)
+                try:
+                    fcntl.flock(cache._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    excluded = False
+                except BlockingIOError:
+                    excluded = True
+                os.write(write_fd, b"%d %d" % (excluded, cache.pid))
+                status = 0
+            finally:
+                os._exit(status)
+        os.close(write_fd)
+        excluded, child_pid = map(int, os.read(read_fd, 64).split())
+        os.close(read_fd)
+    assert os.waitpid(pid, 0)[1] == 0
+    assert excluded == 1  # Le verrou du parent exclut l'enfant
+    assert child_pid == pid
+    assert cache.pid == os.getpid()
+
+
+def test_forked_child_registers_as_holder(cache):
+    cache.put("vid1", SEGMENTS)
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            transcript = cache.get("vid1")
+            ok = transcript is not None and len(transcript) == len(SEGMENTS)
+            ok = ok and os.getpid() in holders_of(cache, "vid1")
+            status = 0 if ok else 2
+        finally:
+            os._exit(status)
+    assert os.waitpid(pid, 0)[1] == 0
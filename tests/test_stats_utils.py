@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+
+from stats_utils import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_percentile_nearest_rank():
+    assert percentile(range(1, 101), 99) == 99
+    assert percentile(range(1, 101), 100) == 100
+    assert percentile(range(1, 11), 50) == 5
+    assert percentile(range(1, 11), 51) == 6
+    assert percentile(range(1, 101), 7) == 7
+    assert percentile([5.0], 99) == 5.0
+    assert percentile([3.0, 1.0, 2.0], 0) == 1.0
+    assert percentile((x for x in [2, 1]), 50) == 1
+    assert percentile([], 50) is None
+
+
+def test_shedder_and_load_test_do_not_import_hedging():
+    code = "import sys, degraded_mode, load_test; print('hedging' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    assert output.returncode == 0, output.stderr
+    assert output.stdout.strip().splitlines()[-1] == "False"
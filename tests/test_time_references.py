@@ -0,0 +1,83 @@
+import pytest
+
+from contextual_transcript_processor import ContextualTranscriptProcessor
+from transcript_sources import TranscriptSource
+from time_references import parse_duration, parse_time_references
+
+
+def refs(question, current_time=900.0, duration=None):
+    return [(r.kind, r.at, r.text) for r in parse_time_references(question, current_time, duration)]
+
+
+@pytest.mark.parametrize("text, seconds", [
+    ("2 minutes 30", 150), ("1h05", 3900), ("une minute et demie", 90),
+    ("a couple of minutes", 120), ("12 min et 30 s", 750), ("45 secondes", 45),
+])
+def test_parse_duration(text, seconds):
+    assert parse_duration(text) == seconds
+
+
+def test_absolute_references():
+    assert refs("qu'est-ce qu'il a dit à 12:30 ?") == [("absolute", 750.0, "à 12:30")]
+    assert refs("what is shown at 1:02:15") == [("absolute", 3735.0, "at 1:02:15")]
+    assert refs("que dit-il vers 12 min 30") == [("absolute", 750.0, "vers 12 min 30")]
+    assert refs("à la 5e minute") == [("absolute", 300.0, "à la 5e minute")]
+    assert refs("what happens 5 minutes in?") == [("absolute", 300.0, "5 minutes in")]
+    assert refs("10 minutes into the video, who is speaking") == [("absolute", 600.0, "10 minutes into the video")]
+
+
+def test_relative_references():
+    assert refs("il y a 5 minutes") == [("relative", 600.0, "il y a 5 minutes")]
+    assert refs("go back two minutes") == [("relative", 780.0, "go back two minutes")]
+    assert refs("30 seconds ago") == [("relative", 870.0, "30 seconds ago")]
+    assert refs("qu'est-ce qu'il dit dans 1 minute") == [("relative", 960.0, "dans 1 minute")]
+    assert refs("what happens in 2 minutes?") == [("relative", 1020.0, "in 2 minutes")]
+    assert refs("In 2 minutes, does he explain it?") == [("relative", 1020.0, "In 2 minutes")]
+
+
+def test_ranges_and_edges():
+    assert refs("entre 12:00 et 14:00") == [("range", 720.0, "12:00 et 14:00")]
+    assert refs("les 5 dernières minutes") == [("range", 900.0, "les 5 dernières minutes")]
+    assert refs("au début", duration=3000) == [("start", 0.0, "au début")]
+    assert refs("at the end", duration=3000) == [("end", 3000.0, "at the end")]
+
+
+@pytest.mark.parametrize("question", [
+    "How long does it take 20 minutes in the oven?",
+    "Can I learn this in 5 minutes?",
+    "What is 5 m in feet?",
+    "Explain it in 2 minutes in simple words",
+    "Il parle de 5 moments clés",
+    "Quelle est la recette ?",
+])
+def test_durations_that_are_not_moments(question):
+    assert refs(question) == []
+
+
+class OneSource(TranscriptSource):
+    name = "test"
+
+    def fetch(self, video_id):
+        return []
+
+
+def make_context(question, current_time):
+    processor = ContextualTranscriptProcessor("test", use_store=False, source=OneSource())
+    processor.segmenter = None  # Fenêtre fixe: 120 s avant, 30 s après
+    transcript = [{"start": i * 10.0, "duration": 10.0, "text": f"segment {i}"} for i in range(180)]
+    contextual_data = processor.create_contextual_windows(transcript, current_time)
+    return contextual_data, processor.apply_time_references(contextual_data, transcript, question)
+
+
+def test_cited_passage_replaces_the_summary():
+    before, after = make_context("qu'est-ce qu'il a dit à 2:00 ?", 1200.0)
+    assert "Passage cité" in after['priority_window_text']
+    assert after['extended_context_summary'].startswith("(Non inclus")
+    assert before['extended_context_summary'] != after['extended_context_summary']
+
+
+def test_reference_inside_the_current_window_keeps_the_summary():
+    before, after = make_context("qu'est-ce qu'il a dit à 19:00 ?", 1200.0)
+    assert after['time_references']
+    assert after['priority_window_text'] == before['priority_window_text']
+    assert after['extended_context_summary'] == before['extended_context_summary']
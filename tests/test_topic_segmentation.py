@@ -0,0 +1,144 @@
+from concurrent.futures import ThreadPoolExecutor
+import random
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from topic_segmentation import Chapter, ChapterIndex, TextTilingSegmenter  # noqa: E402
+
+TOPICS = [
+    "gradient neurone couche poids reseau apprentissage perte descente activation sortie".split(),
+    "farine sucre beurre four pate gateau oeuf cuisson moule recette".split(),
+    "impot taxe budget inflation taux banque credit dette marche prix".split(),
+]
+
+
+def topic_transcript(topics, seconds_per_topic=300.0, step=5.0, seed=0):
+    """Segments de 5 s, 6 mots tirés du vocabulaire du sujet en cours"""
+    rng = random.Random(seed)
+    transcript = []
+    for t, words in enumerate(topics):
+        for i in range(int(seconds_per_topic / step)):
+            start = t * seconds_per_topic + i * step
+            transcript.append({"start": start, "duration": step, "text": " ".join(rng.choices(words, k=6))})
+    return transcript
+
+
+def test_detects_topic_changes():
+    transcript = topic_transcript(TOPICS)
+    chapters = TextTilingSegmenter().segment(transcript)
+    assert len(chapters) == 3
+    starts = [chapter.start_time for chapter in chapters.chapters]
+    assert starts[0] == 0.0
+    # Frontières à moins d'une unité (~20 mots, 4 segments) du vrai changement
+    assert abs(starts[1] - 300) <= 20 and abs(starts[2] - 600) <= 20
+    # Chapitres contigus, couvrant toute la vidéo
+    assert chapters.chapters[-1].end == len(transcript)
+    for previous, chapter in zip(chapters.chapters, chapters.chapters[1:]):
+        assert previous.end == chapter.begin and previous.end_time == chapter.start_time
+        assert chapter.depth > 0
+
+
+def test_long_chapters_are_split():
+    transcript = topic_transcript([TOPICS[0]], seconds_per_topic=900)
+    chapters = TextTilingSegmenter(max_seconds=200).segment(transcript)
+    durations = [c.end_time - c.start_time for c in chapters.chapters]
+    assert len(chapters) >= 3 and max(durations) <= 200
+
+
+def test_min_seconds_spacing():
+    transcript = topic_transcript(TOPICS, seconds_per_topic=120)
+    chapters = TextTilingSegmenter(min_seconds=200).segment(transcript)
+    starts = chapters.starts
+    assert all(b - a >= 200 for a, b in zip(starts, starts[1:]))
+    assert chapters.chapters[-1].end_time - starts[-1] >= 200
+
+
+def test_short_transcripts_and_units():
+    segmenter = TextTilingSegmenter()
+    assert len(segmenter.segment([])) == 0
+    short = topic_transcript([TOPICS[0]], seconds_per_topic=30)
+    assert [c.to_dict()['segments_count'] for c in segmenter.segment(short).chapters] == [len(short)]
+    # 4 segments de 6 mots: 24 mots puis un reste de 6 (< 10) rattaché à la première unité
+    units, firsts, vocabulary = segmenter.build_units(topic_transcript([TOPICS[0]], seconds_per_topic=25))
+    assert [len(u) for u in units] == [30] and firsts == [0]
+
+
+def test_depth_scores():
+    depths = TextTilingSegmenter().depth_scores(np.array([0.8, 0.2, 0.6, 0.5, 0.9]))
+    assert depths.tolist() == pytest.approx([0.0, 1.0, 0.0, 0.5, 0.0])
+
+
+def naive_depth_scores(scores):
+    """Montée pas à pas vers chaque pic (référence, quadratique sur un plateau)"""
+    depths = []
+    for i in range(len(scores)):
+        left = i
+        while left > 0 and scores[left - 1] >= scores[left]:
+            left -= 1
+        right = i
+        while right < len(scores) - 1 and scores[right + 1] >= scores[right]:
+            right += 1
+        depths.append((scores[left] - scores[i]) + (scores[right] - scores[i]))
+    return depths
+
+
+def test_depth_scores_match_hill_climb_on_plateaus():
+    segmenter = TextTilingSegmenter()
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        scores = rng.integers(0, 4, rng.integers(1, 30)) / 4.0  # Beaucoup de valeurs égales
+        assert segmenter.depth_scores(scores).tolist() == naive_depth_scores(scores.tolist())
+    assert segmenter.depth_scores(np.zeros(0)).tolist() == []
+
+
+def test_repeated_caption_is_linear():
+    # 6 h d'un même sous-titre: scores plats partout (quadratique avant: ~18 s)
+    transcript = [{"start": i * 3.0, "duration": 3.0, "text": "[Musique] on continue avec la suite"}
+                  for i in range(7200)]
+    segmenter = TextTilingSegmenter(max_seconds=600)
+    started = time.perf_counter()
+    chapters = segmenter.segment(transcript)
+    assert time.perf_counter() - started < 2.0
+    durations = [c.end_time - c.start_time for c in chapters.chapters]
+    assert max(durations) <= 600 and min(durations) >= 60
+    assert chapters.chapters[-1].end == len(transcript)
+
+
+def test_chapter_index_lookup():
+    index = ChapterIndex([Chapter(0, 0, 10, 0.0, 100.0), Chapter(1, 10, 20, 100.0, 250.0, 0.3)])
+    assert index.chapter_at(-5).index == 0
+    assert index.chapter_at(99.9).index == 0
+    assert index.chapter_at(100.0).index == 1
+    assert index.chapter_at(10_000).index == 1
+    assert index.section_bounds() == {0: (0, 10), 1: (10, 20)}
+    assert ChapterIndex([]).chapter_at(5) is None
+
+
+def test_index_is_cached_by_content():
+    segmenter = TextTilingSegmenter()
+    transcript = topic_transcript(TOPICS)
+    first = segmenter.index(transcript)
+    assert segmenter.index([dict(s) for s in transcript]) is first
+    assert segmenter.stats == {'videos_segmented': 1, 'cache_hits': 1}
+
+
+def test_concurrent_first_requests_segment_once():
+    segmenter = TextTilingSegmenter()
+    transcript = topic_transcript(TOPICS)
+    calls = []
+    segment = segmenter.segment
+
+    def slow_segment(transcript):
+        calls.append(1)
+        time.sleep(0.1)
+        return segment(transcript)
+
+    segmenter.segment = slow_segment
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: segmenter.index(transcript), range(4)))
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert segmenter.stats == {'videos_segmented': 1, 'cache_hits': 3}
@@ -0,0 +1,117 @@
+import os
+import struct
+
+import pytest
+
+from transcript_store import (HEADER, CorruptTranscriptError, MappedTranscript, TranscriptStore,
+                              encode_transcript)
+
+SEGMENTS = [
+    {"start": 0.0, "duration": 2.5, "text": "Bonjour à tous"},
+    {"start": 2.5, "duration": 3.0, "text": "aujourd'hui: les réseaux de neurones 🧠"},
+    {"start": 5.5, "duration": 1.0, "text": ""},
+    {"start": 6.5, "duration": 4.0, "text": "premier exemple"},
+]
+
+
+def test_encode_round_trip():
+    transcript = MappedTranscript(encode_transcript(SEGMENTS))
+    assert len(transcript) == len(SEGMENTS)
+    assert list(transcript) == SEGMENTS
+    assert transcript[-1] == SEGMENTS[-1]
+    assert transcript[1:3] == SEGMENTS[1:3]
+    with pytest.raises(IndexError):
+        transcript[len(SEGMENTS)]
+
+
+def test_bisect_on_starts():
+    transcript = MappedTranscript(encode_transcript(SEGMENTS))
+    assert transcript.bisect_left(2.5) == 1
+    assert transcript.bisect_right(2.5) == 2
+    assert transcript.bisect_left(100) == len(SEGMENTS)
+
+
+def test_unsorted_input_is_sorted_by_start():
+    shuffled = [SEGMENTS[2], SEGMENTS[0], SEGMENTS[3], SEGMENTS[1]]
+    transcript = MappedTranscript(encode_transcript(shuffled))
+    assert list(transcript) == SEGMENTS
+    assert transcript.bisect_left(6.5) == 3
+
+
+def test_equal_starts_keep_input_order():
+    segments = [{"start": 1.0, "duration": 1.0, "text": "a"}, {"start": 1.0, "duration": 1.0, "text": "b"}]
+    assert [s["text"] for s in MappedTranscript(encode_transcript(segments))] == ["a", "b"]
+
+
+def test_corrupted_payload_fails_crc():
+    data = bytearray(encode_transcript(SEGMENTS))
+    data[-1] ^= 0xFF
+    with pytest.raises(CorruptTranscriptError, match="Checksum"):
+        MappedTranscript(bytes(data))
+    # Sans vérification, le fichier reste lisible
+    assert len(MappedTranscript(bytes(data), verify=False)) == len(SEGMENTS)
+
+
+def test_truncated_and_foreign_files_are_rejected():
+    data = encode_transcript(SEGMENTS)
+    with pytest.raises(CorruptTranscriptError, match="tronqué"):
+        MappedTranscript(data[:HEADER.size - 1])
+    with pytest.raises(CorruptTranscriptError, match="Taille"):
+        MappedTranscript(data[:-3])
+    with pytest.raises(CorruptTranscriptError, match="Magic"):
+        MappedTranscript(b"NOPE" + data[4:])
+    bad_version = data[:4] + struct.pack("<H", 99) + data[6:]
+    with pytest.raises(CorruptTranscriptError, match="Version"):
+        MappedTranscript(bad_version)
+
+
+def test_store_save_load_and_corruption(tmp_path):
+    store = TranscriptStore(str(tmp_path))
+    path = store.save("abc_DEF-123", SEGMENTS)
+    assert store.exists("abc_DEF-123")
+    assert store.video_ids() == ["abc_DEF-123"]
+    assert list(store.load("abc_DEF-123")) == SEGMENTS
+    assert store.read_segments("abc_DEF-123") == SEGMENTS
+    # Aucun fichier temporaire laissé par l'écriture atomique
+    assert sorted(os.listdir(tmp_path)) == ["abc_DEF-123.ytt"]
+
+    with open(path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+    fresh = TranscriptStore(str(tmp_path))
+    assert fresh.load("abc_DEF-123") is None
+    assert fresh.read_segments("abc_DEF-123") is None
+
+
+def test_store_rejects_invalid_video_ids(tmp_path):
+    store = TranscriptStore(str(tmp_path))
+    for video_id in ("../etc/passwd", "", "a" * 65, "a/b"):
+        with pytest.raises(ValueError):
+            store.path_for(video_id)
+
+
+def open_fds() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="/proc requis pour compter les fd")
+def test_open_maps_are_bounded(tmp_path):
+    store = TranscriptStore(str(tmp_path), max_open=8)
+    video_ids = [f"vid{i}" for i in range(40)]
+    for video_id in video_ids:
+        store.save(video_id, SEGMENTS)
+    for video_id in video_ids[:8]:
+        store.load(video_id)
+    before = open_fds()
+    held = store.load(video_ids[8])  # Évincé plus tard alors qu'il est encore lu
+    for video_id in video_ids[9:]:
+        assert store.load(video_id)[0] == SEGMENTS[0]
+    assert open_fds() <= before + 1
+    assert list(held) == SEGMENTS
+    del held
+    assert open_fds() <= before
+    # Le plus récent est toujours servi depuis le cache, l'évincé est rouvert
+    assert store.load(video_ids[-1]) is store.load(video_ids[-1])
+    assert list(store.load(video_ids[0])) == SEGMENTS
@@ -0,0 +1,153 @@
+import json
+
+import pytest
+
+from contextual_transcript_processor import ContextualTranscriptProcessor
+from transcript_sources import TranscriptSource
+from transcript_store import TranscriptStore
+from transcript_uploads import TranscriptUploadError, content_hash, parse_upload, upload_origin
+
+REAL = [{"start": 0.0, "duration": 2.0, "text": "vrai contenu"}, {"start": 2.0, "duration": 2.0, "text": "suite"}]
+FAKE = [{"start": 0.0, "duration": 2.0, "text": "contenu inventé"}]
+
+
+class FakeSource(TranscriptSource):
+    name = "fake"
+
+    def __init__(self, segments=None):
+        self.segments = segments or []
+        self.calls = 0
+
+    def fetch(self, video_id):
+        self.calls += 1
+        return [dict(s) for s in self.segments]
+
+
+def make_processor(tmp_path, segments=None) -> ContextualTranscriptProcessor:
+    return ContextualTranscriptProcessor("test", store=TranscriptStore(str(tmp_path)), source=FakeSource(segments))
+
+
+def upload(processor, segments, uploader, video_id="vid1", address=None):
+    raw = json.dumps({"video_id": video_id, "segments": segments}).encode()
+    digest, parsed, _ = parse_upload(raw, video_id, content_hash(raw))
+    # Par défaut chaque uploader a sa propre adresse
+    origin = upload_origin(address or f"198.51.100.{sum(map(ord, uploader)) % 250 + 1}")
+    return digest, processor.store_uploaded_transcript(video_id, digest, parsed, uploader, origin)
+
+
+def test_parse_upload_rejects_wrong_hash_and_video():
+    raw = json.dumps({"video_id": "vid1", "segments": REAL}).encode()
+    with pytest.raises(TranscriptUploadError, match="hash"):
+        parse_upload(raw, "vid1", "0" * 64)
+    with pytest.raises(TranscriptUploadError, match="video_id"):
+        parse_upload(raw, "vid2")
+
+
+def test_single_upload_stays_private(tmp_path):
+    processor = make_processor(tmp_path)
+    digest, status = upload(processor, FAKE, "mallory")
+    assert status == "pending"
+    assert not processor.store.exists("vid1")
+    assert processor.get_transcript("vid1") == []  # Les autres utilisateurs ne le voient pas
+    assert list(processor.client_transcript("vid1", digest, "mallory")) == FAKE
+    assert processor.client_transcript("vid1", digest, "alice") is None
+
+
+def test_upload_differing_from_server_copy_is_not_verified(tmp_path):
+    processor = make_processor(tmp_path, REAL)
+    processor.get_transcript("vid1")
+    digest, status = upload(processor, FAKE, "mallory")
+    assert status == "mismatch"
+    assert processor.uploads.hashes.lookup(digest) is None
+    assert list(processor.store.load("vid1")) == REAL
+
+
+def test_upload_matching_server_copy_is_verified(tmp_path):
+    processor = make_processor(tmp_path, REAL)
+    processor.get_transcript("vid1")
+    digest, status = upload(processor, REAL, "alice")
+    assert status == "verified"
+    assert processor.uploads.hashes.lookup(digest)['verified']
+
+
+def test_quorum_prefers_server_fetch(tmp_path):
+    processor = make_processor(tmp_path, REAL)
+    upload(processor, FAKE, "mallory")
+    digest, status = upload(processor, FAKE, "mallory2")
+    assert status == "mismatch"
+    assert list(processor.store.load("vid1")) == REAL
+    assert not processor.uploads.hashes.lookup(digest)['verified']
+
+
+def test_quorum_promotes_when_server_cannot_fetch(tmp_path):
+    processor = make_processor(tmp_path)
+    _, status = upload(processor, FAKE, "alice")
+    assert status == "pending"
+    _, status = upload(processor, FAKE, "alice")  # Même utilisateur: ne compte qu'une fois
+    assert status == "pending"
+    digest, status = upload(processor, FAKE, "bob")
+    assert status == "promoted"
+    assert list(processor.store.load("vid1")) == FAKE
+    assert processor.uploads.hashes.lookup(digest)['verified']
+
+
+def test_quorum_ignores_user_ids_from_one_address(tmp_path):
+    processor = make_processor(tmp_path)
+    processor.uploads.quorum = 3
+    for user in ("a", "b", "c"):
+        digest, status = upload(processor, FAKE, user, address="203.0.113.7")
+        assert status == "pending"
+    # Même préfixe IPv6 /64: toujours une seule origine
+    for suffix in ("1", "2"):
+        _, status = upload(processor, FAKE, f"v6-{suffix}", address=f"2001:db8:1:2::{suffix}")
+    assert status == "pending"
+    assert not processor.store.exists("vid1")
+    record = processor.uploads.hashes.lookup(digest)
+    assert len(record['uploaders']) == 5 and len(record['origins']) == 2
+    assert "203.0.113.7" not in json.dumps(record)  # Empreinte seulement
+    _, status = upload(processor, FAKE, "d", address="192.0.2.1")
+    assert status == "promoted"
+
+
+def test_server_fetch_overrides_promoted_copy(tmp_path):
+    processor = make_processor(tmp_path)
+    upload(processor, FAKE, "alice")
+    digest, _ = upload(processor, FAKE, "bob")
+    processor.uploads.refetch_seconds = 0
+    assert list(processor.load_transcript("vid1")) == FAKE  # Toujours introuvable côté serveur
+
+    processor.source.segments = REAL
+    assert list(processor.load_transcript("vid1")) == REAL
+    assert list(processor.store.load("vid1")) == REAL
+    assert processor.uploads.hashes.lookup(digest) is None
+    calls = processor.source.calls
+    processor.load_transcript("vid1")
+    assert processor.source.calls == calls  # Plus de copie client: pas de nouvelle récupération
+
+
+def test_upload_endpoint_and_ask_resolution(tmp_path, monkeypatch):
+    app_module = pytest.importorskip("app")
+    processor = make_processor(tmp_path)
+    monkeypatch.setattr(app_module, "processor", type("Memory", (), {"transcript_processor": processor})())
+    client = app_module.app.test_client()
+    raw = json.dumps({"video_id": "vid1", "segments": FAKE}).encode()
+    digest = content_hash(raw)
+
+    response = client.post("/transcript/upload/vid1?user_id=mallory", data=raw,
+                           headers={"X-Transcript-Hash": digest})
+    assert response.status_code == 201 and response.get_json()["status"] == "pending"
+    assert client.get(f"/transcript/upload/vid1?hash={digest}&user_id=mallory").status_code == 200
+    assert client.get(f"/transcript/upload/vid1?hash={digest}&user_id=alice").status_code == 404
+
+    _, transcript, info = app_module.resolve_transcript_hash("vid1", digest, "mallory")
+    assert list(transcript) == FAKE and info["transcript_source"] == "client"
+    _, transcript, info = app_module.resolve_transcript_hash("vid1", digest, "alice")
+    assert transcript is None and info == {"transcript_source": "server", "transcript_upload_required": True}
+
+    # Une fois le transcript serveur stocké, le hash client n'est plus annoncé comme utilisé
+    processor.source.segments = REAL
+    processor.get_transcript("vid1")
+    _, transcript, info = app_module.resolve_transcript_hash("vid1", digest, "mallory")
+    assert transcript is None and info == {"transcript_source": "server"}
+    response = client.post("/transcript/upload/vid1?user_id=bob", data=raw, headers={"X-Transcript-Hash": digest})
+    assert response.status_code == 409
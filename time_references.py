@@ -0,0 +1,255 @@
+# time_references.py - Références temporelles explicites dans les questions (FR/EN)
+"""
+Extrait les moments visés par une question, pour aller chercher directement
+les segments correspondants dans l'index des débuts de segments:
+
+- absolus: "à 12:30", "at 1:02:15", "vers 12 min 30", "5 minutes in" (en fin
+  de question), "à la 5e minute", "minute 12", "au début", "at the end"
+- plages: "entre 12:00 et 14:00", "from 3:00 to 4:30", "12:00-14:00"
+- relatifs au moment actuel: "il y a 5 minutes", "30 seconds ago",
+  "go back two minutes", "deux minutes plus tôt", "dans 1 minute",
+  "what happens in 2 minutes"
+
+    >>> [r.to_dict() for r in parse_time_references("qu'est-ce qu'il a dit à 12:30 ?", 900)]
+    [{'start': 735.0, 'end': 795.0, 'at': 750.0, 'kind': 'absolute', 'text': 'à 12:30'}]
+    >>> parse_time_references("how long does it take 20 minutes in the oven?", 900)
+    []
+"""
+from typing import Dict, List, Optional, Tuple
+import re
+
+# Passage retenu autour d'un moment cité (la phrase visée commence souvent un peu avant)
+POINT_BEFORE = 15.0
+POINT_AFTER = 45.0
+# Un moment relatif ("il y a 5 minutes") est approximatif: fenêtre plus large
+RELATIVE_BEFORE = 30.0
+RELATIVE_AFTER = 60.0
+# Début / fin de la vidéo
+EDGE_SECONDS = 90.0
+MAX_RANGE_SECONDS = 30 * 60
+
+NUMBER_WORDS = {
+    # Français
+    'un': 1, 'une': 1, 'deux': 2, 'trois': 3, 'quatre': 4, 'cinq': 5, 'six': 6, 'sept': 7,
+    'huit': 8, 'neuf': 9, 'dix': 10, 'onze': 11, 'douze': 12, 'treize': 13, 'quatorze': 14,
+    'quinze': 15, 'seize': 16, 'vingt': 20, 'trente': 30, 'quarante': 40, 'cinquante': 50,
+    # Anglais
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'seven': 7,
+    'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12, 'fifteen': 15, 'twenty': 20,
+    'thirty': 30, 'forty': 40, 'fifty': 50, 'couple': 2, 'few': 3, 'quelques': 3,
+}
+
+NUMBER = r"(?:\d+(?:[.,]\d+)?|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True)) + r")"
+HOURS = r"(?:heures?|hours?|hrs?|h)"
+MINUTES = r"(?:minutes?|mins?|mn|m)"
+SECONDS = r"(?:secondes?|seconds?|secs?|s)"
+UNIT = rf"(?:{HOURS}|{MINUTES}|{SECONDS})"
+
+# Fin d'unité: pas suivie d'une lettre ("1h05" est valide, "5 moments" non)
+END_OF_UNIT = r"(?![^\W\d_])"
+# "2 minutes 30", "1h05", "12 min et 30 s", "a couple of minutes", "une minute et demie"
+DURATION = (rf"\b(?:a\s+)?{NUMBER}(?:\s+of)?\s*{UNIT}{END_OF_UNIT}"
+            rf"(?:\s*(?:et\s+|and\s+)?(?:demie?\b|half\b|\d{{1,2}}(?:\s*{UNIT}{END_OF_UNIT})?))?")
+CLOCK = r"(?<![\d:])\d{1,2}:[0-5]\d(?::[0-5]\d)?(?![\d:])"
+
+# "les 5 dernières minutes", "the last two minutes": de current_time - durée à current_time
+LAST_PATTERNS = [
+    re.compile(rf"\b(?:les\s+)?(?P<n>{NUMBER})\s+derni[èe]re?s?\s+(?P<u>{UNIT}){END_OF_UNIT}", re.I),
+    re.compile(rf"\b(?:the\s+)?(?:last|past|previous)\s+(?P<d>{DURATION})", re.I),
+]
+
+RELATIVE_PATTERNS = [
+    # Vers l'arrière
+    (-1, re.compile(rf"\bil\s+y\s+a\s+(?:environ\s+|à\s+peu\s+près\s+)?(?P<d>{DURATION})", re.I)),
+    (-1, re.compile(rf"\b(?:go(?:ing)?\s+back|rewind|back\s+up|revien[st]?|revenir|retour(?:ne[rz]?)?|recule[rz]?)"
+                    rf"\s+(?:de\s+|by\s+|about\s+|environ\s+)?(?P<d>{DURATION})", re.I)),
+    (-1, re.compile(rf"(?P<d>{DURATION})\s+(?:ago|earlier|back|before|plus\s+t[ôo]t|avant|en\s+arri[èe]re|auparavant)\b", re.I)),
+    # Vers l'avant
+    (1, re.compile(rf"(?P<d>{DURATION})\s+(?:later|from\s+now|plus\s+tard|apr[èe]s)\b", re.I)),
+    (1, re.compile(rf"\bdans\s+(?P<d>{DURATION})(?!\s+in\b)", re.I)),
+    # "in 5 minutes" est le plus souvent une durée ("learn this in 5 minutes"): seulement en tête
+    # de phrase ou après "happens"/"coming up"/"next"
+    (1, re.compile(rf"(?:^|[,;:.!?]\s*|\b(?:happens?|happening|coming(?:\s+up)?|next)\s+)"
+                   rf"(?P<ref>in\s+(?P<d>{DURATION}))(?!\s+in\b)", re.I)),
+]
+
+ABSOLUTE_PATTERNS = [
+    re.compile(rf"(?:\b(?:à|a|at|vers|around|autour\s+de|aux\s+alentours\s+de|about)\s+(?:la\s+|the\s+)?)?(?P<clock>{CLOCK})", re.I),
+    re.compile(rf"\b(?:à|at|vers|around|autour\s+de|aux\s+alentours\s+de)\s+(?:la\s+)?(?P<d>{DURATION})", re.I),
+    # "5 minutes in" seulement en fin de question ou avant une virgule ("takes 20 minutes in the oven" exclu)
+    re.compile(rf"(?P<d>{DURATION})\s+(?:into\s+the\s+video\b|in(?=\s*,|\W*$))", re.I),
+    re.compile(r"\b(?:à\s+la\s+|at\s+the\s+)?(?P<minute>\d{1,3})\s*(?:e|è|ème|eme|th|st|nd|rd)\s+minute\b", re.I),
+    re.compile(r"\b(?:à\s+la\s+|at\s+)?minute\s+(?P<minute>\d{1,3})\b", re.I),
+]
+
+START_PATTERN = re.compile(r"\b(?:au\s+d[ée]but|du\s+d[ée]but|at\s+the\s+(?:beginning|start)|"
+                           r"(?:beginning|start)\s+of\s+the\s+video|d[ée]but\s+de\s+la\s+vid[ée]o)\b", re.I)
+END_PATTERN = re.compile(r"\b(?:(?:à|a|vers)\s+la\s+fin|(?:at|near|towards?)\s+the\s+end|end\s+of\s+the\s+video|"
+                         r"fin\s+de\s+la\s+vid[ée]o)\b", re.I)
+# Entre deux moments d'une plage (le "à" de "de 12:00 à 14:00" peut déjà appartenir au second moment)
+RANGE_CONNECTOR = re.compile(r"^\s*(?:-|–|—|à|a|au|to|et|and|jusqu'?à|until|till|through)?\s*$", re.I)
+
+
+class TimeReference:
+    """Passage de la vidéo visé par la question (secondes)"""
+
+    __slots__ = ('start', 'end', 'at', 'kind', 'text')
+
+    def __init__(self, start: float, end: float, at: float, kind: str, text: str):
+        self.start = start
+        self.end = end
+        self.at = at
+        self.kind = kind  # 'absolute', 'range', 'relative', 'start' ou 'end'
+        self.text = text
+
+    def to_dict(self) -> Dict:
+        return {'start': self.start, 'end': self.end, 'at': self.at, 'kind': self.kind, 'text': self.text}
+
+    def __repr__(self) -> str:
+        return f"TimeReference({self.kind} {self.start:.0f}-{self.end:.0f}s {self.text!r})"
+
+
+def parse_number(token: str) -> float:
+    token = token.lower().replace(',', '.')
+    if token in NUMBER_WORDS:
+        return float(NUMBER_WORDS[token])
+    return float(token)
+
+
+def parse_clock(text: str) -> float:
+    parts = [int(p) for p in text.split(':')]
+    if len(parts) == 3:
+        return parts[0] * 3600 + parts[1] * 60 + parts[2]
+    return parts[0] * 60 + parts[1]
+
+
+def parse_duration(text: str) -> Optional[float]:
+    """'2 minutes 30' -> 150, '1h05' -> 3900, 'une minute et demie' -> 90, 'a couple of minutes' -> 120"""
+    match = re.match(rf"(?:a\s+)?(?P<n>{NUMBER})(?:\s+of)?\s*(?P<u>{UNIT}){END_OF_UNIT}(?P<rest>.*)$",
+                     text.strip(), re.I)
+    if not match:
+        return None
+    value = parse_number(match.group('n'))
+    unit = match.group('u').lower()
+    if re.fullmatch(HOURS, unit):
+        scale, next_scale = 3600, 60
+    elif re.fullmatch(MINUTES, unit):
+        scale, next_scale = 60, 1
+    else:
+        scale, next_scale = 1, None
+    seconds = value * scale
+
+    rest = re.sub(r"^\s*(?:et|and)\s+", "", match.group('rest').strip(), flags=re.I)
+    if re.match(r"^(?:demie?|half)\b", rest, re.I):
+        seconds += scale / 2
+    elif rest:
+        extra = re.match(rf"^(?P<n>\d{{1,2}})\s*(?P<u>{UNIT})?{END_OF_UNIT}", rest, re.I)
+        if extra:
+            extra_unit = (extra.group('u') or '').lower()
+            if extra_unit and re.fullmatch(MINUTES, extra_unit):
+                seconds += int(extra.group('n')) * 60
+            elif extra_unit and re.fullmatch(SECONDS, extra_unit):
+                seconds += int(extra.group('n'))
+            elif next_scale:
+                seconds += int(extra.group('n')) * next_scale
+    return seconds
+
+
+def _span(at: float, before: float, after: float, duration: Optional[float]) -> Tuple[float, float]:
+    start = max(0.0, at - before)
+    end = at + after
+    if duration is not None:
+        end = min(end, duration)
+        start = min(start, max(0.0, duration - before - after))
+    return start, end
+
+
+def _mask(text: str, start: int, end: int) -> str:
+    """Efface un passage déjà interprété (sans décaler les positions)"""
+    return text[:start] + " " * (end - start) + text[end:]
+
+
+def parse_time_references(question: str, current_time: float,
+                          duration: Optional[float] = None) -> List[TimeReference]:
+    """
+    Références temporelles de la question, dans l'ordre d'apparition
+
+    Args:
+        current_time: moment actuel (base des références relatives)
+        duration: durée de la vidéo (pour "à la fin" et pour borner les passages)
+    """
+    if not question:
+        return []
+    text = question
+    found: List[Tuple[int, TimeReference]] = []
+
+    # 1. Dernières minutes, puis relatifs: "il y a 5 minutes" contient "a 5 minutes" (absolu sinon)
+    for pattern in LAST_PATTERNS:
+        for match in pattern.finditer(text):
+            groups = match.groupdict()
+            spec = groups.get('d') or f"{groups['n']} {groups['u']}"
+            seconds = parse_duration(spec)
+            if seconds is None or seconds <= 0:
+                continue
+            seconds = min(seconds, MAX_RANGE_SECONDS)
+            found.append((match.start(), TimeReference(max(0.0, current_time - seconds), current_time,
+                                                       current_time, 'range', match.group(0).strip())))
+            text = _mask(text, match.start(), match.end())
+
+    for direction, pattern in RELATIVE_PATTERNS:
+        for match in pattern.finditer(text):
+            seconds = parse_duration(match.group('d'))
+            if seconds is None or seconds <= 0:
+                continue
+            at = max(0.0, current_time + direction * seconds)
+            if duration is not None:
+                at = min(at, duration)
+            start, end = _span(at, RELATIVE_BEFORE, RELATIVE_AFTER, duration)
+            label = match.group('ref') if 'ref' in pattern.groupindex else match.group(0)
+            found.append((match.start(), TimeReference(start, end, at, 'relative', label.strip())))
+            text = _mask(text, match.start(), match.end())
+
+    # 2. Moments absolus (horloge, durée introduite par "à"/"at", "5e minute")
+    points: List[Tuple[int, int, float, str]] = []
+    for pattern in ABSOLUTE_PATTERNS:
+        for match in pattern.finditer(text):
+            groups = match.groupdict()
+            if groups.get('clock'):
+                at = parse_clock(groups['clock'])
+            elif groups.get('minute'):
+                at = int(groups['minute']) * 60.0
+            else:
+                at = parse_duration(groups['d'])
+                if at is None:
+                    continue
+            points.append((match.start(), match.end(), float(at), match.group(0).strip()))
+            text = _mask(text, match.start(), match.end())
+    points.sort()
+
+    # Plages: deux moments séparés par "-", "à", "to", "et"...
+    i = 0
+    while i < len(points):
+        begin, finish, at, label = points[i]
+        if i + 1 < len(points) and RANGE_CONNECTOR.match(question[finish:points[i + 1][0]]):
+            other = points[i + 1]
+            low, high = sorted((at, other[2]))
+            if 0 < high - low <= MAX_RANGE_SECONDS:
+                found.append((begin, TimeReference(low, high if duration is None else min(high, duration),
+                                                   low, 'range', question[begin:other[1]].strip())))
+                i += 2
+                continue
+        if duration is None or at <= duration:
+            start, end = _span(at, POINT_BEFORE, POINT_AFTER, duration)
+            found.append((begin, TimeReference(start, end, at, 'absolute', label)))
+        i += 1
+
+    # 3. Début / fin de la vidéo
+    for match in START_PATTERN.finditer(text):
+        found.append((match.start(), TimeReference(0.0, EDGE_SECONDS, 0.0, 'start', match.group(0))))
+    if duration is not None:
+        for match in END_PATTERN.finditer(text):
+            found.append((match.start(), TimeReference(max(0.0, duration - EDGE_SECONDS), duration,
+                                                       duration, 'end', match.group(0))))
+
+    found.sort(key=lambda item: item[0])
+    return [reference for _, reference in found]
@@ -0,0 +1,288 @@
+# topic_segmentation.py - Découpage des vidéos en chapitres (TextTiling)
+"""
+Les fenêtres de contexte étaient coupées à des bornes fixes (±120/30 s,
+tranches de 5 minutes): la réponse manquait souvent le début de
+l'explication en cours. On détecte ici les changements de sujet:
+
+1. regroupement des segments en unités de ~UNIT_TOKENS mots (sans mots vides)
+2. similarité cosinus entre les blocs de BLOCK_UNITS unités de part et d'autre
+   de chaque frontière d'unités (sommes préfixes NumPy, par lots)
+3. lissage, puis profondeur de chaque creux (montée jusqu'au pic à gauche et à droite)
+4. frontières: creux les plus profonds au-delà du seuil moyenne + écart-type / 2
+   (les sous-titres parlés ont beaucoup de petits creux sans changement de sujet),
+   espacés d'au moins min_seconds; un chapitre plus long que max_seconds est
+   recoupé à son creux le plus marqué
+
+L'index est calculé une fois par vidéo et mis en cache. Aucun appel LLM.
+"""
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+import os
+import threading
+
+import numpy as np
+
+from extractive_summary import transcript_fingerprint
+from search_index import tokenize
+
+UNIT_TOKENS = 20  # Taille des pseudo-phrases de TextTiling (w)
+BLOCK_UNITS = 6  # Unités comparées de chaque côté d'une frontière (k)
+GAP_BATCH = 256  # Frontières traitées par lot (borne la mémoire des blocs denses)
+
+
+class Chapter:
+    """Chapitre: segments [begin, end), de start_time à end_time (secondes)"""
+
+    __slots__ = ('index', 'begin', 'end', 'start_time', 'end_time', 'depth')
+
+    def __init__(self, index: int, begin: int, end: int, start_time: float, end_time: float,
+                 depth: float = 0.0):
+        self.index = index
+        self.begin = begin
+        self.end = end
+        self.start_time = start_time
+        self.end_time = end_time
+        self.depth = depth  # Profondeur du creux à la frontière d'entrée (0 pour le premier chapitre)
+
+    def to_dict(self) -> Dict:
+        return {'index': self.index, 'start': round(self.start_time, 2), 'end': round(self.end_time, 2),
+                'first_segment': self.begin, 'segments_count': self.end - self.begin,
+                'boundary_depth': round(self.depth, 4)}
+
+
+class ChapterIndex:
+    """Chapitres d'une vidéo, triés, avec recherche dichotomique par instant"""
+
+    __slots__ = ('chapters', 'starts')
+
+    def __init__(self, chapters: List[Chapter]):
+        self.chapters = chapters
+        self.starts = [chapter.start_time for chapter in chapters]
+
+    def __len__(self) -> int:
+        return len(self.chapters)
+
+    def chapter_at(self, seconds: float) -> Optional[Chapter]:
+        if not self.chapters:
+            return None
+        return self.chapters[max(0, bisect_right(self.starts, seconds) - 1)]
+
+    def section_bounds(self) -> Dict[int, Tuple[int, int]]:
+        """Même forme que les tranches de 5 minutes: {numéro de chapitre: (début, fin)}"""
+        return {chapter.index: (chapter.begin, chapter.end) for chapter in self.chapters}
+
+    def to_list(self) -> List[Dict]:
+        return [chapter.to_dict() for chapter in self.chapters]
+
+
+class TextTilingSegmenter:
+    """Détection des changements de sujet par cohésion lexicale, mise en cache par vidéo"""
+
+    def __init__(self, min_seconds: float = 60.0, max_seconds: float = 600.0,
+                 unit_tokens: int = UNIT_TOKENS, block_units: int = BLOCK_UNITS,
+                 smoothing: int = 3, cutoff_std: float = 0.5, cache_size: int = 256):
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.unit_tokens = unit_tokens
+        self.block_units = block_units
+        self.smoothing = smoothing
+        self.cutoff_std = cutoff_std
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # empreinte du transcript -> ChapterIndex
+        self.computing: Dict[Tuple, threading.Event] = {}  # Découpages en cours (un seul par vidéo)
+        self.lock = threading.Lock()
+        self.stats = {'videos_segmented': 0, 'cache_hits': 0}
+
+    @classmethod
+    def from_env(cls) -> "TextTilingSegmenter":
+        return cls(min_seconds=float(os.getenv("CHAPTER_MIN_SECONDS", "60")),
+                   max_seconds=float(os.getenv("CHAPTER_MAX_SECONDS", "600")))
+
+    def build_units(self, transcript: Sequence[Dict]) -> Tuple[List[List[int]], List[int], Dict[str, int]]:
+        """Unités de ~unit_tokens mots: (identifiants de termes, premier segment de chaque unité, vocabulaire)"""
+        vocabulary: Dict[str, int] = {}
+        units: List[List[int]] = []
+        firsts: List[int] = []
+        current: List[int] = []
+        first = 0
+        for i in range(len(transcript)):
+            if not current:
+                first = i
+            current.extend(vocabulary.setdefault(token, len(vocabulary))
+                           for token in tokenize(transcript[i]['text']))
+            if len(current) >= self.unit_tokens:
+                units.append(current)
+                firsts.append(first)
+                current = []
+        if current:
+            if units and len(current) < self.unit_tokens // 2:
+                units[-1].extend(current)  # Reste trop court: rattaché à l'unité précédente
+            else:
+                units.append(current)
+                firsts.append(first)
+        return units, firsts, vocabulary
+
+    def gap_scores(self, units: List[List[int]], vocabulary_size: int) -> np.ndarray:
+        """Similarité cosinus des blocs gauche/droite pour chaque frontière entre unités (n - 1 valeurs)"""
+        n = len(units)
+        rows = np.repeat(np.arange(n), [len(ids) for ids in units])
+        columns = np.fromiter((term_id for ids in units for term_id in ids), dtype=np.int64, count=len(rows))
+        # Termes présents dans une seule unité: sans effet sur le recouvrement, on les écarte
+        unit_terms = np.unique(rows * vocabulary_size + columns)
+        keep = np.bincount(unit_terms % vocabulary_size, minlength=vocabulary_size) >= 2
+        mask = keep[columns]
+        remap = np.cumsum(keep) - 1
+        width = max(1, int(keep.sum()))
+        counts = np.zeros((n, width), dtype=np.float32)
+        np.add.at(counts, (rows[mask], remap[columns[mask]]), 1.0)
+        prefix = np.zeros((n + 1, width), dtype=np.float32)
+        np.cumsum(counts, axis=0, out=prefix[1:])
+
+        scores = np.empty(n - 1, dtype=np.float64)
+        k = self.block_units
+        for offset in range(0, n - 1, GAP_BATCH):
+            gaps = np.arange(offset, min(n - 1, offset + GAP_BATCH)) + 1  # frontière avant l'unité g
+            left = prefix[gaps] - prefix[np.maximum(0, gaps - k)]
+            right = prefix[np.minimum(n, gaps + k)] - prefix[gaps]
+            norms = np.linalg.norm(left, axis=1) * np.linalg.norm(right, axis=1)
+            dots = np.einsum('ij,ij->i', left, right)
+            scores[gaps - 1] = np.where(norms > 0, dots / np.where(norms > 0, norms, 1.0), 0.0)
+        return scores
+
+    def smooth(self, scores: np.ndarray) -> np.ndarray:
+        if self.smoothing <= 1 or len(scores) < self.smoothing:
+            return scores
+        kernel = np.ones(self.smoothing) / self.smoothing
+        padded = np.pad(scores, self.smoothing // 2, mode='edge')
+        return np.convolve(padded, kernel, mode='valid')[:len(scores)]
+
+    def depth_scores(self, scores: np.ndarray) -> np.ndarray:
+        """
+        Profondeur de chaque creux: (pic à gauche - score) + (pic à droite - score)
+
+        Le pic à gauche de i est le début de la pente non croissante qui finit
+        en i (remontée tant que le score ne baisse pas), de même à droite. Les
+        débuts et fins de pentes sont propagés par maximum/minimum cumulé: O(n)
+        même sur un plateau (longue « [Musique] », sous-titre répété).
+
+        >>> TextTilingSegmenter().depth_scores(np.array([0.9, 0.5, 0.2, 0.6, 0.6, 0.3, 0.8])).round(2).tolist()
+        [0.0, 0.4, 1.1, 0.0, 0.0, 0.8, 0.0]
+        """
+        n = len(scores)
+        if n == 0:
+            return np.zeros(0)
+        positions = np.arange(n)
+        # Pic à gauche: dernière position k <= i où la pente repart (scores[k - 1] < scores[k])
+        rises = np.empty(n, dtype=bool)
+        rises[0] = True
+        rises[1:] = scores[:-1] < scores[1:]
+        left = np.maximum.accumulate(np.where(rises, positions, 0))
+        # Pic à droite: première position k >= i où la pente redescend (scores[k + 1] < scores[k])
+        falls = np.empty(n, dtype=bool)
+        falls[-1] = True
+        falls[:-1] = scores[1:] < scores[:-1]
+        right = np.minimum.accumulate(np.where(falls, positions, n - 1)[::-1])[::-1]
+        return (scores[left] - scores) + (scores[right] - scores)
+
+    def select_boundaries(self, times: np.ndarray, scores: np.ndarray, depths: np.ndarray,
+                          video_start: float, video_end: float) -> List[int]:
+        """Indices de frontières retenus (triés), espacés d'au moins min_seconds"""
+        def spaced(gap: int, chosen: List[int]) -> bool:
+            if times[gap] - video_start < self.min_seconds or video_end - times[gap] < self.min_seconds:
+                return False
+            return all(abs(times[gap] - times[other]) >= self.min_seconds for other in chosen)
+
+        chosen: List[int] = []
+        valleys = depths[depths > 0]
+        if valleys.size:
+            cutoff = valleys.mean() + self.cutoff_std * valleys.std()
+            for gap in np.argsort(-depths, kind='stable'):
+                if depths[gap] <= 0 or depths[gap] < cutoff:
+                    break
+                if spaced(gap, chosen):
+                    chosen.append(int(gap))
+
+        # Chapitres trop longs: recoupés au point de plus faible cohésion. Dans un chapitre,
+        # seules ses deux bornes peuvent être trop proches: un masque sur la tranche suffit
+        while True:
+            edges = [video_start] + sorted(times[gap] for gap in chosen) + [video_end]
+            added = False
+            for a, b in zip(edges, edges[1:]):
+                if b - a <= self.max_seconds:
+                    continue
+                lo, hi = np.searchsorted(times, a, side='right'), np.searchsorted(times, b, side='left')
+                inside = times[lo:hi]
+                candidates = np.flatnonzero((inside - a >= self.min_seconds) & (b - inside >= self.min_seconds))
+                if candidates.size:
+                    chosen.append(int(lo + candidates[np.argmin(scores[lo:hi][candidates])]))
+                    added = True
+            if not added:
+                return sorted(chosen)
+
+    def segment(self, transcript: Sequence[Dict]) -> ChapterIndex:
+        """Chapitres d'un transcript (sans cache)"""
+        n = len(transcript)
+        if not n:
+            return ChapterIndex([])
+        last = transcript[n - 1]
+        video_start = transcript[0]['start']
+        video_end = last['start'] + last.get('duration', 0)
+        units, firsts, vocabulary = self.build_units(transcript)
+        boundaries: List[Tuple[int, float]] = []  # (premier segment du chapitre, profondeur)
+        if len(units) > 2 * self.block_units and vocabulary:
+            scores = self.smooth(self.gap_scores(units, len(vocabulary)))
+            depths = self.depth_scores(scores)
+            times = np.fromiter((transcript[firsts[g + 1]]['start'] for g in range(len(units) - 1)),
+                                dtype=np.float64, count=len(units) - 1)
+            for gap in self.select_boundaries(times, scores, depths, video_start, video_end):
+                boundaries.append((firsts[gap + 1], float(depths[gap])))
+
+        chapters = []
+        begins = [(0, 0.0)] + boundaries
+        for index, (begin, depth) in enumerate(begins):
+            end = begins[index + 1][0] if index + 1 < len(begins) else n
+            end_time = transcript[end]['start'] if end < n else video_end
+            chapters.append(Chapter(index, begin, end, transcript[begin]['start'], end_time, depth))
+        return ChapterIndex(chapters)
+
+    def index(self, transcript: Sequence[Dict]) -> ChapterIndex:
+        """
+        Index de chapitres mis en cache (empreinte du transcript)
+
+        Les premières requêtes simultanées sur une vidéo attendent le même
+        découpage au lieu de le refaire chacune.
+        """
+        key = transcript_fingerprint(transcript)
+        while True:
+            with self.lock:
+                chapters = self.cache.get(key)
+                if chapters is not None:
+                    self.cache.move_to_end(key)
+                    self.stats['cache_hits'] += 1
+                    return chapters
+                pending = self.computing.get(key)
+                if pending is None:
+                    self.computing[key] = threading.Event()
+                    break
+            pending.wait()  # Découpage d'un autre thread; s'il a échoué, on réessaie nous-mêmes
+
+        try:
+            chapters = self.segment(transcript)
+            with self.lock:
+                self.cache[key] = chapters
+                self.cache.move_to_end(key)
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+                self.stats['videos_segmented'] += 1
+            return chapters
+        finally:
+            with self.lock:
+                self.computing.pop(key).set()
+
+
+def segmenter_from_env() -> Optional[TextTilingSegmenter]:
+    """CONTEXT_CHAPTERS=off: fenêtres fixes (±120/30 s) et tranches de 5 minutes"""
+    if os.getenv("CONTEXT_CHAPTERS", "on").lower() in ("off", "0", "false", "no"):
+        return None
+    return TextTilingSegmenter.from_env()
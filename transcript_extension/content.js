@@ -1,3 +1,7 @@
+const BACKEND_URL = 'http://localhost:5000';
+// Attente maximale de l'envoi du transcript avant de poser la question
+const TRANSCRIPT_UPLOAD_WAIT_MS = 3000;
+
 class YouTubeAIAssistant {
   constructor() {
     console.log('📱 Initialisation de YouTubeAIAssistant');
@@ -5,6 +9,10 @@ class YouTubeAIAssistant {
     this.chatContainer = null;
     this.isVisible = false;
     this.currentVideoId = null;
+    // videoId -> Promise du hash du transcript envoyé au backend (null en cas d'échec)
+    this.transcriptUploads = {};
+    // Identifiant stable par installation: file d'attente LLM et mémoire propres à l'utilisateur
+    this.userIdPromise = null;
     this.init();
   }
 
@@ -24,6 +32,8 @@ class YouTubeAIAssistant {
     this.observeVideoChanges();
     this.createAIButton();
     this.createChatInterface();
+    this.currentVideoId = this.extractVideoId();
+    this.prepareTranscript(this.currentVideoId);
     console.log('✅ Setup terminé');
   }
 
@@ -48,6 +58,7 @@ class YouTubeAIAssistant {
       console.log('Nouvelle vidéo détectée:', videoId);
       // Reset du chat pour la nouvelle vidéo
       this.clearChat();
+      this.prepareTranscript(videoId);
     }
   }
 
@@ -267,9 +278,26 @@ class YouTubeAIAssistant {
     }
   }
 
+  getUserId() {
+    if (!this.userIdPromise) {
+      this.userIdPromise = new Promise((resolve) => {
+        chrome.storage.local.get(['userId'], (stored) => {
+          if (stored && stored.userId) return resolve(stored.userId);
+          const userId = `ext_${crypto.randomUUID()}`;
+          chrome.storage.local.set({ userId }, () => resolve(userId));
+        });
+      });
+    }
+    return this.userIdPromise;
+  }
+
   async callBackend(videoId, currentTime, question) {
+    // Hash du transcript déjà envoyé: le backend n'a pas à le télécharger
+    const transcriptHash = await this.getTranscriptHash(videoId);
+    const userId = await this.getUserId();
+    
     // Appel à votre API backend
-    const response = await fetch('http://localhost:5000/ask', {
+    const response = await fetch(`${BACKEND_URL}/ask`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -277,18 +305,146 @@ class YouTubeAIAssistant {
       body: JSON.stringify({
         video_id: videoId,
         current_time: currentTime,
-        question: question
+        question: question,
+        user_id: userId,
+        transcript_hash: transcriptHash
       })
     });
     
+    if (response.status === 429) {
+      // Capacité saturée côté backend: le délai conseillé est dans Retry-After
+      const retryAfter = response.headers.get('Retry-After') || '5';
+      return `⏳ Beaucoup de questions en cours. Réessayez dans ${retryAfter} s.`;
+    }
     if (!response.ok) {
       throw new Error('Erreur réseau');
     }
     
     const data = await response.json();
+    if (data.transcript_upload_required) {
+      // Le backend ne connaît pas ce hash (autre nœud, store vidé): renvoyer le transcript
+      this.prepareTranscript(videoId, true);
+    }
     return data.response;
   }
 
+  prepareTranscript(videoId, force = false) {
+    // Une seule tentative d'envoi par vidéo (sauf si le backend le redemande)
+    if (!videoId || (this.transcriptUploads[videoId] && !force)) return;
+    this.transcriptUploads[videoId] = this.uploadTranscript(videoId).catch((error) => {
+      console.log('⚠️ Transcript non envoyé, le backend le récupérera lui-même:', error.message);
+      return null;
+    });
+  }
+
+  async getTranscriptHash(videoId) {
+    const upload = this.transcriptUploads[videoId];
+    if (!upload) return null;
+    const timeout = new Promise((resolve) => setTimeout(() => resolve(null), TRANSCRIPT_UPLOAD_WAIT_MS));
+    return Promise.race([upload, timeout]);
+  }
+
+  async uploadTranscript(videoId) {
+    const track = await this.fetchCaptionTrack(videoId);
+    const body = JSON.stringify({
+      video_id: videoId,
+      language: track.language,
+      segments: track.segments
+    });
+    const hash = await this.sha256Hex(body);
+    // Le backend garde l'envoi pour cet utilisateur jusqu'à confirmation par le serveur ou un autre utilisateur
+    const userId = encodeURIComponent(await this.getUserId());
+    
+    // Déjà connu du backend: rien à envoyer
+    const known = await fetch(`${BACKEND_URL}/transcript/upload/${videoId}?hash=${hash}&user_id=${userId}`);
+    if (known.ok) {
+      console.log('📄 Transcript déjà connu du backend:', hash.slice(0, 12));
+      return hash;
+    }
+    
+    const response = await fetch(`${BACKEND_URL}/transcript/upload/${videoId}?user_id=${userId}`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Content-Encoding': 'gzip',
+        'X-Transcript-Hash': hash
+      },
+      body: await this.gzip(body)
+    });
+    if (!response.ok) {
+      throw new Error(`Envoi refusé (${response.status})`);
+    }
+    console.log(`📤 Transcript envoyé: ${track.segments.length} segments, hash ${hash.slice(0, 12)}`);
+    return hash;
+  }
+
+  async fetchCaptionTrack(videoId) {
+    // La page de lecture contient la liste des pistes de sous-titres (ytInitialPlayerResponse)
+    const html = await (await fetch(`https://www.youtube.com/watch?v=${videoId}`, { credentials: 'include' })).text();
+    const tracks = this.extractCaptionTracks(html);
+    if (!tracks.length) {
+      throw new Error('Aucune piste de sous-titres');
+    }
+    
+    // Sous-titres manuels dans la langue de la page de préférence, sinon automatiques
+    const pageLanguage = (document.documentElement.lang || navigator.language || '').slice(0, 2);
+    const track = tracks.find((t) => t.kind !== 'asr' && t.languageCode.startsWith(pageLanguage)) ||
+                  tracks.find((t) => t.kind !== 'asr') ||
+                  tracks[0];
+    
+    const captions = await (await fetch(`${track.baseUrl}&fmt=json3`)).json();
+    const segments = [];
+    for (const event of captions.events || []) {
+      if (!event.segs) continue;
+      const text = event.segs.map((seg) => seg.utf8 || '').join('').replace(/\s+/g, ' ').trim();
+      if (!text) continue;
+      segments.push({
+        start: (event.tStartMs || 0) / 1000,
+        duration: (event.dDurationMs || 0) / 1000,
+        text: text
+      });
+    }
+    if (!segments.length) {
+      throw new Error('Piste de sous-titres vide');
+    }
+    return { language: track.languageCode, segments: segments };
+  }
+
+  extractCaptionTracks(html) {
+    const marker = '"captionTracks":';
+    const start = html.indexOf(marker);
+    if (start === -1) return [];
+    
+    // Tableau JSON délimité par comptage des crochets (hors chaînes)
+    let depth = 0;
+    let inString = false;
+    const begin = start + marker.length;
+    for (let i = begin; i < html.length; i++) {
+      const char = html[i];
+      if (inString) {
+        if (char === '\\') i++;
+        else if (char === '"') inString = false;
+      } else if (char === '"') {
+        inString = true;
+      } else if (char === '[') {
+        depth++;
+      } else if (char === ']' && --depth === 0) {
+        return JSON.parse(html.slice(begin, i + 1));
+      }
+    }
+    return [];
+  }
+
+  async sha256Hex(text) {
+    const digest = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(text));
+    return Array.from(new Uint8Array(digest)).map((b) => b.toString(16).padStart(2, '0')).join('');
+  }
+
+  async gzip(text) {
+    const stream = new Blob([text]).stream().pipeThrough(new CompressionStream('gzip'));
+    return new Response(stream).arrayBuffer();
+  }
+
   addMessage(sender, content) {
     const messagesContainer = this.chatContainer.querySelector('#ai-chat-messages');
     const messageDiv = document.createElement('div');
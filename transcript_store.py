@@ -0,0 +1,306 @@
+# transcript_store.py - Stockage binaire des transcripts (chargement zéro-copie via mmap)
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+from array import array
+from collections import OrderedDict
+from bisect import bisect_left, bisect_right
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+import zlib
+
+# Format de fichier (little-endian), version 1:
+#   en-tête (32 octets): magic, version, réservé, nb_segments, taille_texte, crc32
+#   starts:    float64[n]
+#   durations: float64[n]
+#   offsets:   uint64[n + 1]  (offsets en octets dans le blob texte)
+#   texte:     blob UTF-8
+MAGIC = b"YTTR"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHQQI4x")
+FILE_EXTENSION = ".ytt"
+
+VIDEO_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class CorruptTranscriptError(ValueError):
+    """Fichier de transcript illisible (en-tête, taille ou checksum invalide)"""
+
+
+def _typed_view(buffer: memoryview, offset: int, count: int, typecode: str) -> Sequence:
+    """Vue typée sur une partie du buffer, sans copie sur les machines little-endian"""
+    itemsize = struct.calcsize(typecode)
+    raw = buffer[offset:offset + count * itemsize]
+    if sys.byteorder == "little":
+        return raw.cast(typecode)
+    # Machines big-endian: copie + conversion (le format disque reste little-endian)
+    values = array(typecode)
+    values.frombytes(raw)
+    values.byteswap()
+    return values
+
+
+def encode_transcript(segments: List[Dict]) -> bytes:
+    """
+    Sérialise une liste de segments {'start', 'duration', 'text'} au format binaire
+
+    Les segments sont triés par début (tri stable): les lecteurs font des
+    recherches dichotomiques sur `starts`.
+    """
+    segments = sorted(segments, key=lambda s: float(s.get("start", 0) or 0))
+    starts = array("d", (float(s.get("start", 0) or 0) for s in segments))
+    durations = array("d", (float(s.get("duration", 0) or 0) for s in segments))
+    offsets = array("Q", [0])
+    blob = bytearray()
+    for segment in segments:
+        blob += str(segment.get("text", "") or "").encode("utf-8")
+        offsets.append(len(blob))
+
+    if sys.byteorder != "little":
+        for values in (starts, durations, offsets):
+            values.byteswap()
+
+    payload = starts.tobytes() + durations.tobytes() + offsets.tobytes() + bytes(blob)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(segments), len(blob), zlib.crc32(payload))
+    return header + payload
+
+
+class MappedTranscript(Sequence):
+    """
+    Transcript adossé à un buffer binaire (mmap ou mémoire partagée)
+
+    Se comporte comme une liste de segments {'start', 'duration', 'text'}:
+    les segments sont décodés à la demande, le reste du fichier n'est jamais copié.
+    """
+
+    def __init__(self, buffer, source: str = "", verify: bool = True, owner=None,
+                 close_owner: bool = False):
+        self._owner = owner  # Garde l'objet mmap/shm vivant tant que la vue existe
+        self._close_owner = close_owner  # mmap du store: à fermer avec la vue (il garde un fd ouvert)
+        self._buffer = memoryview(buffer)
+        self.source = source
+
+        if len(self._buffer) < HEADER.size:
+            raise CorruptTranscriptError(f"Fichier tronqué: {source}")
+
+        magic, version, _, count, text_len, checksum = HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC:
+            raise CorruptTranscriptError(f"Magic invalide: {source}")
+        if version != FORMAT_VERSION:
+            raise CorruptTranscriptError(f"Version {version} non supportée: {source}")
+
+        arrays_size = count * 8 * 3 + 8
+        expected_size = HEADER.size + arrays_size + text_len
+        if len(self._buffer) < expected_size:
+            raise CorruptTranscriptError(f"Taille incohérente: {source}")
+
+        payload = self._buffer[HEADER.size:expected_size]
+        if verify and zlib.crc32(payload) != checksum:
+            raise CorruptTranscriptError(f"Checksum invalide: {source}")
+
+        self.count = count
+        offset = HEADER.size
+        self.starts = _typed_view(self._buffer, offset, count, "d")
+        offset += count * 8
+        self.durations = _typed_view(self._buffer, offset, count, "d")
+        offset += count * 8
+        self.offsets = _typed_view(self._buffer, offset, count + 1, "Q")
+        offset += (count + 1) * 8
+        self._text = self._buffer[offset:offset + text_len]
+        self.nbytes = expected_size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def text_at(self, index: int) -> str:
+        """Texte du segment `index`, décodé depuis le blob"""
+        return str(self._text[self.offsets[index]:self.offsets[index + 1]], "utf-8")
+
+    def segment_at(self, index: int) -> Dict:
+        return {
+            "start": self.starts[index],
+            "duration": self.durations[index],
+            "text": self.text_at(index),
+        }
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self.segment_at(i) for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("index de segment hors limites")
+        return self.segment_at(index)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(self.count):
+            yield self.segment_at(i)
+
+    def bisect_left(self, seconds: float) -> int:
+        """Premier segment dont le début est >= seconds"""
+        return bisect_left(self.starts, seconds)
+
+    def bisect_right(self, seconds: float) -> int:
+        """Premier segment dont le début est > seconds"""
+        return bisect_right(self.starts, seconds)
+
+    def release(self) -> None:
+        """Libère les vues sur le buffer (nécessaire avant de fermer un mmap)"""
+        for name in ("starts", "durations", "offsets", "_text", "_buffer"):
+            view = getattr(self, name, None)
+            if isinstance(view, memoryview):
+                view.release()
+
+    def close(self) -> None:
+        """Libère les vues puis ferme le mmap possédé (son descripteur de fichier avec)"""
+        self.release()
+        if self._close_owner and self._owner is not None:
+            try:
+                self._owner.close()
+            except BufferError:
+                pass  # Une tranche est encore exportée: le mmap sera fermé par le GC
+
+    def __del__(self):
+        # Les vues doivent disparaître avant le mmap/segment qui les porte
+        if hasattr(self, "_close_owner"):
+            self.close()
+
+
+class TranscriptStore:
+    """
+    Stockage persistant des transcripts, un fichier binaire par vidéo
+
+    Les fichiers sont ouverts en mmap: plusieurs processus workers partagent
+    les mêmes pages via le cache du système. Les écritures sont atomiques
+    (fichier temporaire + fsync + rename) pour qu'un crash ne laisse jamais
+    un fichier à moitié écrit.
+
+    Chaque mmap garde un descripteur de fichier ouvert: seuls les `max_open`
+    derniers transcripts chargés restent en cache (LRU). Un transcript évincé
+    ferme son mmap dès que son dernier lecteur le lâche.
+    """
+
+    def __init__(self, directory: str, verify_checksums: bool = True, max_open: int = 128):
+        self.directory = directory
+        self.verify_checksums = verify_checksums
+        self.max_open = max(1, max_open)
+        self._open_maps: "OrderedDict[str, tuple]" = OrderedDict()  # video_id -> (signature, MappedTranscript)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "TranscriptStore":
+        """
+        Crée le store depuis l'environnement
+
+        TRANSCRIPT_STORE_DIR: répertoire des fichiers .ytt
+        TRANSCRIPT_STORE_MAX_OPEN: transcripts gardés ouverts en mmap (défaut 128)
+        """
+        return cls(os.getenv("TRANSCRIPT_STORE_DIR", "transcript_store"),
+                   max_open=int(os.getenv("TRANSCRIPT_STORE_MAX_OPEN", "128")))
+
+    def path_for(self, video_id: str) -> str:
+        if not VIDEO_ID_PATTERN.match(video_id or ""):
+            raise ValueError(f"video_id invalide: {video_id!r}")
+        return os.path.join(self.directory, video_id + FILE_EXTENSION)
+
+    def exists(self, video_id: str) -> bool:
+        return os.path.exists(self.path_for(video_id))
+
+    def video_ids(self) -> List[str]:
+        """Liste des vidéos présentes dans le store"""
+        return sorted(
+            name[:-len(FILE_EXTENSION)]
+            for name in os.listdir(self.directory)
+            if name.endswith(FILE_EXTENSION)
+        )
+
+    def save(self, video_id: str, segments: List[Dict]) -> str:
+        """Écrit le transcript de façon atomique et retourne le chemin du fichier"""
+        path = self.path_for(video_id)
+        data = encode_transcript(segments)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{video_id}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        # Rendre le rename durable
+        try:
+            dir_fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError:
+            pass  # Pas de fsync de répertoire sur certaines plateformes
+
+        return path
+
+    def load(self, video_id: str) -> Optional[MappedTranscript]:
+        """Ouvre le transcript en mmap (None s'il est absent ou corrompu)"""
+        path = self.path_for(video_id)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        with self._lock:
+            cached = self._open_maps.get(video_id)
+            if cached and cached[0] == signature:
+                self._open_maps.move_to_end(video_id)
+                return cached[1]
+
+        if stat.st_size == 0:
+            print(f"⚠️ Transcript vide ignoré: {path}")
+            return None
+
+        try:
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            transcript = MappedTranscript(mapped, source=path, verify=self.verify_checksums,
+                                          owner=mapped, close_owner=True)
+        except (OSError, CorruptTranscriptError) as e:
+            print(f"⚠️ Transcript illisible ({e}), il sera récupéré à nouveau")
+            return None
+
+        with self._lock:
+            # L'ancienne version (fichier remplacé) reste valide pour ses lecteurs
+            self._open_maps[video_id] = (signature, transcript)
+            self._open_maps.move_to_end(video_id)
+            while len(self._open_maps) > self.max_open:
+                # Pas de close() ici: une requête en cours peut encore lire ce transcript
+                self._open_maps.popitem(last=False)
+        return transcript
+
+    def read_segments(self, video_id: str) -> Optional[List[Dict]]:
+        """Lecture complète sans mmap ni cache (parcours de tout le store sans garder de fichiers ouverts)"""
+        try:
+            with open(self.path_for(video_id), "rb") as f:
+                data = f.read()
+            transcript = MappedTranscript(data, source=video_id, verify=self.verify_checksums)
+        except (OSError, CorruptTranscriptError) as e:
+            print(f"⚠️ Transcript illisible ({e})")
+            return None
+        try:
+            return list(transcript)
+        finally:
+            transcript.release()
+
+    def delete(self, video_id: str) -> None:
+        path = self.path_for(video_id)
+        with self._lock:
+            self._open_maps.pop(video_id, None)
+        if os.path.exists(path):
+            os.unlink(path)
@@ -0,0 +1,302 @@
+# transcript_uploads.py - Transcripts envoyés par l'extension (identifiés par hash SHA-256)
+"""
+L'extension lit la piste de sous-titres déjà chargée par la page YouTube et
+l'envoie une fois par vidéo, compressée en gzip:
+
+    POST /transcript/upload/<video_id>
+    Content-Encoding: gzip
+    X-Transcript-Hash: <sha256 hex du JSON non compressé>
+    {"video_id": "...", "language": "fr", "segments": [{"start", "duration", "text"}, ...]}
+
+Le hash est vérifié sur les octets décompressés; les questions suivantes
+n'envoient plus que `transcript_hash`. Un hash déjà connu est acquitté sans
+relire le corps. Un envoi n'est pas cru sur parole: voir ClientTranscripts.
+"""
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import ipaddress
+import json
+import math
+import os
+import re
+import tempfile
+import time
+import zlib
+
+from transcript_store import VIDEO_ID_PATTERN, TranscriptStore
+
+HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+MAX_COMPRESSED_BYTES = 5 * 1024 * 1024
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+MAX_SEGMENTS = 100_000
+MAX_SEGMENT_CHARS = 2_000
+MAX_TIMESTAMP = 7 * 24 * 3600  # Une semaine: au-delà, le fichier n'est pas une piste YouTube
+
+
+class TranscriptUploadError(ValueError):
+    """Transcript envoyé invalide (corps, hash ou segments); status: code HTTP à renvoyer"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def content_hash(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+def upload_origin(remote_addr: Optional[str]) -> str:
+    """
+    Origine réseau d'un envoi, seule base du quorum (un user_id se choisit librement)
+
+    IPv4: l'adresse; IPv6: le préfixe /64 (un client en obtient des milliers).
+    Seule une empreinte est stockée, pas l'adresse.
+
+    >>> upload_origin("2001:db8::1") == upload_origin("2001:db8::ffff"), upload_origin(None)
+    (True, 'unknown')
+    """
+    try:
+        address = ipaddress.ip_address(remote_addr or "")
+    except ValueError:
+        return "unknown"
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    if address.version == 6:
+        network = str(ipaddress.ip_network(f"{address}/64", strict=False))
+    else:
+        network = str(address)
+    return hashlib.sha256(network.encode("ascii")).hexdigest()[:16]
+
+
+def decode_upload_body(data: bytes, content_encoding: Optional[str] = None,
+                       max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Décompresse le corps (gzip ou deflate) en bornant la taille décompressée"""
+    if len(data) > MAX_COMPRESSED_BYTES:
+        raise TranscriptUploadError("Corps trop volumineux", 413)
+
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding == "identity":
+        raw = data
+    elif encoding in ("gzip", "deflate"):
+        # wbits 47: détection automatique des en-têtes gzip/zlib
+        decompressor = zlib.decompressobj(47 if encoding == "gzip" else 15)
+        try:
+            raw = decompressor.decompress(data, max_bytes + 1)
+        except zlib.error as e:
+            raise TranscriptUploadError(f"Corps compressé illisible: {e}")
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            if len(raw) > max_bytes:
+                raise TranscriptUploadError("Transcript décompressé trop volumineux", 413)
+            raise TranscriptUploadError("Corps compressé tronqué")
+    else:
+        raise TranscriptUploadError(f"Content-Encoding non supporté: {encoding}", 415)
+
+    if len(raw) > max_bytes:
+        raise TranscriptUploadError("Transcript décompressé trop volumineux", 413)
+    return raw
+
+
+def parse_upload(raw: bytes, video_id: str, declared_hash: Optional[str] = None) -> Tuple[str, List[Dict], Dict]:
+    """
+    Vérifie le hash et la structure d'un transcript envoyé
+
+    Returns:
+        (hash, segments bruts validés, métadonnées {'language'})
+    """
+    digest = content_hash(raw)
+    if declared_hash and declared_hash.lower() != digest:
+        raise TranscriptUploadError("Le hash ne correspond pas au contenu envoyé")
+
+    try:
+        payload = json.loads(raw.decode("utf-8"))
+    except (UnicodeDecodeError, ValueError) as e:
+        raise TranscriptUploadError(f"JSON invalide: {e}")
+
+    if not isinstance(payload, dict) or not isinstance(payload.get("segments"), list):
+        raise TranscriptUploadError("Format attendu: {\"video_id\", \"segments\": [...]}")
+    if payload.get("video_id") != video_id:
+        raise TranscriptUploadError("video_id du corps différent de celui de l'URL")
+
+    segments = payload["segments"]
+    if not segments:
+        raise TranscriptUploadError("Transcript vide")
+    if len(segments) > MAX_SEGMENTS:
+        raise TranscriptUploadError(f"Trop de segments ({len(segments)} > {MAX_SEGMENTS})", 413)
+
+    for index, segment in enumerate(segments):
+        if not isinstance(segment, dict):
+            raise TranscriptUploadError(f"Segment {index}: objet attendu")
+        text = segment.get("text")
+        if not isinstance(text, str) or len(text) > MAX_SEGMENT_CHARS:
+            raise TranscriptUploadError(f"Segment {index}: texte manquant ou trop long")
+        for field in ("start", "duration"):
+            value = segment.get(field)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) \
+                    or not math.isfinite(value) or not 0 <= value <= MAX_TIMESTAMP:
+                raise TranscriptUploadError(f"Segment {index}: {field} invalide")
+
+    language = payload.get("language")
+    metadata = {'language': language if isinstance(language, str) and len(language) <= 16 else None}
+    return digest, segments, metadata
+
+
+class TranscriptHashIndex:
+    """
+    Enregistrements par hash: video_id, utilisateurs et origines réseau qui l'ont envoyé, vérifié ou non
+
+    Un petit fichier JSON par hash, partagé par tous les workers qui utilisent
+    le même store; les écritures sont atomiques (fichier temporaire + rename).
+    Deux envois simultanés du même hash peuvent perdre un des deux uploaders:
+    le second sera simplement compté au prochain envoi.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, transcript_hash: str) -> str:
+        if not HASH_PATTERN.match(transcript_hash or ""):
+            raise ValueError(f"Hash de transcript invalide: {transcript_hash!r}")
+        return os.path.join(self.directory, transcript_hash + ".json")
+
+    def lookup(self, transcript_hash: str) -> Optional[Dict]:
+        """{'video_id', 'uploaders', 'origins', 'verified'} du hash (None si inconnu ou hash invalide)"""
+        try:
+            with open(self.path_for(transcript_hash), "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(record, dict) or not VIDEO_ID_PATTERN.match(str(record.get("video_id", ""))):
+            return None
+        return {'video_id': record["video_id"],
+                'uploaders': [str(u) for u in record.get("uploaders", [])],
+                'origins': [str(o) for o in record.get("origins", [])],
+                'verified': record.get("verified") is True}
+
+    def add_uploader(self, transcript_hash: str, video_id: str, uploader: str, origin: str) -> Dict:
+        record = self.lookup(transcript_hash)
+        if record is None or record['video_id'] != video_id:
+            record = {'video_id': video_id, 'uploaders': [], 'origins': [], 'verified': False}
+        changed = False
+        if uploader not in record['uploaders']:
+            record['uploaders'].append(uploader)
+            changed = True
+        if origin not in record['origins']:
+            record['origins'].append(origin)
+            changed = True
+        if changed:
+            self._write(transcript_hash, record)
+        return record
+
+    def mark_verified(self, transcript_hash: str, video_id: str) -> None:
+        """Le contenu du hash est celui du store partagé"""
+        record = self.lookup(transcript_hash) or {'video_id': video_id, 'uploaders': [], 'origins': []}
+        self._write(transcript_hash, dict(record, video_id=video_id, verified=True))
+
+    def forget(self, transcript_hash: str) -> None:
+        try:
+            os.unlink(self.path_for(transcript_hash))
+        except (OSError, ValueError):
+            pass
+
+    def _write(self, transcript_hash: str, record: Dict) -> None:
+        path = self.path_for(transcript_hash)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".hash.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(record, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+
+class ClientTranscripts:
+    """
+    Transcripts envoyés par les clients, en quarantaine jusqu'à confirmation
+
+    Un envoi n'entre jamais directement dans le store partagé: il est gardé
+    sous son hash et ne sert qu'aux utilisateurs qui l'ont envoyé. Il est
+    promu quand exactement le même contenu est arrivé depuis `quorum`
+    origines réseau distinctes (voir upload_origin: les user_id ne comptent
+    pas, un client en invente autant qu'il veut) et que le serveur ne peut
+    pas récupérer le transcript lui-même. Une copie promue est marquée (`<video_id>.client`) pour être
+    remplacée dès qu'une récupération côté serveur réussit.
+    """
+
+    def __init__(self, directory: str, quorum: int = 2, refetch_seconds: float = 3600.0):
+        self.directory = directory
+        self.quorum = max(1, quorum)
+        self.refetch_seconds = refetch_seconds
+        self.transcripts = TranscriptStore(directory)  # Fichiers .ytt nommés par hash
+        self.hashes = TranscriptHashIndex(os.path.join(directory, "hashes"))
+
+    @classmethod
+    def for_store(cls, store) -> "ClientTranscripts":
+        """
+        Quarantaine à côté du store (sous-dossier uploads/)
+
+        TRANSCRIPT_UPLOAD_QUORUM: origines réseau distinctes requises pour promouvoir un envoi (défaut 2)
+        TRANSCRIPT_CLIENT_REFETCH_SECONDS: délai entre deux tentatives de
+        récupération serveur pour une copie promue (défaut 3600)
+        """
+        return cls(os.path.join(store.directory, "uploads"),
+                   quorum=int(os.getenv("TRANSCRIPT_UPLOAD_QUORUM", "2")),
+                   refetch_seconds=float(os.getenv("TRANSCRIPT_CLIENT_REFETCH_SECONDS", "3600")))
+
+    def add(self, transcript_hash: str, video_id: str, segments: List[Dict], uploader: str,
+            origin: str) -> Dict:
+        """Garde l'envoi en quarantaine, compte son uploader et son origine; retourne l'enregistrement du hash"""
+        if not self.transcripts.exists(transcript_hash):
+            self.transcripts.save(transcript_hash, segments)
+        return self.hashes.add_uploader(transcript_hash, video_id, uploader, origin)
+
+    def load(self, transcript_hash: str, video_id: str, uploader: str):
+        """Transcript en quarantaine, uniquement pour un utilisateur qui l'a envoyé"""
+        record = self.hashes.lookup(transcript_hash)
+        if record is None or record['video_id'] != video_id or uploader not in record['uploaders']:
+            return None
+        return self.transcripts.load(transcript_hash)
+
+    def marker_path(self, video_id: str) -> str:
+        if not VIDEO_ID_PATTERN.match(video_id or ""):
+            raise ValueError(f"video_id invalide: {video_id!r}")
+        return os.path.join(self.directory, video_id + ".client")
+
+    def mark_promoted(self, video_id: str, transcript_hash: str) -> None:
+        with open(self.marker_path(video_id), "a", encoding="utf-8") as f:
+            f.write(transcript_hash + "\n")
+        self.hashes.mark_verified(transcript_hash, video_id)
+
+    def refetch_due(self, video_id: str) -> bool:
+        """Copie promue dont la dernière tentative de récupération serveur est assez ancienne"""
+        try:
+            return time.time() - os.stat(self.marker_path(video_id)).st_mtime >= self.refetch_seconds
+        except (OSError, ValueError):
+            return False
+
+    def postpone_refetch(self, video_id: str) -> None:
+        try:
+            os.utime(self.marker_path(video_id))
+        except OSError:
+            pass
+
+    def replace_promoted(self, video_id: str, same_content: bool) -> None:
+        """
+        Le serveur a récupéré le transcript: la copie client n'est plus utilisée
+
+        Si le contenu diffère, les hashes promus ne correspondent plus au store
+        et sont oubliés (le client devra renvoyer, sans effet sur le contexte partagé).
+        """
+        path = self.marker_path(video_id)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                promoted = [line.strip() for line in f if line.strip()]
+            os.unlink(path)
+        except OSError:
+            return
+        if not same_content:
+            for transcript_hash in promoted:
+                self.hashes.forget(transcript_hash)
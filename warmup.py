@@ -0,0 +1,187 @@
+# warmup.py - Préchauffage des caches au démarrage et signal de disponibilité (readiness)
+"""
+Un worker qui démarre répond tout de suite à /health (liveness), mais n'est
+annoncé prêt (/health/ready) qu'après le préchauffage:
+
+1. import du SDK OpenAI et création du client (différés à l'import de app.py)
+2. chargement des vidéos les plus récemment utilisées, lues depuis un
+   snapshot persisté par les workers précédents (mmap, cache partagé, index de recherche)
+
+L'indexation du reste du store se poursuit ensuite sans bloquer la disponibilité.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class WarmupSnapshot:
+    """Vidéos récemment utilisées (la plus récente en premier), persistées sur disque"""
+
+    def __init__(self, path: str, max_videos: int = 500, save_interval: float = 60.0):
+        self.path = path
+        self.max_videos = max_videos
+        self.save_interval = save_interval
+        self.videos = OrderedDict()  # video_id -> dernier accès (epoch)
+        self.lock = threading.Lock()
+        self.dirty = False
+        self._timer = None
+        self._local = threading.local()
+
+    def load(self) -> List[str]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            videos = [v for v in data.get("videos", []) if isinstance(v, str)]
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"⚠️ Snapshot de préchauffage illisible ({e}), ignoré")
+            return []
+
+        with self.lock:
+            for video_id in reversed(videos[:self.max_videos]):
+                self.videos.setdefault(video_id, 0.0)
+        return videos[:self.max_videos]
+
+    @contextmanager
+    def suspended(self):
+        """Le préchauffage lui-même ne doit pas réordonner les vidéos récentes"""
+        self._local.suspended = True
+        try:
+            yield
+        finally:
+            self._local.suspended = False
+
+    def touch(self, video_id: str, transcript=None) -> None:
+        """Listener de transcript: marque la vidéo comme récemment utilisée"""
+        if getattr(self._local, 'suspended', False):
+            return
+        with self.lock:
+            self.videos[video_id] = time.time()
+            self.videos.move_to_end(video_id)
+            while len(self.videos) > self.max_videos:
+                self.videos.popitem(last=False)
+            self.dirty = True
+
+    def save(self) -> None:
+        with self.lock:
+            if not self.dirty:
+                return
+            videos = list(reversed(self.videos))
+            self.dirty = False
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".warmup.", suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "saved_at": time.time(), "videos": videos}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ Snapshot de préchauffage non sauvegardé: {e}")
+
+    def start_autosave(self) -> None:
+        def run():
+            self.save()
+            self.start_autosave()
+
+        self._timer = threading.Timer(self.save_interval, run)
+        self._timer.daemon = True
+        self._timer.start()
+
+
+class StartupWarmup:
+    """Préchauffage en arrière-plan et état de disponibilité du worker"""
+
+    def __init__(self, processor, search_index=None, snapshot: Optional[WarmupSnapshot] = None,
+                 max_videos: int = 200, ready_timeout: float = 60.0):
+        self.processor = processor
+        self.search_index = search_index
+        self.snapshot = snapshot
+        self.max_videos = max_videos
+        self.ready_timeout = ready_timeout
+        self.started_at = time.monotonic()
+        self.ready_event = threading.Event()
+        self.status = {
+            'stage': 'pending',
+            'warmed_videos': 0,
+            'snapshot_videos': 0,
+            'indexed_store_videos': 0,
+            'ready_after_ms': None,
+            'errors': [],
+        }
+
+    @classmethod
+    def from_env(cls, processor, search_index=None) -> "StartupWarmup":
+        store = processor.transcript_processor.store
+        default_path = os.path.join(store.directory, "warmup_snapshot.json") if store else "warmup_snapshot.json"
+        snapshot = WarmupSnapshot(os.getenv("WARMUP_SNAPSHOT_PATH", default_path))
+        return cls(processor, search_index, snapshot,
+                   max_videos=int(os.getenv("WARMUP_MAX_VIDEOS", "200")),
+                   ready_timeout=float(os.getenv("WARMUP_READY_TIMEOUT", "60")))
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_event.is_set()
+
+    def start(self) -> None:
+        if self.snapshot is not None:
+            self.processor.transcript_processor.transcript_listeners.append(self.snapshot.touch)
+            self.snapshot.start_autosave()
+            atexit.register(self.snapshot.save)
+        threading.Thread(target=self.run, daemon=True, name="startup-warmup").start()
+
+    def run(self) -> None:
+        transcript_processor = self.processor.transcript_processor
+        deadline = self.started_at + self.ready_timeout
+
+        # 1. SDK OpenAI (import ~0.5s) et client HTTP
+        self.status['stage'] = 'llm_client'
+        try:
+            transcript_processor.client
+        except Exception as e:
+            self.status['errors'].append(f"llm_client: {e}")
+
+        # 2. Vidéos chaudes du snapshot, sans téléchargement (seulement celles du store)
+        self.status['stage'] = 'hot_transcripts'
+        videos = self.snapshot.load() if self.snapshot is not None else []
+        self.status['snapshot_videos'] = len(videos)
+        store = transcript_processor.store
+        for video_id in videos[:self.max_videos]:
+            if time.monotonic() >= deadline:
+                self.status['errors'].append("ready_timeout: préchauffage incomplet")
+                break
+            try:
+                if store is not None and store.exists(video_id):
+                    with self.snapshot.suspended() if self.snapshot is not None else nullcontext():
+                        transcript_processor.get_transcript(video_id)
+                    self.status['warmed_videos'] += 1
+            except Exception as e:
+                self.status['errors'].append(f"{video_id}: {e}")
+
+        self.mark_ready()
+
+        # 3. Reste du store dans l'index de recherche (hors chemin de disponibilité)
+        if self.search_index is not None and store is not None \
+                and os.getenv('SEARCH_INDEX_STORE_ON_START', '1') != '0':
+            self.status['stage'] = 'search_index'
+            try:
+                self.status['indexed_store_videos'] = self.search_index.index_store(store)
+            except Exception as e:
+                self.status['errors'].append(f"search_index: {e}")
+        self.status['stage'] = 'done'
+
+    def mark_ready(self) -> None:
+        elapsed_ms = round((time.monotonic() - self.started_at) * 1000, 1)
+        self.status['ready_after_ms'] = elapsed_ms
+        self.ready_event.set()
+        print(f"🟢 Worker prêt en {elapsed_ms:.0f} ms ({self.status['warmed_videos']} vidéos préchauffées)")
+
+    def snapshot_status(self) -> Dict:
+        return dict(self.status, ready=self.ready, errors=self.status['errors'][-10:])